@@ -15,6 +15,9 @@ class ApiConfig(AppConfig):
         """
         import os
         
+        # 註冊 signal handlers
+        import api.signals  # noqa: F401
+        
         # 避免在 runserver 的 reloader 進程中重複啟動
         # 只在主進程中啟動調度器
         if os.environ.get('RUN_MAIN') == 'true' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
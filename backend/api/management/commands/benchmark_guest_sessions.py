@@ -0,0 +1,103 @@
+"""
+Django 管理命令：比較訪客遊戲舊格式（整包 pickle dict）與新格式（hash + 精簡二進位 list）
+每局佔用的 Redis 記憶體
+使用方式: python manage.py benchmark_guest_sessions --sessions 200 --rounds 50
+"""
+import random
+import uuid
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from redis.exceptions import ResponseError
+
+from api.services import BreedCatalogService, ChoiceService, GuestGameSessionService, RedisService
+
+
+class Command(BaseCommand):
+    help = '比較訪客遊戲新舊儲存格式每局佔用的 Redis 記憶體'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=200, help='模擬的遊戲局數 (預設: 200)')
+        parser.add_argument('--rounds', type=int, default=50, help='每局回合數 (預設: 50)')
+
+    def handle(self, *args, **options):
+        catalog = BreedCatalogService.get_catalog()
+        if len(catalog) < 4:
+            raise CommandError('品種資料不足，請先執行 load_breeds')
+
+        client = RedisService.get_client()
+        rng = random.Random(0)
+        prefix = f'benchmark:{uuid.uuid4().hex[:8]}'
+        old_keys = []
+        new_ids = []
+
+        try:
+            for index in range(options['sessions']):
+                old_key = f'{prefix}:old:{index}'
+                new_id = f'{prefix}:{uuid.uuid4()}'
+                old_rounds = []
+                GuestGameSessionService.create_session(new_id)
+
+                for _ in range(options['rounds']):
+                    correct = rng.choice(catalog.entries)
+                    choices = ChoiceService.generate_choices(correct, rng=rng)
+                    selected_slug = rng.choice(choices)['slug']
+                    question_id = uuid.uuid4()
+                    is_correct = selected_slug == correct.slug
+                    old_rounds.append({
+                        'question_id': str(question_id),
+                        'selected_slug': selected_slug,
+                        'correct_slug': correct.slug,
+                        'is_correct': is_correct,
+                        'score': 1 if is_correct else 0,
+                        'choices': choices,
+                        'image_url': f'https://images.dog.ceo/breeds/{correct.slug}/n02088094_{rng.randint(1000, 9999)}.jpg',
+                    })
+                    GuestGameSessionService.append_round(new_id, question_id, selected_slug, correct.slug, is_correct, choices)
+
+                cache.set(old_key, {
+                    'started_at': str(timezone.now()),
+                    'score': sum(record['score'] for record in old_rounds),
+                    'rounds': 0,
+                    'round_records': old_rounds,
+                }, timeout=600)
+                old_keys.append(cache.make_key(old_key))
+                new_ids.append(new_id)
+
+            old_bytes = self.measure(client, old_keys)
+            new_bytes = self.measure(client, [
+                key for new_id in new_ids
+                for key in (GuestGameSessionService.session_key(new_id), GuestGameSessionService.rounds_key(new_id))
+            ])
+        finally:
+            if old_keys:
+                client.delete(*old_keys)
+            for new_id in new_ids:
+                GuestGameSessionService.delete_session(new_id)
+
+        sessions = options['sessions']
+        self.stdout.write(f'模擬 {sessions} 局，每局 {options["rounds"]} 回合')
+        self.stdout.write(f'舊格式: 平均每局 {old_bytes / sessions:,.0f} bytes')
+        self.stdout.write(f'新格式: 平均每局 {new_bytes / sessions:,.0f} bytes')
+        if old_bytes:
+            self.stdout.write(self.style.SUCCESS(f'節省 {(1 - new_bytes / old_bytes) * 100:.1f}%'))
+
+    def measure(self, client, keys: list) -> int:
+        # 優先用 MEMORY USAGE（含 Redis 內部結構開銷），不支援時退回計算原始資料長度
+        try:
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.memory_usage(key, samples=0)
+            return sum(usage or 0 for usage in pipe.execute())
+        except ResponseError:
+            total = 0
+            for key in keys:
+                key_type = client.type(key)
+                if key_type == b'string':
+                    total += client.strlen(key)
+                elif key_type == b'hash':
+                    total += sum(len(field) + len(value) for field, value in client.hgetall(key).items())
+                elif key_type == b'list':
+                    total += sum(len(entry) for entry in client.lrange(key, 0, -1))
+            return total
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Breed
+from api.services import DogAPIService, QuestionService
+
+
+class Command(BaseCommand):
+    help = '從 dog.ceo 批次取圖並寫入 Question 資料表'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=100,
+            help='隨機取圖數量 (預設: 100)'
+        )
+        parser.add_argument(
+            '--breed',
+            action='append',
+            default=[],
+            help='只匯入指定品種的所有圖片，可重複指定 (例如 --breed hound-afghan)'
+        )
+        parser.add_argument(
+            '--all-breeds',
+            action='store_true',
+            help='匯入資料庫中所有品種的所有圖片'
+        )
+
+    def handle(self, *args, **options):
+        slugs = options['breed']
+        if options['all_breeds']:
+            slugs = list(Breed.objects.values_list('slug', flat=True))
+
+        try:
+            if slugs:
+                total_created = 0
+                for slug in slugs:
+                    image_urls = DogAPIService.fetch_breed_images(slug)
+                    questions = QuestionService.bulk_ingest(image_urls)
+                    total_created += len(questions)
+                    self.stdout.write(f'✓ {slug:30} | 圖片: {len(image_urls):4} 張 | 題目: {len(questions):4} 題')
+            else:
+                image_urls = DogAPIService.fetch_random_images(options['count'])
+                questions = QuestionService.bulk_ingest(image_urls)
+                total_created = len(questions)
+                self.stdout.write(f'✓ 隨機圖片: {len(image_urls)} 張')
+        except Exception as e:
+            raise CommandError(f'匯入題目時發生錯誤: {str(e)}')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'\n處理完成！共寫入/確認 {total_created} 題')
+        )
@@ -3,6 +3,7 @@ import os
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from api.models import Breed
+from api.services import BreedCatalogService
 
 
 class Command(BaseCommand):
@@ -105,10 +106,14 @@ class Command(BaseCommand):
                         self.style.ERROR(f'✗ 處理品種資料時發生錯誤: {str(e)}')
                     )
 
+            # 通知所有 worker 重新載入品種快照
+            catalog_version = BreedCatalogService.bump_version()
+
             # 顯示總結
             self.stdout.write(
                 self.style.SUCCESS(f'\n處理完成！')
             )
+            self.stdout.write(f'品種快照版本: {catalog_version}')
             self.stdout.write(f'新增: {created_count} 筆')
             self.stdout.write(f'已存在: {updated_count} 筆') 
             if error_count > 0:
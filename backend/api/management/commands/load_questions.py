@@ -0,0 +1,98 @@
+import json
+import os
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from api.models import Question
+from api.services import DogAPIService, QuestionService, QuestionBankService
+
+
+class Command(BaseCommand):
+    help = '從本地題目清單檔載入題目到資料庫，並建立本地題庫索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            type=str,
+            default='question_bank.json',
+            help='JSON 檔案路徑 (預設: question_bank.json)'
+        )
+        parser.add_argument(
+            '--export',
+            action='store_true',
+            help='將資料庫中現有的題目匯出成題目清單檔，而不是載入'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='只從資料庫重建 Redis 本地題庫索引（含各品種索引）'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='重建索引時每批讀取的題目數 (預設: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            total = QuestionBankService.rebuild(chunk_size=options['chunk_size'])
+            if total is None:
+                raise CommandError('已有其他重建正在進行，請稍後再試')
+            self.stdout.write(self.style.SUCCESS(f'✓ 已重建本地題庫索引，共 {total} 題'))
+            return
+
+        # 取得 JSON 檔案路徑
+        json_file = options['file']
+        if not os.path.isabs(json_file):
+            # 如果不是絕對路徑，則相對於專案根目錄
+            json_file = os.path.join(settings.BASE_DIR, json_file)
+
+        if options['export']:
+            self.export_manifest(json_file)
+            return
+
+        # 檢查檔案是否存在
+        if not os.path.exists(json_file):
+            raise CommandError(f'檔案不存在: {json_file}')
+
+        try:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise CommandError(f'JSON 格式錯誤: {str(e)}')
+
+        questions_data = data.get('questions', [])
+        if not questions_data:
+            raise CommandError('JSON 檔案中找不到 "questions" 欄位')
+
+        # breed_slug 可省略，省略時從 dog.ceo 圖片網址解析
+        slug_by_url = {}
+        skipped_count = 0
+        for question_data in questions_data:
+            image_url = question_data.get('image_url')
+            if not image_url:
+                skipped_count += 1
+                continue
+            slug_by_url[image_url] = question_data.get('breed_slug') or DogAPIService.extract_slug_from_image_url(image_url)
+
+        questions = QuestionService.bulk_create_questions(slug_by_url)
+
+        self.stdout.write(self.style.SUCCESS(f'\n處理完成！'))
+        self.stdout.write(f'清單題目: {len(questions_data)} 筆')
+        self.stdout.write(f'已載入: {len(questions)} 筆')
+        if len(slug_by_url) - len(questions) + skipped_count > 0:
+            self.stdout.write(
+                self.style.WARNING(f'略過: {len(slug_by_url) - len(questions) + skipped_count} 筆（缺少網址或找不到品種）')
+            )
+        self.stdout.write(f'本地題庫大小: {QuestionBankService.size()} 題')
+
+    def export_manifest(self, json_file):
+        questions = [
+            {'image_url': image_url, 'breed_slug': breed_slug}
+            for image_url, breed_slug in Question.objects.order_by('created_at').values_list('image_url', 'breed_slug').iterator(chunk_size=2000)
+        ]
+
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump({'questions': questions}, f, ensure_ascii=False, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(f'✓ 已匯出 {len(questions)} 題到 {json_file}'))
@@ -0,0 +1,71 @@
+"""
+Django 管理命令：把 Redis Stream 中延後寫入的回合紀錄批次寫入資料庫
+可同時執行多個 process，各自以不同的 consumer 名稱加入同一個 consumer group
+使用方式: python manage.py process_round_records --consumer worker-1
+"""
+import os
+import signal
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.services import RoundRecordStreamService
+
+
+class Command(BaseCommand):
+    help = '批次寫入延後寫入（Redis Stream）的回合紀錄'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--consumer',
+            type=str,
+            default=f'{socket.gethostname()}-{os.getpid()}',
+            help='consumer 名稱（預設: 主機名稱-pid）'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.ROUND_RECORD_STREAM_BATCH_SIZE,
+            help=f'每批最多處理的事件數 (預設: {settings.ROUND_RECORD_STREAM_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='處理完目前所有事件後就結束'
+        )
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        RoundRecordStreamService.ensure_group()
+        self.stdout.write(self.style.SUCCESS(f'✓ consumer {options["consumer"]} 開始處理回合紀錄'))
+
+        total = 0
+        while self.running:
+            try:
+                processed = RoundRecordStreamService.process_batch(
+                    options['consumer'],
+                    count=options['batch_size'],
+                    block_ms=None if options['once'] else settings.ROUND_RECORD_STREAM_BLOCK_MS,
+                )
+            except Exception as e:
+                # 寫入失敗的事件不會 ACK，閒置一段時間後會被重新接手
+                self.stdout.write(self.style.ERROR(f'❌ 寫入失敗: {str(e)}'))
+                if options['once']:
+                    raise
+                time.sleep(1)
+                continue
+
+            total += processed
+            if options['once'] and processed == 0:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f'✓ 共寫入 {total} 筆事件'))
+
+    def stop(self, signum, frame):
+        # 處理完目前這一批再結束
+        self.running = False
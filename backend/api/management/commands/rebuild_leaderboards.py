@@ -0,0 +1,52 @@
+"""
+Django 管理命令：從已結束的 GameSession 分批重建 Redis 排行榜
+ZADD GT 只保留最高分，重複執行或與線上結算同時執行都不會讓分數變低
+使用方式: python manage.py rebuild_leaderboards --chunk-size 1000 [--reset]
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from api.models import GameSession
+from api.services import LeaderboardService, RedisService
+
+
+class Command(BaseCommand):
+    help = '從已結束的遊戲紀錄重建 Redis 排行榜'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='每批讀取的遊戲局數 (預設: 1000)'
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='先刪除現有的排行榜（例如要移除已刪除帳號的紀錄）'
+        )
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            deleted = LeaderboardService.clear()
+            self.stdout.write(f'已刪除 {deleted} 個排行榜 key')
+
+        queryset = GameSession.objects.filter(ended_at__isnull=False) \
+            .annotate(rounds=Count('round_records')).order_by('id')
+        last_id = 0
+        total = 0
+        while True:
+            sessions = list(queryset.filter(id__gt=last_id).values('id', 'user_id', 'score', 'rounds', 'ended_at')[:options['chunk_size']])
+            if not sessions:
+                break
+
+            pipe = RedisService.get_client().pipeline(transaction=False)
+            for session in sessions:
+                if LeaderboardService.record_game(session['user_id'], session['score'], session['rounds'], session['ended_at'], pipe=pipe):
+                    total += 1
+            pipe.execute()
+
+            last_id = sessions[-1]['id']
+            self.stdout.write(f'已處理到 GameSession #{last_id}')
+
+        self.stdout.write(self.style.SUCCESS(f'✓ 已寫入 {total} 局的分數'))
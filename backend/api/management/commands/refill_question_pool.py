@@ -0,0 +1,62 @@
+"""
+Django 管理命令：定期補充題目池
+APScheduler 只在 runserver 下啟動，以 gunicorn 部署時需另外執行這個 process
+使用方式: python manage.py refill_question_pool
+"""
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.tasks import refill_question_pool
+
+
+class Command(BaseCommand):
+    help = '定期補充題目池（Redis question_pool:ids）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=settings.QUESTION_POOL_REFILL_INTERVAL,
+            help=f'檢查間隔秒數 (預設: {settings.QUESTION_POOL_REFILL_INTERVAL})'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='只補充一次就結束'
+        )
+
+    def handle(self, *args, **options):
+        if not settings.QUESTION_POOL_ENABLED or settings.QUESTION_SOURCE != 'dog_api':
+            self.stdout.write(self.style.WARNING('⚠️  題目池未啟用（QUESTION_POOL_ENABLED / QUESTION_SOURCE），不需補充'))
+            return
+
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.stdout.write(self.style.SUCCESS(f'✓ 開始補充題目池，每 {options["interval"]} 秒檢查一次'))
+
+        total = 0
+        while self.running:
+            try:
+                total += refill_question_pool()
+            except Exception as e:
+                # 資料庫或 Redis 暫時不可用時等下一輪再試
+                self.stdout.write(self.style.ERROR(f'❌ 補充失敗: {str(e)}'))
+                if options['once']:
+                    raise
+
+            if options['once']:
+                break
+            # 分段等待，收到 SIGTERM 時能盡快結束
+            deadline = time.monotonic() + options['interval']
+            while self.running and time.monotonic() < deadline:
+                time.sleep(min(1, deadline - time.monotonic()))
+
+        self.stdout.write(self.style.SUCCESS(f'✓ 共補充 {total} 題'))
+
+    def stop(self, signum, frame):
+        self.running = False
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:51
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_passwordresettoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roundrecord',
+            name='choice_breed_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:51
+
+from django.db import migrations
+
+CHUNK_SIZE = 2000
+
+
+def backfill_choice_breed_ids(apps, schema_editor):
+    """
+    把 RoundRecordBreedChoice 的資料分批搬到 RoundRecord.choice_breed_ids
+    """
+    RoundRecord = apps.get_model('api', 'RoundRecord')
+    RoundRecordBreedChoice = apps.get_model('api', 'RoundRecordBreedChoice')
+    Breed = apps.get_model('api', 'Breed')
+    breed_id_by_slug = dict(Breed.objects.values_list('slug', 'id'))
+
+    last_id = 0
+    while True:
+        records = list(RoundRecord.objects.filter(id__gt=last_id).order_by('id').only('id')[:CHUNK_SIZE])
+        if not records:
+            break
+
+        breed_ids = {record.id: [] for record in records}
+        choices = RoundRecordBreedChoice.objects.filter(round_record_id__in=breed_ids).order_by('id') \
+            .values_list('round_record_id', 'breed_id', 'slug')
+        for round_record_id, breed_id, slug in choices:
+            # 品種被刪除時 breed_id 為 NULL，改用 slug 對回現有品種
+            breed_id = breed_id or breed_id_by_slug.get(slug)
+            if breed_id is not None:
+                breed_ids[round_record_id].append(breed_id)
+
+        for record in records:
+            record.choice_breed_ids = breed_ids[record.id]
+        RoundRecord.objects.bulk_update(records, ['choice_breed_ids'])
+        last_id = records[-1].id
+
+
+def restore_breed_choices(apps, schema_editor):
+    RoundRecord = apps.get_model('api', 'RoundRecord')
+    RoundRecordBreedChoice = apps.get_model('api', 'RoundRecordBreedChoice')
+    Breed = apps.get_model('api', 'Breed')
+    slug_by_breed_id = dict(Breed.objects.values_list('id', 'slug'))
+
+    last_id = 0
+    while True:
+        records = list(RoundRecord.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'choice_breed_ids')[:CHUNK_SIZE])
+        if not records:
+            break
+
+        RoundRecordBreedChoice.objects.bulk_create([
+            RoundRecordBreedChoice(round_record_id=round_record_id, breed_id=breed_id, slug=slug_by_breed_id[breed_id])
+            for round_record_id, breed_ids in records
+            for breed_id in breed_ids
+            if breed_id in slug_by_breed_id
+        ])
+        last_id = records[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_roundrecord_choice_breed_ids'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_choice_breed_ids, restore_breed_choices),
+    ]
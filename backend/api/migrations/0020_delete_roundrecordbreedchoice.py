@@ -0,0 +1,16 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:51
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_backfill_roundrecord_choice_breed_ids'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='RoundRecordBreedChoice',
+        ),
+    ]
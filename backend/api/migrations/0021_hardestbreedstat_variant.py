@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_delete_roundrecordbreedchoice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hardestbreedstat',
+            name='variant',
+            field=models.CharField(default='default', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='hardestbreedstat',
+            name='breed',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hardest_stats', to='api.breed'),
+        ),
+        migrations.AlterField(
+            model_name='hardestbreedstat',
+            name='rank',
+            field=models.IntegerField(),
+        ),
+        migrations.AddConstraint(
+            model_name='hardestbreedstat',
+            constraint=models.UniqueConstraint(fields=('variant', 'rank'), name='unique_hardest_breed_variant_rank'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:55
+
+from django.db import migrations, models
+
+
+def backfill_total_players(apps, schema_editor):
+    # 之後由 User 的 post_save / post_delete 維護，這裡只做一次初始計數
+    User = apps.get_model('auth', 'User')
+    GlobalStat = apps.get_model('api', 'GlobalStat')
+    global_stat, _ = GlobalStat.objects.get_or_create(id=1)
+    global_stat.total_players = User.objects.count()
+    global_stat.save(update_fields=['total_players'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_hardestbreedstat_variant'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='globalstat',
+            name='total_players',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_total_players, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_globalstat_total_players'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GlobalStatBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('bucket_start', models.DateTimeField()),
+                ('games', models.BigIntegerField(default=0)),
+                ('rounds', models.BigIntegerField(default=0)),
+                ('correct', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'bucket_start'), name='unique_global_stat_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BreedStatBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('bucket_start', models.DateTimeField()),
+                ('attempts', models.BigIntegerField(default=0)),
+                ('correct', models.BigIntegerField(default=0)),
+                ('breed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stat_buckets', to='api.breed')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'breed', 'bucket_start'), name='unique_breed_stat_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_stat_buckets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BreedConfusion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.BigIntegerField(default=0)),
+                ('breed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='confusions', to='api.breed')),
+                ('confused_with', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.breed')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('breed', 'confused_with'), name='unique_breed_confusion')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_breed_confusion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roundrecord',
+            name='stream_entry_id',
+            field=models.CharField(blank=True, max_length=40, null=True, unique=True),
+        ),
+    ]
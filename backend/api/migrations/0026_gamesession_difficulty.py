@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_roundrecord_stream_entry_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='difficulty',
+            field=models.CharField(blank=True, max_length=10, null=True),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.contrib.auth.models import User
+from django.contrib.postgres.fields import ArrayField
 from django.db import models
 from django.utils import timezone
 from datetime import timedelta
@@ -48,6 +49,8 @@ class GameSession(models.Model):
     started_at = models.DateTimeField(auto_now_add=True)
     ended_at = models.DateTimeField(null=True, blank=True)
     avg_accuracy = models.FloatField(default=0.0)
+    # 開局時選的難度模式（easy/hard/mixed），None 為完全隨機出題
+    difficulty = models.CharField(max_length=10, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -59,28 +62,76 @@ class RoundRecord(models.Model):
     correct_slug = models.CharField(max_length=100)
     is_correct = models.BooleanField()
     score = models.IntegerField(default=0)
+    # 選項的品種 id（依顯示順序）
+    choice_breed_ids = ArrayField(models.IntegerField(), default=list)
+    # 延後寫入時對應的 Redis Stream 事件 id，重新接手的事件靠它避免重複寫入
+    stream_entry_id = models.CharField(max_length=40, null=True, blank=True, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
 
-class RoundRecordBreedChoice(models.Model):
-    round_record = models.ForeignKey(RoundRecord, on_delete=models.CASCADE, related_name='choices')
-    breed = models.ForeignKey(Breed, on_delete=models.SET_NULL, null=True, blank=True)
-    slug = models.CharField(max_length=100)
-    
-
 class GlobalStat(models.Model):
     total_games = models.BigIntegerField(default=0)
     total_correct = models.BigIntegerField(default=0)
     total_rounds = models.BigIntegerField(default=0)
+    total_players = models.BigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     
 
+class GlobalStatBucket(models.Model):
+    HOUR = 'hour'
+    DAY = 'day'
+    GRANULARITY_CHOICES = [(HOUR, 'Hour'), (DAY, 'Day')]
+    
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+    games = models.BigIntegerField(default=0)
+    rounds = models.BigIntegerField(default=0)
+    correct = models.BigIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['granularity', 'bucket_start'], name='unique_global_stat_bucket'),
+        ]
+
+
+class BreedStatBucket(models.Model):
+    granularity = models.CharField(max_length=10, choices=GlobalStatBucket.GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+    breed = models.ForeignKey(Breed, on_delete=models.CASCADE, related_name='stat_buckets')
+    attempts = models.BigIntegerField(default=0)
+    correct = models.BigIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['granularity', 'breed', 'bucket_start'], name='unique_breed_stat_bucket'),
+        ]
+
+
 class HardestBreedStat(models.Model):
-    rank = models.IntegerField(unique=True)
-    breed = models.OneToOneField(Breed, on_delete=models.CASCADE, related_name='hardest_stat')
+    # 同一次計算可產生多種排行（例如不同最低作答數、只含有中文名稱的品種）
+    variant = models.CharField(max_length=50, default='default')
+    rank = models.IntegerField()
+    breed = models.ForeignKey(Breed, on_delete=models.CASCADE, related_name='hardest_stats')
     correct_rate = models.FloatField()
     created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['variant', 'rank'], name='unique_hardest_breed_variant_rank'),
+        ]
+
+
+class BreedConfusion(models.Model):
+    # 正確答案是 breed 時，玩家選成 confused_with 的累計次數
+    breed = models.ForeignKey(Breed, on_delete=models.CASCADE, related_name='confusions')
+    confused_with = models.ForeignKey(Breed, on_delete=models.CASCADE, related_name='+')
+    count = models.BigIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['breed', 'confused_with'], name='unique_breed_confusion'),
+        ]
 
 
 class PasswordResetToken(models.Model):
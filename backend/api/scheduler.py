@@ -25,7 +25,7 @@ def start_scheduler():
         return
     
     # 導入任務函數
-    from api.tasks import sync_redis_data_to_db
+    from api.tasks import sync_redis_data_to_db, refill_question_pool
     
     # 註冊任務：每 30 分鐘執行一次
     scheduler.add_job(
@@ -37,6 +37,18 @@ def start_scheduler():
         max_instances=1,  # 確保同一時間只有一個實例在運行
     )
     
+    # 註冊任務：定期補充題目池
+    if settings.QUESTION_POOL_ENABLED and settings.QUESTION_SOURCE == 'dog_api':
+        scheduler.add_job(
+            refill_question_pool,
+            trigger=IntervalTrigger(seconds=settings.QUESTION_POOL_REFILL_INTERVAL),
+            id='refill_question_pool',
+            name='補充題目池',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
+    
     # 啟動調度器
     scheduler.start()
     logger.info("✅ APScheduler 調度器已啟動")
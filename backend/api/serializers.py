@@ -1,7 +1,8 @@
 from rest_framework import serializers
 from django.db import models
 from django.contrib.auth.models import User
-from .models import Breed, Question, RoundRecord, GameSession, PlayerInfo, RoundRecordBreedChoice, HardestBreedStat
+from .models import Breed, Question, RoundRecord, GameSession, PlayerInfo, HardestBreedStat, GlobalStatBucket
+from .services import BreedCatalogService, DifficultyService, LeaderboardService
 
 
 class BreedSerializer(serializers.ModelSerializer):
@@ -38,52 +39,55 @@ class BreedSerializer(serializers.ModelSerializer):
 
 class QuestionInputSerializer(serializers.Serializer):
     game_session_id = serializers.CharField()
+    difficulty = serializers.ChoiceField(choices=DifficultyService.MODES, required=False)
     
     
 class QuestionSerializer(serializers.ModelSerializer):
     current_round = serializers.SerializerMethodField()
     choices = serializers.SerializerMethodField()
+    token = serializers.SerializerMethodField()
     
     class Meta:
         model = Question
-        fields = ['id', 'image_url', 'current_round', 'choices', 'created_at', 'updated_at']
+        fields = ['id', 'image_url', 'current_round', 'choices', 'token', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
         
     def get_current_round(self, obj: Question):
         return self.context.get('current_round', 1)
+    
+    def get_token(self, obj: Question):
+        return self.context.get('token')
 
     def get_choices(self, obj: RoundRecord):
         return self.context.get('choices', [])
 
 
-class RoundRecordBreedChoiceSerializer(serializers.ModelSerializer):
-    name = serializers.SerializerMethodField()
-    
-    class Meta:
-        model = RoundRecordBreedChoice
-        fields = ['slug', 'name']
-        
-    def get_name(self, obj: RoundRecordBreedChoice):
-        request = self.context.get('request')
-        lang = request.GET.get('lang') if request else None
-        if lang == 'zh':
-            return obj.breed.name_zh
-        return obj.breed.name_en
-    
-    
 class RoundRecordSerializer(serializers.ModelSerializer):
     image_url = serializers.CharField(source='question.image_url')
-    choices = RoundRecordBreedChoiceSerializer(many=True, read_only=True)
+    choices = serializers.SerializerMethodField()
     
     class Meta:
         model = RoundRecord
         fields = ['image_url', 'choices', 'selected_slug', 'correct_slug', 'is_correct', 'score']
+    
+    def get_choices(self, obj: RoundRecord):
+        # 品種名稱由記憶體中的品種快照取得，不必逐筆查資料庫
+        request = self.context.get('request')
+        lang = request.GET.get('lang') if request else None
+        catalog = BreedCatalogService.get_catalog()
+        choices = []
+        for breed_id in obj.choice_breed_ids:
+            breed = catalog.get_by_id(breed_id)
+            if breed is not None:
+                choices.append({'slug': breed.slug, 'name': breed.name(lang)})
+        return choices
         
         
 class AnswerInputSerializer(serializers.Serializer):
     game_session_id = serializers.CharField()
     question_id = serializers.UUIDField()
     selected_slug = serializers.CharField(max_length=100)
+    token = serializers.CharField(required=False)
     
     
 class AnswerSerializer(serializers.Serializer):
@@ -97,6 +101,7 @@ class StartGameSerializer(serializers.Serializer):
     is_guest = serializers.BooleanField(required=False, default=False)
     game_session_id = serializers.CharField()
     total_rounds = serializers.IntegerField()
+    difficulty = serializers.CharField(allow_null=True, required=False)
 
 
 class EndGameInputSerializer(serializers.Serializer):
@@ -106,13 +111,18 @@ class EndGameInputSerializer(serializers.Serializer):
 class EndGameSerializer(serializers.ModelSerializer):
     round_records = RoundRecordSerializer(many=True)
     rounds = serializers.SerializerMethodField()
+    percentile = serializers.SerializerMethodField()
     
     class Meta:
         model = GameSession
-        fields = ['id', 'user', 'score', 'started_at', 'ended_at', 'round_records', 'rounds', 'score']
+        fields = ['id', 'user', 'score', 'started_at', 'ended_at', 'round_records', 'rounds', 'score', 'percentile']
 
     def get_rounds(self, obj: GameSession):
-        return obj.round_records.count()
+        return len(obj.round_records.all())
+
+    def get_percentile(self, obj: GameSession):
+        # 由 EndGameView 從分數分布算好傳入，序列化時不再查詢
+        return self.context.get('percentile')
 
 
 class GameSessionSerializer(serializers.ModelSerializer):
@@ -200,7 +210,7 @@ class HardestBreedsSerializer(serializers.Serializer):
     
     def get_name(self, obj: HardestBreedStat):
         request = self.context.get('request')
-        lang = request.GET.get('lang') if request else None
+        lang = self.context.get('lang') or (request.GET.get('lang') if request else None)
         if lang == 'zh':
             return obj.breed.name_zh
         return obj.breed.name_en
@@ -211,4 +221,21 @@ class GlobalStatsSerializer(serializers.Serializer):
     total_rounds = serializers.IntegerField()
     total_players = serializers.IntegerField()
     avg_accuracy = serializers.FloatField()
-    hardest_breeds = HardestBreedsSerializer(many=True)
\ No newline at end of file
+    hardest_breeds = HardestBreedsSerializer(many=True)
+
+class StatsTrendsInputSerializer(serializers.Serializer):
+    granularity = serializers.ChoiceField(choices=GlobalStatBucket.GRANULARITY_CHOICES, default=GlobalStatBucket.DAY)
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+    breed = serializers.CharField(required=False)
+
+    def validate(self, attrs):
+        if attrs['end'] <= attrs['start']:
+            raise serializers.ValidationError('end must be later than start.')
+        return attrs
+
+
+class LeaderboardInputSerializer(serializers.Serializer):
+    period = serializers.ChoiceField(choices=LeaderboardService.PERIODS, default=LeaderboardService.ALL)
+    rounds = serializers.IntegerField(required=False, min_value=1, max_value=50)
+    limit = serializers.IntegerField(default=10, min_value=1, max_value=100)
@@ -1,7 +1,22 @@
 from .dog import DogAPIService
 from .question import QuestionService
+from .question_pool import QuestionPoolService
+from .question_bank import QuestionBankService
+from .question_token import QuestionTokenService
 from .redis import RedisService
+from .counter import CounterService
+from .global_stats import GlobalStatsService
+from .stat_rollup import StatRollupService
+from .breed_confusion import BreedConfusionService
+from .leaderboard import LeaderboardService
+from .score_distribution import ScoreDistributionService
 from .round_record import RoundRecordService
+from .round_record_stream import RoundRecordStreamService
+from .round_codec import RoundCodec
 from .game_session import GameSessionService, GuestGameSessionService
+from .game_deck import GameDeckService
 from .breed import BreedService
+from .breed_catalog import BreedCatalogService
+from .choice import ChoiceService
+from .difficulty import DifficultyService
 from .player import PlayerService
\ No newline at end of file
@@ -1,12 +1,19 @@
-from api.models import Breed
+from .breed_catalog import BreedCatalogService, BreedEntry
 
 
 class BreedService:
     @classmethod
-    def get_breed_by_slug(cls, slug: str) -> Breed:
-        try:
-            breed = Breed.objects.get(slug=slug)
-        except Breed.DoesNotExist:
+    def get_breed_by_slug(cls, slug: str) -> BreedEntry:
+        breed = BreedCatalogService.get_catalog().get_by_slug(slug)
+        if breed is None:
             raise ValueError(f'Breed with slug "{slug}" not found.')
         
-        return breed
\ No newline at end of file
+        return breed
+    
+    @classmethod
+    def get_breed_by_id(cls, breed_id: int) -> BreedEntry:
+        breed = BreedCatalogService.get_catalog().get_by_id(breed_id)
+        if breed is None:
+            raise ValueError(f'Breed with ID "{breed_id}" not found.')
+        
+        return breed
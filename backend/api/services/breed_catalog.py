@@ -0,0 +1,106 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.conf import settings
+
+from api.models import Breed
+from .redis import RedisService
+
+
+@dataclass(frozen=True)
+class BreedEntry:
+    index: int
+    id: int
+    slug: str
+    name_en: str
+    name_zh: str | None
+    origin_en: str | None
+    origin_zh: str | None
+    introduction_en: str | None
+    introduction_zh: str | None
+    created_at: datetime
+    updated_at: datetime
+
+    def name(self, lang: str = 'en') -> str:
+        return self.name_zh if lang == 'zh' else self.name_en
+
+
+class BreedCatalog:
+    """
+    品種資料的唯讀快照，以連續索引（index）存放，可用 slug 或 id 查詢
+    """
+    def __init__(self, entries: list[BreedEntry], version: int):
+        self.version = version
+        self.entries = tuple(entries)
+        self.ids = tuple(entry.id for entry in self.entries)
+        self.slugs = tuple(entry.slug for entry in self.entries)
+        self._index_by_slug = {entry.slug: entry.index for entry in self.entries}
+        self._index_by_id = {entry.id: entry.index for entry in self.entries}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_by_slug(self, slug: str) -> BreedEntry | None:
+        index = self._index_by_slug.get(slug)
+        return self.entries[index] if index is not None else None
+
+    def get_by_id(self, breed_id: int) -> BreedEntry | None:
+        index = self._index_by_id.get(breed_id)
+        return self.entries[index] if index is not None else None
+
+    def sample_indexes(self, k: int, exclude_index: int, rng: random.Random = None) -> list[int]:
+        """
+        從排除 exclude_index 後的 n-1 個索引中不重複抽 k 個（Floyd 演算法，O(k)）
+        """
+        rng = rng or random
+        n = len(self.entries) - 1
+        k = min(k, n)
+        selected = set()
+        for upper in range(n - k, n):
+            candidate = rng.randint(0, upper)
+            selected.add(candidate if candidate not in selected else upper)
+        # 把 [0, n-1) 的位置映射回略過 exclude_index 的實際索引
+        return [index + 1 if index >= exclude_index else index for index in selected]
+
+
+class BreedCatalogService:
+    """
+    每個 process 載入一次品種快照；版本號存在 Redis，load_breeds 更新版本後
+    各 worker 在下次檢查（最多 BREED_CATALOG_CHECK_INTERVAL 秒）時重新載入
+    """
+    VERSION_KEY = 'breed_catalog:version'
+
+    _catalog = None
+    _checked_at = 0.0
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_catalog(cls) -> BreedCatalog:
+        catalog = cls._catalog
+        if catalog is not None and time.monotonic() - cls._checked_at < settings.BREED_CATALOG_CHECK_INTERVAL:
+            return catalog
+
+        with cls._lock:
+            version = int(RedisService.get_client().get(cls.VERSION_KEY) or 0)
+            if cls._catalog is None or cls._catalog.version != version:
+                cls._catalog = cls._load(version)
+            cls._checked_at = time.monotonic()
+            return cls._catalog
+
+    @classmethod
+    def bump_version(cls) -> int:
+        version = RedisService.get_client().incr(cls.VERSION_KEY)
+        cls._catalog = None
+        return version
+
+    @classmethod
+    def _load(cls, version: int) -> BreedCatalog:
+        breeds = Breed.objects.order_by('id').values(
+            'id', 'slug', 'name_en', 'name_zh', 'origin_en', 'origin_zh',
+            'introduction_en', 'introduction_zh', 'created_at', 'updated_at'
+        )
+        entries = [BreedEntry(index=index, **breed) for index, breed in enumerate(breeds)]
+        return BreedCatalog(entries, version)
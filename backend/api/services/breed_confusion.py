@@ -0,0 +1,107 @@
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+
+from api.models import BreedConfusion
+from .breed_catalog import BreedCatalogService
+from .counter import CounterService
+from .redis import RedisService
+from .stat_rollup import StatRollupService
+
+
+class BreedConfusionService:
+    """
+    品種混淆矩陣：答錯時把 (正確品種, 選到的品種) 累加到 Redis hash，
+    定時同步任務取出後累加到 BreedConfusion，並重算受影響品種的前 N 名存回 Redis，
+    查詢時只需一次 HGET
+    """
+    PENDING_KEY = 'breed_confusion:pending'
+    TOP_KEY = 'breed_confusion:top'
+    SEPARATOR = '|'
+
+    @classmethod
+    def record(cls, correct_slug: str, selected_slug: str):
+        if not selected_slug or selected_slug == correct_slug:
+            return
+        CounterService.hincr_many(cls.PENDING_KEY, {f'{correct_slug}{cls.SEPARATOR}{selected_slug}': 1})
+
+    @classmethod
+    def sync(cls) -> int:
+        """
+        取出累積的混淆次數寫入資料庫，回傳寫入的品種組合數
+        """
+        drained = CounterService.drain_hashes([cls.PENDING_KEY])
+        if not drained:
+            return 0
+
+        catalog = BreedCatalogService.get_catalog()
+        rows = []
+        for field, amount in drained[cls.PENDING_KEY].items():
+            correct_slug, _, selected_slug = field.partition(cls.SEPARATOR)
+            breed, confused_with = catalog.get_by_slug(correct_slug), catalog.get_by_slug(selected_slug)
+            # 選項可能是已刪除或不存在的品種，直接略過
+            if breed is None or confused_with is None or breed.id == confused_with.id:
+                continue
+            rows.append((breed.id, confused_with.id, amount))
+
+        try:
+            with transaction.atomic():
+                StatRollupService.upsert_add(BreedConfusion, ['breed', 'confused_with'], ['count'], rows)
+        except Exception:
+            CounterService.restore_hashes(drained)
+            raise
+
+        cls.rebuild_top({breed_id for breed_id, _, _ in rows})
+        return len(rows)
+
+    @classmethod
+    def rebuild_top(cls, breed_ids: set[int] = None) -> dict[str, list[dict]]:
+        """
+        以一次查詢（window function）算出各品種最常被誤認成的前 N 名，寫入 Redis hash；
+        breed_ids 為 None 時重算全部品種
+        """
+        queryset = BreedConfusion.objects.all()
+        if breed_ids is not None:
+            if not breed_ids:
+                return {}
+            queryset = queryset.filter(breed_id__in=breed_ids)
+        rows = queryset.annotate(
+            position=Window(RowNumber(), partition_by=[F('breed_id')],
+                            order_by=[F('count').desc(), F('confused_with_id').asc()]),
+            misses=Window(Sum('count'), partition_by=[F('breed_id')]),
+        ).filter(position__lte=settings.BREED_CONFUSION_TOP_N).order_by('breed_id', 'position') \
+            .values('breed_id', 'confused_with_id', 'count', 'misses')
+
+        catalog = BreedCatalogService.get_catalog()
+        top = {}
+        for row in rows:
+            breed, confused_with = catalog.get_by_id(row['breed_id']), catalog.get_by_id(row['confused_with_id'])
+            if breed is None or confused_with is None:
+                continue
+            top.setdefault(breed.slug, []).append({
+                'slug': confused_with.slug,
+                'count': row['count'],
+                'share': round(row['count'] / row['misses'] * 100, 2),
+            })
+
+        pipe = RedisService.get_client().pipeline(transaction=True)
+        if breed_ids is None:
+            pipe.delete(cls.TOP_KEY)
+        if top:
+            pipe.hset(cls.TOP_KEY, mapping={slug: json.dumps(confusions) for slug, confusions in top.items()})
+        pipe.execute()
+        return top
+
+    @classmethod
+    def get_top(cls, slug: str) -> list[dict]:
+        pipe = RedisService.get_client().pipeline(transaction=False)
+        pipe.exists(cls.TOP_KEY)
+        pipe.hget(cls.TOP_KEY, slug)
+        exists, confusions = pipe.execute()
+        if not exists:
+            # Redis 被清空時從資料庫重建一次
+            return cls.rebuild_top().get(slug, [])
+        return json.loads(confusions) if confusions else []
@@ -0,0 +1,25 @@
+import random
+
+from .breed_catalog import BreedCatalogService, BreedEntry
+
+
+class ChoiceService:
+    """
+    在記憶體中的品種快照上抽干擾選項，不查資料庫；
+    傳入 seed 或 rng 可得到可重現的結果（測試、壓測用）
+    """
+    @classmethod
+    def make_rng(cls, seed=None) -> random.Random:
+        return random.Random(seed)
+    
+    @classmethod
+    def generate_choices(cls, correct_breed: BreedEntry, num_choices: int = 3, lang='en', rng: random.Random = None) -> list[dict]:
+        rng = rng or random
+        catalog = BreedCatalogService.get_catalog()
+        indexes = catalog.sample_indexes(num_choices, exclude_index=correct_breed.index, rng=rng)
+        
+        choices = [{'slug': catalog.entries[index].slug, 'name': catalog.entries[index].name(lang)} for index in sorted(indexes)]
+        choices.append({'slug': correct_breed.slug, 'name': correct_breed.name(lang)})
+        rng.shuffle(choices)
+        
+        return choices
@@ -0,0 +1,218 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .redis import RedisService
+
+logger = logging.getLogger(__name__)
+
+
+class CounterService:
+    """
+    各 worker 先在記憶體中累加計數，每 COUNTER_FLUSH_INTERVAL_MS 毫秒或累積
+    COUNTER_FLUSH_MAX_INCREMENTS 次後，以一次 pipeline 的 INCRBY 寫入 Redis。
+    key 與 RedisService.incr 相同（cache key），定時同步任務照常讀取。
+    hincr_many 則累加 Redis hash 的欄位（原始 key，不經 cache 前綴），用於分時段的統計。
+    寫入失敗的計數會留到下次再送，但累積超過 COUNTER_MAX_PENDING_KEYS 個 key 時直接丟棄該批，
+    Redis 長時間無法使用時記憶體才不會無限增長
+    """
+    # hash 計數器若一直沒被同步取走，最多保留這麼久
+    HASH_KEY_TTL = 7 * 24 * 3600
+
+    _pending = defaultdict(int)
+    _pending_increments = 0
+    _persistent_hash_keys = set()
+    _last_flush = time.monotonic()
+    _flushes = 0
+    _flushed_increments = 0
+    _failures = 0
+    _dropped_increments = 0
+    _lock = threading.Lock()
+    _owner_pid = None
+
+    @classmethod
+    def incr(cls, key: str, amount: int = 1):
+        cls.incr_many({key: amount})
+
+    @classmethod
+    def incr_many(cls, amounts: dict[str, int]):
+        cls._add({key: amount for key, amount in amounts.items() if amount})
+
+    @classmethod
+    def hincr_many(cls, key: str, amounts: dict[str, int], ttl: int | None = HASH_KEY_TTL):
+        # ttl 為 None 表示不過期（例如長期累積的分數分布）
+        if ttl is None:
+            cls._persistent_hash_keys.add(key)
+        cls._add({(key, field): amount for field, amount in amounts.items() if amount})
+
+    @classmethod
+    def _add(cls, amounts: dict):
+        if not amounts:
+            return
+        cls._ensure_flusher()
+        with cls._lock:
+            for key, amount in amounts.items():
+                cls._pending[key] += amount
+            cls._pending_increments += len(amounts)
+            due = (cls._pending_increments >= settings.COUNTER_FLUSH_MAX_INCREMENTS
+                   or (time.monotonic() - cls._last_flush) * 1000 >= settings.COUNTER_FLUSH_INTERVAL_MS)
+        if due:
+            cls.flush()
+
+    @classmethod
+    def flush(cls) -> int:
+        with cls._lock:
+            pending = {key: amount for key, amount in cls._pending.items() if amount}
+            increments = cls._pending_increments
+            cls._pending = defaultdict(int)
+            cls._pending_increments = 0
+            cls._last_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        try:
+            pipe = RedisService.get_client().pipeline(transaction=False)
+            hash_keys = set()
+            for key, amount in pending.items():
+                if isinstance(key, tuple):
+                    pipe.hincrby(key[0], key[1], amount)
+                    hash_keys.add(key[0])
+                else:
+                    pipe.incrby(cache.make_key(key), amount)
+            for hash_key in hash_keys - cls._persistent_hash_keys:
+                pipe.expire(hash_key, cls.HASH_KEY_TTL)
+            pipe.execute()
+        except Exception as e:
+            # 寫入失敗時把計數放回去，下次再送
+            with cls._lock:
+                cls._failures += 1
+                if len(cls._pending.keys() | pending.keys()) > settings.COUNTER_MAX_PENDING_KEYS:
+                    cls._dropped_increments += increments
+                    dropped = True
+                else:
+                    for key, amount in pending.items():
+                        cls._pending[key] += amount
+                    cls._pending_increments += increments
+                    dropped = False
+            if dropped:
+                logger.error(f"計數器寫入 Redis 失敗，待送計數已超過 {settings.COUNTER_MAX_PENDING_KEYS} 個 key，"
+                             f"丟棄 {len(pending)} 個 key 的計數: {str(e)}")
+            else:
+                logger.error(f"計數器寫入 Redis 失敗: {str(e)}")
+            return 0
+
+        with cls._lock:
+            cls._flushes += 1
+            cls._flushed_increments += increments
+        return len(pending)
+
+    # 一次讀取並刪除多個計數器，讀與刪之間不會漏掉其他 worker 的 INCRBY
+    DRAIN_SCRIPT = """
+    local values = {}
+    for i, key in ipairs(KEYS) do
+        values[i] = redis.call('GET', key) or false
+        redis.call('DEL', key)
+    end
+    return values
+    """
+
+    @classmethod
+    def drain(cls, keys: list[str]) -> dict[str, int]:
+        """
+        原子地取出並清空 Redis 中的計數器，回傳非零的值
+        """
+        if not keys:
+            return {}
+        values = RedisService.get_client().eval(cls.DRAIN_SCRIPT, len(keys), *[cache.make_key(key) for key in keys])
+        return {key: int(value) for key, value in zip(keys, values) if value is not None and int(value)}
+
+    DRAIN_HASHES_SCRIPT = """
+    local values = {}
+    for i, key in ipairs(KEYS) do
+        values[i] = redis.call('HGETALL', key)
+        redis.call('DEL', key)
+    end
+    return values
+    """
+
+    @classmethod
+    def drain_hashes(cls, keys: list[str]) -> dict[str, dict[str, int]]:
+        """
+        原子地取出並刪除多個 hash 計數器，回傳有資料的 {key: {field: value}}
+        """
+        if not keys:
+            return {}
+        values = RedisService.get_client().eval(cls.DRAIN_HASHES_SCRIPT, len(keys), *keys)
+        drained = {}
+        for key, flat in zip(keys, values):
+            fields = {flat[index].decode(): int(flat[index + 1]) for index in range(0, len(flat), 2)}
+            if fields:
+                drained[key] = fields
+        return drained
+
+    @classmethod
+    def restore_hashes(cls, drained: dict[str, dict[str, int]]):
+        if not drained:
+            return
+        pipe = RedisService.get_client().pipeline(transaction=False)
+        for key, fields in drained.items():
+            for field, amount in fields.items():
+                pipe.hincrby(key, field, amount)
+            pipe.expire(key, cls.HASH_KEY_TTL)
+        pipe.execute()
+
+    @classmethod
+    def restore(cls, amounts: dict[str, int]):
+        """
+        drain 之後寫入資料庫失敗時，把取出的值加回 Redis
+        """
+        if not amounts:
+            return
+        pipe = RedisService.get_client().pipeline(transaction=False)
+        for key, amount in amounts.items():
+            pipe.incrby(cache.make_key(key), amount)
+        pipe.execute()
+
+    @classmethod
+    def stats(cls) -> dict:
+        with cls._lock:
+            return {
+                'pid': os.getpid(),
+                'pending_keys': len(cls._pending),
+                'pending_delta': sum(cls._pending.values()),
+                'pending_increments': cls._pending_increments,
+                'flushes': cls._flushes,
+                'flushed_increments': cls._flushed_increments,
+                'failures': cls._failures,
+                'dropped_increments': cls._dropped_increments,
+                'last_flush_ms_ago': round((time.monotonic() - cls._last_flush) * 1000),
+            }
+
+    @classmethod
+    def _ensure_flusher(cls):
+        # 每個 process（gunicorn fork 出的 worker）各自啟動一個定時 flush 的執行緒
+        if cls._owner_pid == os.getpid():
+            return
+        with cls._lock:
+            if cls._owner_pid == os.getpid():
+                return
+            cls._owner_pid = os.getpid()
+            cls._pending = defaultdict(int)
+            cls._pending_increments = 0
+        threading.Thread(target=cls._flush_loop, name='counter-flusher', daemon=True).start()
+        atexit.register(cls.flush)
+
+    @classmethod
+    def _flush_loop(cls):
+        while True:
+            time.sleep(settings.COUNTER_FLUSH_INTERVAL_MS / 1000)
+            try:
+                cls.flush()
+            except Exception as e:
+                logger.error(f"計數器定時寫入失敗: {str(e)}")
@@ -0,0 +1,138 @@
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import models
+
+from api.models import Breed
+from .redis import RedisService
+
+logger = logging.getLogger(__name__)
+
+
+class AliasTable:
+    """
+    Walker/Vose alias method：O(n) 建表，之後每次抽樣 O(1)
+    """
+    def __init__(self, prob: list[float], alias: list[int]):
+        self.prob = prob
+        self.alias = alias
+
+    def __len__(self):
+        return len(self.prob)
+
+    @classmethod
+    def build(cls, weights: list[float]) -> 'AliasTable':
+        n = len(weights)
+        total = sum(weights)
+        if n == 0 or total <= 0:
+            return cls([1.0] * n, list(range(n)))
+
+        scaled = [weight * n / total for weight in weights]
+        prob = [0.0] * n
+        alias = list(range(n))
+        small = [index for index, value in enumerate(scaled) if value < 1.0]
+        large = [index for index, value in enumerate(scaled) if value >= 1.0]
+
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+
+        # 剩下的因浮點誤差應視為 1
+        for index in large + small:
+            prob[index] = 1.0
+
+        return cls(prob, alias)
+
+    def draw(self, rng: random.Random = None) -> int:
+        rng = rng or random
+        column = rng.randrange(len(self.prob))
+        return column if rng.random() < self.prob[column] else self.alias[column]
+
+
+class DifficultyService:
+    """
+    依品種答對率加權抽題目的品種：easy 偏向答對率高的品種，hard 偏向答對率低的品種，
+    mixed 每題隨機用 easy 或 hard。權重表由定時任務 rebuild_tables 預先建好存進 Redis。
+    """
+    EASY = 'easy'
+    HARD = 'hard'
+    MIXED = 'mixed'
+    MODES = (EASY, HARD, MIXED)
+
+    TABLES_KEY = 'difficulty:alias_tables'
+    VERSION_KEY = 'difficulty:alias_tables:version'
+    # 貝氏平滑：每個品種先視為有 PRIOR_ATTEMPTS 次全站平均答對率的作答
+    PRIOR_ATTEMPTS = 10
+
+    _tables = None
+    _version = None
+    _checked_at = 0.0
+    _lock = threading.Lock()
+
+    @classmethod
+    def rebuild_tables(cls) -> int:
+        breeds = list(Breed.objects.order_by('id').values_list('slug', 'total_attempts', 'correct_attempts'))
+        if not breeds:
+            return 0
+
+        totals = Breed.objects.aggregate(attempts=models.Sum('total_attempts'), correct=models.Sum('correct_attempts'))
+        global_rate = totals['correct'] / totals['attempts'] if totals['attempts'] else 0.5
+
+        rates = [
+            (correct + cls.PRIOR_ATTEMPTS * global_rate) / (attempts + cls.PRIOR_ATTEMPTS)
+            for _, attempts, correct in breeds
+        ]
+        easy = AliasTable.build(rates)
+        hard = AliasTable.build([1.0 - rate for rate in rates])
+
+        RedisService.set(cls.TABLES_KEY, {
+            'slugs': [slug for slug, _, _ in breeds],
+            cls.EASY: (easy.prob, easy.alias),
+            cls.HARD: (hard.prob, hard.alias),
+        }, ttl=None)
+        RedisService.get_client().incr(cls.VERSION_KEY)
+        return len(breeds)
+
+    @classmethod
+    def get_tables(cls) -> dict | None:
+        if cls._tables is not None and time.monotonic() - cls._checked_at < settings.BREED_CATALOG_CHECK_INTERVAL:
+            return cls._tables
+
+        with cls._lock:
+            version = RedisService.get_client().get(cls.VERSION_KEY)
+            if cls._tables is None or cls._version != version:
+                data = RedisService.get(cls.TABLES_KEY)
+                if data is None:
+                    # 定時任務還沒建過權重表（或 Redis 被清空），當場建一次；品種表很小
+                    logger.warning("難度權重表不存在，立即重建")
+                    if cls.rebuild_tables():
+                        version = RedisService.get_client().get(cls.VERSION_KEY)
+                        data = RedisService.get(cls.TABLES_KEY)
+                    else:
+                        logger.warning("沒有品種資料，難度模式暫時改為隨機出題")
+                cls._tables = {
+                    'slugs': data['slugs'],
+                    cls.EASY: AliasTable(*data[cls.EASY]),
+                    cls.HARD: AliasTable(*data[cls.HARD]),
+                } if data else None
+                cls._version = version
+            cls._checked_at = time.monotonic()
+            return cls._tables
+
+    @classmethod
+    def draw_breed_slug(cls, mode: str, rng: random.Random = None) -> str | None:
+        tables = cls.get_tables()
+        if tables is None or mode not in cls.MODES:
+            return None
+
+        rng = rng or random
+        if mode == cls.MIXED:
+            mode = rng.choice((cls.EASY, cls.HARD))
+        return tables['slugs'][tables[mode].draw(rng)]
@@ -1,17 +1,74 @@
-import requests
+import os
+
+from django.conf import settings
+
+from .http_client import CircuitBreaker, HttpClient
 
 
 class DogAPIService:
-    BASE_URL = 'https://dog.ceo/api/'
+    # dog.ceo 的 breeds/image/random/N 單次最多回傳 50 張
+    MAX_IMAGES_PER_REQUEST = 50
+    
+    _client = None
+    _client_pid = None
+    
+    @classmethod
+    def get_client(cls) -> HttpClient:
+        # 每個 worker process 各自一個 Session，fork 後不共用連線
+        if cls._client is None or cls._client_pid != os.getpid():
+            cls._client = HttpClient(
+                timeout=(settings.DOG_API_CONNECT_TIMEOUT, settings.DOG_API_READ_TIMEOUT),
+                max_retries=settings.DOG_API_MAX_RETRIES,
+                retry_backoff=settings.DOG_API_RETRY_BACKOFF,
+                pool_size=settings.DOG_API_POOL_SIZE,
+                breaker=CircuitBreaker(
+                    failure_threshold=settings.DOG_API_BREAKER_THRESHOLD,
+                    reset_timeout=settings.DOG_API_BREAKER_RESET_TIMEOUT,
+                ),
+            )
+            cls._client_pid = os.getpid()
+        return cls._client
+    
+    @classmethod
+    def reset_client(cls):
+        if cls._client is not None:
+            cls._client.close()
+        cls._client = None
+        cls._client_pid = None
     
     @classmethod
     def fetch_random_single_image(cls) -> str:
-        url = f'{cls.BASE_URL}breeds/image/random'
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
+        data = cls.get_client().get_json(f'{settings.DOG_API_BASE_URL}breeds/image/random')
+        return data.get('message')
+    
+    @classmethod
+    def fetch_random_images(cls, count: int) -> list[str]:
+        image_urls = []
+        while len(image_urls) < count:
+            batch_size = min(count - len(image_urls), cls.MAX_IMAGES_PER_REQUEST)
+            data = cls.get_client().get_json(f'{settings.DOG_API_BASE_URL}breeds/image/random/{batch_size}')
+            message = data.get('message')
+            # 錯誤回應的 message 是字串，沒有圖片時也不再重試，避免無限迴圈
+            if not isinstance(message, list) or not message:
+                break
+            image_urls.extend(message)
+        return image_urls
+    
+    @classmethod
+    def fetch_breed_random_image(cls, slug: str) -> str:
+        data = cls.get_client().get_json(f'{settings.DOG_API_BASE_URL}breed/{cls.breed_path_from_slug(slug)}/images/random')
         return data.get('message')
     
+    @classmethod
+    def fetch_breed_images(cls, slug: str) -> list[str]:
+        data = cls.get_client().get_json(f'{settings.DOG_API_BASE_URL}breed/{cls.breed_path_from_slug(slug)}/images')
+        return data.get('message', [])
+    
     @classmethod
     def extract_slug_from_image_url(cls, image_url: str) -> str:
-        return image_url.split('/')[4]
\ No newline at end of file
+        return image_url.split('/')[4]
+    
+    @classmethod
+    def breed_path_from_slug(cls, slug: str) -> str:
+        # 子品種的 slug 為 "hound-afghan"，API 路徑為 "hound/afghan"
+        return slug.replace('-', '/')
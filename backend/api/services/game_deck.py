@@ -0,0 +1,75 @@
+import json
+
+from django.conf import settings
+
+from api.models import Question
+from .breed import BreedService
+from .choice import ChoiceService
+from .redis import RedisService
+
+
+class GameDeckService:
+    """
+    牌組模式：開局時一次產生整局的題目與選項，存成 Redis list，
+    每回合 QuestionView 只需一次 LPOP
+    """
+    @classmethod
+    def deck_key(cls, game_session_id) -> str:
+        return f'game_deck:{game_session_id}'
+
+    @classmethod
+    def build_deck(cls, game_session_id, questions: list[Question]) -> int:
+        ttl = settings.GAME_DECK_TTL
+        entries = []
+        answer_data = {}
+        for question in questions:
+            choices = ChoiceService.generate_choices(BreedService.get_breed_by_slug(question.breed_slug))
+            entries.append(json.dumps({
+                'id': str(question.id),
+                'image_url': question.image_url,
+                'breed_slug': question.breed_slug,
+                'choices': [choice['slug'] for choice in choices],
+                'created_at': question.created_at.isoformat(),
+                'updated_at': question.updated_at.isoformat(),
+            }))
+            # 作答時 AnswerView 讀取的資料也一併寫好，回合中不必再寫 Redis
+            answer_data[f"{game_session_id}_{question.id}"] = {
+                'correct_slug': question.breed_slug,
+                'choices': choices,
+                'image_url': question.image_url,
+            }
+
+        if not entries:
+            return 0
+
+        pipe = RedisService.get_client().pipeline(transaction=False)
+        pipe.delete(cls.deck_key(game_session_id))
+        pipe.rpush(cls.deck_key(game_session_id), *entries)
+        pipe.expire(cls.deck_key(game_session_id), ttl)
+        pipe.execute()
+        RedisService.set_many(answer_data, ttl=ttl)
+        return len(entries)
+
+    @classmethod
+    def pop(cls, game_session_id, lang='en') -> tuple[Question, list[dict]] | None:
+        entry = RedisService.get_client().lpop(cls.deck_key(game_session_id))
+        if entry is None:
+            return None
+
+        entry = json.loads(entry)
+        question = Question(
+            id=entry['id'],
+            image_url=entry['image_url'],
+            breed_slug=entry['breed_slug'],
+            created_at=entry['created_at'],
+            updated_at=entry['updated_at'],
+        )
+        choices = [
+            {'slug': slug, 'name': BreedService.get_breed_by_slug(slug).name(lang)}
+            for slug in entry['choices']
+        ]
+        return question, choices
+
+    @classmethod
+    def delete_deck(cls, game_session_id):
+        RedisService.get_client().delete(cls.deck_key(game_session_id))
@@ -1,91 +1,231 @@
-from api.models import GameSession
+from api.models import GameSession, RoundRecord
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
 from .redis import RedisService
+from .round_codec import RoundCodec
+from .round_record_stream import RoundRecordStreamService
 
 
 class GameSessionService:
+    """
+    進行中遊戲的即時狀態（擁有者、已答回合、分數、答對數）存在 Redis hash，
+    出題與作答時不必查資料庫；結算時仍以資料庫的回合紀錄為準
+    """
+    STATE_TTL = 3600
+
+    @classmethod
+    def state_key(cls, session_id) -> str:
+        return f"game_session:{session_id}:state"
+
     @classmethod
     def is_valid_session(cls, session_id: int) -> bool:
         return GameSession.objects.filter(id=session_id).exists()
     
     @classmethod
     def is_session_owned_by_user(cls, session_id: int, user_id: int) -> bool:
-        return GameSession.objects.filter(id=session_id, user_id=user_id).exists()
+        state = cls.get_state(session_id)
+        return state is not None and state['user_id'] == user_id
     
     @classmethod
-    def create_session(cls, user_id: int) -> GameSession:
-        session = GameSession.objects.create(user_id=user_id)
+    def create_session(cls, user_id: int, difficulty: str = None) -> GameSession:
+        session = GameSession.objects.create(user_id=user_id, difficulty=difficulty)
+        cls._save_state(session.id, user_id=user_id, rounds=0, score=0, correct=0, difficulty=difficulty)
         return session
     
+    @classmethod
+    def get_state(cls, session_id) -> dict | None:
+        state = RedisService.get_client().hgetall(cls.state_key(session_id))
+        if b"user_id" in state:
+            return {
+                field.decode(): (value.decode() or None) if field == b"difficulty" else int(value)
+                for field, value in state.items()
+            }
+        
+        # Redis 中沒有（過期或被清空）時從資料庫重建一次
+        try:
+            session = GameSession.objects.filter(id=session_id).annotate(
+                rounds=models.Count('round_records'),
+                total_score=models.Sum('round_records__score'),
+                correct=models.Count('round_records', filter=models.Q(round_records__is_correct=True)),
+            ).values('user_id', 'rounds', 'total_score', 'correct', 'difficulty').first()
+        except (ValueError, TypeError):
+            return None
+        if session is None:
+            return None
+        
+        rounds = session['rounds']
+        if settings.ROUND_RECORD_WRITE_BEHIND:
+            # 已作答但還在 stream 中等待寫入的回合也要算進去，否則會重複出同一回合
+            rounds += RoundRecordStreamService.pending_count(session_id)
+        
+        return cls._save_state(session_id, user_id=session['user_id'], rounds=rounds,
+                               score=session['total_score'] or 0, correct=session['correct'],
+                               difficulty=session['difficulty'])
+    
+    @classmethod
+    def _save_state(cls, session_id, **state) -> dict:
+        pipe = RedisService.get_client().pipeline(transaction=True)
+        # Redis hash 不能存 None，沒有難度時存空字串
+        pipe.hset(cls.state_key(session_id), mapping={
+            field: '' if value is None else value for field, value in state.items()
+        })
+        pipe.expire(cls.state_key(session_id), cls.STATE_TTL)
+        pipe.execute()
+        return state
+    
+    @classmethod
+    def record_answer(cls, session_id, is_correct: bool, score: int):
+        pipe = RedisService.get_client().pipeline(transaction=True)
+        pipe.hincrby(cls.state_key(session_id), "rounds", 1)
+        pipe.hincrby(cls.state_key(session_id), "score", score)
+        pipe.hincrby(cls.state_key(session_id), "correct", 1 if is_correct else 0)
+        pipe.expire(cls.state_key(session_id), cls.STATE_TTL)
+        pipe.execute()
+    
     @classmethod
     def end_session(cls, session_id: int):
-        session = GameSession.objects.get(id=session_id)
-        session.score = session.round_records.aggregate(total_score=models.Sum('score'))['total_score'] or 0
+        # 回合紀錄（連同題目）只查一次並快取在 session 上，之後的統計與序列化都不再查詢
+        session = GameSession.objects.prefetch_related(
+            models.Prefetch('round_records', queryset=RoundRecord.objects.select_related('question').order_by('id'))
+        ).get(id=session_id)
+        round_records = session.round_records.all()
+        
+        session.score = sum(record.score for record in round_records)
         session.ended_at = timezone.now()
         
-        total_rounds = session.round_records.count()
+        total_rounds = len(round_records)
         if total_rounds > 0:
-            correct_rounds = session.round_records.filter(is_correct=True).count()
+            correct_rounds = sum(1 for record in round_records if record.is_correct)
             session.avg_accuracy = round((correct_rounds / total_rounds) * 100, 2)
         else:
             session.avg_accuracy = 0.0
             
-        session.save()
+        session.save(update_fields=['score', 'ended_at', 'avg_accuracy', 'updated_at'])
+        RedisService.get_client().delete(cls.state_key(session_id))
         return session
     
     @classmethod
     def terminate_session(cls, session_id: int):
         GameSession.objects.filter(id=session_id).delete()
+        RedisService.get_client().delete(cls.state_key(session_id))
     
     @classmethod
     def get_current_round(cls, session_id: int) -> int:
-        session = GameSession.objects.get(id=session_id)
-        return session.round_records.count() + 1
+        state = cls.get_state(session_id)
+        if state is None:
+            raise GameSession.DoesNotExist(f'GameSession {session_id} does not exist.')
+        return state['rounds'] + 1
     
     @classmethod
-    def calculate_stats(cls, session_id: int) -> dict:
-        session = GameSession.objects.get(id=session_id)
+    def calculate_stats(cls, session: GameSession) -> dict:
+        """
+        從 end_session 已載入的回合紀錄計算統計，不再查詢資料庫
+        """
         total_games = 1
-        total_rounds = session.round_records.count()
+        round_records = session.round_records.all()
         breed_stats = {}
-        for record in session.round_records.all():
-            breed = record.question.breed_slug
-            if breed is not None:
-                if breed not in breed_stats:
-                    breed_stats[breed] = {"attempts": 0, "successes": 0}
-                breed_stats[breed]["attempts"] += 1
-                if getattr(record, "is_correct", False):
-                    breed_stats[breed]["successes"] += 1
+        for record in round_records:
+            breed = record.correct_slug
+            if breed not in breed_stats:
+                breed_stats[breed] = {"attempts": 0, "successes": 0}
+            breed_stats[breed]["attempts"] += 1
+            if record.is_correct:
+                breed_stats[breed]["successes"] += 1
         
         return {
             "total_games": total_games,
-            "total_rounds": total_rounds,
+            "total_rounds": len(round_records),
             "total_correct": sum(bs["successes"] for bs in breed_stats.values()),
             "breed_stats": breed_stats
         }
     
 
 class GuestGameSessionService:
+    """
+    訪客遊戲存在 Redis：hash 存分數、回合數等純量，list 存每回合的精簡二進位紀錄（見 RoundCodec），
+    每次作答只需一次 script 的 HINCRBY + RPUSH + EXPIRE
+    """
+    SESSION_TTL = 600
+
+    # session hash 已過期時不寫入，避免 HINCRBY 重新建立一個沒有 started_at 的殘缺 session
+    APPEND_ROUND_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return false
+    end
+    redis.call('HINCRBY', KEYS[1], 'score', ARGV[1])
+    local rounds = redis.call('HINCRBY', KEYS[1], 'rounds', 1)
+    redis.call('RPUSH', KEYS[2], ARGV[2])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+    return rounds
+    """
+
     @classmethod
-    def create_session(cls, game_session_id: str) -> str:
-        RedisService.set(f"guest_game_session:{game_session_id}",
-                            {
-                                "started_at": str(timezone.now()),
-                                "score": 0,
-                                "rounds": 0,
-                                "round_records": []
-                            })
-    
+    def session_key(cls, game_session_id: str) -> str:
+        return f"guest_game_session:{game_session_id}"
+
     @classmethod
-    def get_session_data(cls, game_session_id: str):
-        return RedisService.get(f"guest_game_session:{game_session_id}")
-    
+    def rounds_key(cls, game_session_id: str) -> str:
+        return f"guest_game_session:{game_session_id}:rounds"
+
     @classmethod
-    def update_session_data(cls, game_session_id: str, data: dict):
-        RedisService.set(f"guest_game_session:{game_session_id}", data)
-        
+    def create_session(cls, game_session_id: str, difficulty: str = None):
+        pipe = RedisService.get_client().pipeline(transaction=True)
+        pipe.delete(cls.rounds_key(game_session_id))
+        pipe.hset(cls.session_key(game_session_id), mapping={
+            "started_at": str(timezone.now()),
+            "score": 0,
+            "rounds": 0,
+            "difficulty": difficulty or '',
+        })
+        pipe.expire(cls.session_key(game_session_id), cls.SESSION_TTL)
+        pipe.execute()
+
+    @classmethod
+    def get_progress(cls, game_session_id: str) -> dict | None:
+        """
+        出題時需要的已答回合數與難度模式，session 不存在時回傳 None
+        """
+        rounds, difficulty = RedisService.get_client().hmget(cls.session_key(game_session_id), "rounds", "difficulty")
+        if rounds is None:
+            return None
+        return {"rounds": int(rounds), "difficulty": (difficulty.decode() or None) if difficulty else None}
+
+    @classmethod
+    def get_round_count(cls, game_session_id: str) -> int | None:
+        rounds = RedisService.get_client().hget(cls.session_key(game_session_id), "rounds")
+        return int(rounds) if rounds is not None else None
+
+    @classmethod
+    def append_round(cls, game_session_id: str, question_id, selected_slug: str, correct_slug: str,
+                     is_correct: bool, choices: list[dict]) -> int | None:
+        """
+        記錄一回合並回傳已答回合數；session 已過期時不寫入並回傳 None
+        """
+        entry = RoundCodec.encode(question_id, selected_slug, correct_slug, is_correct, choices)
+        return RedisService.get_client().eval(
+            cls.APPEND_ROUND_SCRIPT, 2, cls.session_key(game_session_id), cls.rounds_key(game_session_id),
+            1 if is_correct else 0, entry, cls.SESSION_TTL)
+
+    @classmethod
+    def get_session_data(cls, game_session_id: str) -> dict | None:
+        pipe = RedisService.get_client().pipeline(transaction=False)
+        pipe.hgetall(cls.session_key(game_session_id))
+        pipe.lrange(cls.rounds_key(game_session_id), 0, -1)
+        session, entries = pipe.execute()
+        if not session:
+            return None
+
+        round_records = RoundCodec.decode_many(entries)
+        return {
+            "started_at": session[b"started_at"].decode() if b"started_at" in session else None,
+            "score": int(session.get(b"score", 0)),
+            "rounds": len(round_records),
+            "round_records": round_records,
+        }
+
     @classmethod
     def delete_session(cls, game_session_id: str):
-        RedisService.delete(f"guest_game_session:{game_session_id}")
\ No newline at end of file
+        RedisService.get_client().delete(cls.session_key(game_session_id), cls.rounds_key(game_session_id))
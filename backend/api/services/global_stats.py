@@ -0,0 +1,81 @@
+import json
+
+from django.conf import settings
+
+from api.models import GlobalStat, HardestBreedStat
+from .redis import RedisService
+
+
+class GlobalStatsService:
+    """
+    全站統計的快照：定時同步任務把各語言、各排行變體的完整回應預先算好，
+    連同版本號存成一個 Redis key，GlobalStatsView 只需一次 GET
+    """
+    SNAPSHOT_KEY = 'global_stats:snapshot'
+    VERSION_KEY = 'global_stats:version'
+    LANGS = ('en', 'zh')
+
+    @classmethod
+    def default_variant(cls, lang: str) -> str:
+        # 中文介面只列出有中文名稱的品種
+        return 'zh' if lang == 'zh' else 'default'
+
+    @classmethod
+    def rebuild_snapshot(cls) -> dict:
+        from api.serializers import GlobalStatsSerializer, HardestBreedsSerializer
+
+        global_stat, _ = GlobalStat.objects.get_or_create(id=1)
+        hardest_by_variant = {}
+        for stat in HardestBreedStat.objects.select_related('breed').order_by('variant', 'rank'):
+            hardest_by_variant.setdefault(stat.variant, []).append(stat)
+
+        stats = {
+            'total_games': global_stat.total_games,
+            'total_rounds': global_stat.total_rounds,
+            'total_players': global_stat.total_players,
+            'avg_accuracy': round(global_stat.total_correct / global_stat.total_rounds * 100, 2) if global_stat.total_rounds > 0 else 0.0,
+        }
+        hardest_breeds = {
+            lang: {
+                variant: HardestBreedsSerializer(hardest_stats, many=True, context={'lang': lang}).data
+                for variant, hardest_stats in hardest_by_variant.items()
+            }
+            for lang in cls.LANGS
+        }
+        for lang in cls.LANGS:
+            serializer = GlobalStatsSerializer(data={**stats, 'hardest_breeds': hardest_breeds[lang].get(cls.default_variant(lang), [])})
+            serializer.is_valid(raise_exception=True)
+
+        snapshot = {
+            'version': RedisService.get_client().incr(cls.VERSION_KEY),
+            'stats': stats,
+            'hardest_breeds': hardest_breeds,
+        }
+        RedisService.get_client().set(cls.SNAPSHOT_KEY, json.dumps(snapshot, ensure_ascii=False))
+        return snapshot
+
+    @classmethod
+    def get_snapshot(cls) -> dict:
+        snapshot = RedisService.get_client().get(cls.SNAPSHOT_KEY)
+        if snapshot is None:
+            # 尚未有快照（例如 Redis 剛清空）時當場建立一次
+            return cls.rebuild_snapshot()
+        return json.loads(snapshot)
+
+    @classmethod
+    def get_payload(cls, snapshot: dict, lang: str, variant: str = None) -> dict:
+        lang = lang if lang in cls.LANGS else 'en'
+        variant = variant or cls.default_variant(lang)
+        return {
+            **snapshot['stats'],
+            'hardest_breeds': snapshot['hardest_breeds'][lang].get(variant, []),
+        }
+
+    @classmethod
+    def etag(cls, snapshot: dict, lang: str, variant: str = None) -> str:
+        lang = lang if lang in cls.LANGS else 'en'
+        return f'"{snapshot["version"]}-{lang}-{variant or cls.default_variant(lang)}"'
+
+    @classmethod
+    def cache_control(cls) -> str:
+        return f'public, max-age={settings.GLOBAL_STATS_MAX_AGE}'
@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CircuitOpenError(requests.RequestException):
+    pass
+
+
+class CircuitBreaker:
+    """
+    連續失敗達 failure_threshold 次後斷路 reset_timeout 秒，
+    之後放行一個試探請求（half-open），成功即恢復、失敗則再次斷路
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class HttpClient:
+    """
+    共用 Session（keep-alive 連線池）的 JSON 客戶端，
+    帶 connect/read timeout、指數退避加抖動的重試與斷路器
+    """
+    def __init__(self, timeout: tuple = (2.0, 3.0), max_retries: int = 2, retry_backoff: float = 0.2,
+                 pool_size: int = 10, breaker: CircuitBreaker = None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_json(self, url: str):
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f'Circuit breaker is open, skipping request to {url}')
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+                data = response.json()
+            except requests.HTTPError as e:
+                # 4xx 是請求本身的問題，重試也沒用，也不代表對方服務異常
+                if e.response is not None and e.response.status_code < 500:
+                    self.breaker.record_success()
+                    raise
+                error = e
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError, ValueError) as e:
+                error = e
+            except Exception:
+                # 其他錯誤（重導次數過多、網址無效等）重試也沒用，直接記為失敗，
+                # half-open 的試探旗標才會清除，斷路器不會卡住
+                self.breaker.record_failure()
+                raise
+            else:
+                self.breaker.record_success()
+                return data
+
+            if attempt < self.max_retries:
+                time.sleep(random.uniform(0, self.retry_backoff * (2 ** attempt)))
+
+        self.breaker.record_failure()
+        raise error
+
+    def close(self):
+        self.session.close()
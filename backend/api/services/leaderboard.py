@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+from api.models import PlayerInfo
+from .redis import RedisService
+
+
+class LeaderboardService:
+    """
+    排行榜：每位玩家只保留最高分（ZADD GT），分為總榜、每日、每週，
+    以及依每局回合數分開的榜。每日、每週的 key 依時間窗命名，過期後由 Redis 自動刪除。
+    取前 N 名與查詢自己的名次都是 O(log n)。
+    回合數以實際作答的回合數為準（開局設定的 total_rounds 沒有存進資料庫），
+    提前結算的局會落在較短回合數的榜上，與分數分布的分組方式一致，重建時也能從回合紀錄算出
+    """
+    KEY_PREFIX = 'leaderboard:'
+    ALL = 'all'
+    DAY = 'day'
+    WEEK = 'week'
+    PERIODS = (ALL, DAY, WEEK)
+    # 時間窗結束後再保留一段時間才過期
+    WINDOW_GRACE = timedelta(days=1)
+
+    @classmethod
+    def window(cls, period: str, moment: datetime = None) -> tuple[str | None, datetime | None]:
+        """
+        回傳 (時間窗名稱, 時間窗結束時間)，總榜沒有時間窗
+        """
+        moment = (moment or timezone.now()).astimezone(dt_timezone.utc)
+        if period == cls.DAY:
+            start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+            return f'{start:%Y%m%d}', start + timedelta(days=1)
+        if period == cls.WEEK:
+            year, week, weekday = moment.isocalendar()
+            start = moment.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=weekday - 1)
+            return f'{year}W{week:02d}', start + timedelta(weeks=1)
+        return None, None
+
+    @classmethod
+    def key(cls, period: str, rounds: int = None, moment: datetime = None) -> str:
+        window, _ = cls.window(period, moment)
+        key = f'{cls.KEY_PREFIX}{period}'
+        if window:
+            key += f':{window}'
+        if rounds:
+            key += f':r{rounds}'
+        return key
+
+    @classmethod
+    def record_game(cls, user_id: int, score: int, rounds: int, ended_at: datetime = None, pipe=None) -> bool:
+        """
+        把一局的分數寫入所有相關的排行榜；傳入 pipe 時只加入指令不執行（供批次重建使用）。
+        回傳是否有寫入（沒有作答的局與已過期的時間窗會略過）
+        """
+        if rounds <= 0:
+            return False
+        ended_at = ended_at or timezone.now()
+        now = timezone.now()
+        execute = pipe is None
+        pipe = pipe or RedisService.get_client().pipeline(transaction=False)
+        written = False
+        for period in cls.PERIODS:
+            _, window_end = cls.window(period, ended_at)
+            if window_end is not None and window_end + cls.WINDOW_GRACE <= now:
+                continue
+            for bucket in (None, rounds):
+                key = cls.key(period, bucket, ended_at)
+                pipe.zadd(key, {str(user_id): score}, gt=True)
+                if window_end is not None:
+                    pipe.expireat(key, window_end + cls.WINDOW_GRACE)
+                written = True
+        if execute and written:
+            pipe.execute()
+        return written
+
+    @classmethod
+    def get_top(cls, period: str, rounds: int = None, limit: int = 10) -> list[dict]:
+        entries = RedisService.get_client().zrevrange(cls.key(period, rounds), 0, limit - 1, withscores=True)
+        user_ids = [int(member) for member, _ in entries]
+        nicknames = dict(PlayerInfo.objects.filter(user_id__in=user_ids).values_list('user_id', 'nickname'))
+        return [
+            {
+                'rank': index + 1,
+                'user_id': user_id,
+                'nickname': nicknames.get(user_id, PlayerInfo._meta.get_field('nickname').default),
+                'score': int(score),
+            }
+            for index, (user_id, (_, score)) in enumerate(zip(user_ids, entries))
+        ]
+
+    @classmethod
+    def get_rank(cls, user_id: int, period: str, rounds: int = None) -> dict | None:
+        key = cls.key(period, rounds)
+        pipe = RedisService.get_client().pipeline(transaction=False)
+        pipe.zrevrank(key, str(user_id))
+        pipe.zscore(key, str(user_id))
+        rank, score = pipe.execute()
+        if rank is None:
+            return None
+        return {'rank': rank + 1, 'score': int(score)}
+
+    @classmethod
+    def clear(cls) -> int:
+        client = RedisService.get_client()
+        keys = list(client.scan_iter(match=f'{cls.KEY_PREFIX}*', count=1000))
+        if keys:
+            client.delete(*keys)
+        return len(keys)
@@ -1,7 +1,17 @@
 import random
 
+import requests
+from django.conf import settings
+from django.db import transaction
+
+from .breed import BreedService
+from .breed_catalog import BreedCatalogService, BreedEntry
+from .choice import ChoiceService
+from .difficulty import DifficultyService
 from .dog import DogAPIService
-from api.models import Breed, Question
+from .question_bank import QuestionBankService
+from .question_pool import QuestionPoolService
+from api.models import Question
 
 
 class QuestionService:
@@ -15,9 +25,94 @@ class QuestionService:
         return question
     
     @classmethod
-    def generate_question(cls) -> Question:
-        image_url = DogAPIService.fetch_random_single_image()
+    def generate_question(cls, difficulty: str = None) -> Question:
+        if difficulty:
+            slug = DifficultyService.draw_breed_slug(difficulty)
+            if slug:
+                return cls.generate_question_for_breed(slug)
+        
+        if settings.QUESTION_SOURCE == 'local_bank':
+            question = QuestionBankService.random_question()
+            if question is None:
+                raise ValueError('Local question bank is empty.')
+            return question
+        
+        if settings.QUESTION_POOL_ENABLED:
+            question = QuestionPoolService.pop()
+            if question:
+                return question
+        
+        try:
+            return cls.fetch_live_question()
+        except requests.RequestException:
+            # dog.ceo 無法使用（含斷路器開啟）時，改用本地題庫
+            question = QuestionBankService.random_question()
+            if question is None:
+                raise
+            return question
+    
+    @classmethod
+    def generate_questions(cls, count: int, difficulty: str = None) -> list[Question]:
+        """批次出題（牌組模式用）：一次從題池/題庫取 id，再以一次查詢載入題目"""
+        if difficulty:
+            slugs = [DifficultyService.draw_breed_slug(difficulty) for _ in range(count)]
+            if all(slugs):
+                question_ids = QuestionBankService.random_ids_for_breeds(slugs)
+                questions_by_id = cls._load_questions([question_id for question_id in question_ids if question_id])
+                return [
+                    questions_by_id.get(question_id) or cls.generate_question_for_breed(slug)
+                    for question_id, slug in zip(question_ids, slugs)
+                ]
+        
+        if settings.QUESTION_SOURCE == 'local_bank':
+            question_ids = QuestionBankService.random_ids(count)
+            if not question_ids:
+                raise ValueError('Local question bank is empty.')
+            # 題庫比局數少時允許重複
+            question_ids += random.choices(question_ids, k=count - len(question_ids))
+            questions_by_id = cls._load_questions(question_ids)
+            return [questions_by_id[question_id] for question_id in question_ids if question_id in questions_by_id]
+        
+        questions = []
+        if settings.QUESTION_POOL_ENABLED:
+            questions = list(cls._load_questions(QuestionPoolService.pop_many(count)).values())
+        
+        if len(questions) < count:
+            try:
+                questions += cls.bulk_ingest(DogAPIService.fetch_random_images(count - len(questions)))
+            except requests.RequestException:
+                questions += cls._load_questions(QuestionBankService.random_ids(count - len(questions))).values()
         
+        random.shuffle(questions)
+        return questions[:count]
+    
+    @classmethod
+    def _load_questions(cls, question_ids: list[str]) -> dict[str, Question]:
+        return {str(question_id): question for question_id, question in Question.objects.in_bulk(question_ids).items()}
+    
+    @classmethod
+    def generate_question_for_breed(cls, slug: str) -> Question:
+        question = QuestionBankService.random_question_for_breed(slug)
+        if question:
+            return question
+        
+        if settings.QUESTION_SOURCE == 'dog_api':
+            try:
+                return cls.get_or_create_question(DogAPIService.fetch_breed_random_image(slug))
+            except requests.RequestException:
+                pass
+        
+        question = QuestionBankService.random_question()
+        if question is None:
+            raise ValueError('Local question bank is empty.')
+        return question
+    
+    @classmethod
+    def fetch_live_question(cls) -> Question:
+        return cls.get_or_create_question(DogAPIService.fetch_random_single_image())
+    
+    @classmethod
+    def get_or_create_question(cls, image_url: str) -> Question:
         # Check if the question exists
         question = Question.objects.filter(image_url=image_url).first()
         if question:
@@ -25,26 +120,45 @@ class QuestionService:
         
         slug = DogAPIService.extract_slug_from_image_url(image_url)
         
-        breed = Breed.objects.filter(slug=slug).first()
-        if not breed:
-            raise ValueError(f'Breed with slug "{slug}" not found.')
+        breed = BreedService.get_breed_by_slug(slug)
         
         question = Question.objects.create(
             image_url=image_url,
-            answer=breed,
+            answer_id=breed.id,
             breed_slug=slug
         )
+        QuestionBankService.add([question])
         
         return question
     
     @classmethod
-    def generate_random_choices(cls, correct_breed: Breed, num_choices: int = 3, lang='en') -> list[str]:
-        wrong_breeds = Breed.objects.exclude(id=correct_breed.id).order_by('?')[:num_choices]
-        choices = [{'slug': breed.slug, 'name': breed.name_en if lang == 'en' else breed.name_zh} for breed in wrong_breeds]
-        choices.append({'slug': correct_breed.slug, 'name': correct_breed.name_en if lang == 'en' else correct_breed.name_zh})
-        random.shuffle(choices)
+    def bulk_ingest(cls, image_urls: list[str]) -> list[Question]:
+        slug_by_url = {url: DogAPIService.extract_slug_from_image_url(url) for url in image_urls}
+        return cls.bulk_create_questions(slug_by_url)
+    
+    @classmethod
+    def bulk_create_questions(cls, slug_by_url: dict[str, str]) -> list[Question]:
+        catalog = BreedCatalogService.get_catalog()
+        
+        # 找不到品種的圖片直接略過，已存在的 image_url 由 ignore_conflicts 略過
+        questions = [
+            Question(image_url=url, answer_id=catalog.get_by_slug(slug).id, breed_slug=slug)
+            for url, slug in slug_by_url.items() if catalog.get_by_slug(slug) is not None
+        ]
+        if not questions:
+            return []
         
-        return choices
+        with transaction.atomic():
+            Question.objects.bulk_create(questions, ignore_conflicts=True, batch_size=500)
+            questions = list(Question.objects.filter(image_url__in=[question.image_url for question in questions]))
+        
+        QuestionBankService.add(questions)
+        return questions
+    
+    @classmethod
+    def generate_random_choices(cls, correct_breed: BreedEntry, num_choices: int = 3, lang='en', seed=None) -> list[dict]:
+        rng = ChoiceService.make_rng(seed) if seed is not None else None
+        return ChoiceService.generate_choices(correct_breed, num_choices=num_choices, lang=lang, rng=rng)
     
     @classmethod
     def is_answer_correct(cls, question_id: int, selected_slug: str) -> bool:
@@ -53,4 +167,4 @@ class QuestionService:
         except Question.DoesNotExist:
             raise ValueError(f'Question with ID "{question_id}" not found.')
         
-        return question.answer.slug == selected_slug, question.answer.slug
\ No newline at end of file
+        return question.breed_slug == selected_slug, question.breed_slug
\ No newline at end of file
@@ -0,0 +1,240 @@
+import logging
+import random
+import threading
+import uuid
+
+from django.db import connection
+
+from api.models import Question
+from .redis import RedisService
+
+logger = logging.getLogger(__name__)
+
+
+class QuestionBankService:
+    """
+    本地題庫：Redis set 存放所有已知 Question id，另有依品種分開的 set，
+    SRANDMEMBER 以 O(1) 隨機取題（可指定品種）。
+    題庫不存在時（例如 Redis 剛清空）請求端不會自己重建，而是改從資料庫取題，
+    並在背景啟動一次重建；重建以 SET NX 鎖確保同時只有一個在跑
+    """
+    BANK_KEY = 'question_bank:ids'
+    BREED_KEY_PREFIX = 'question_bank:breed:'
+    REBUILD_LOCK_KEY = 'question_bank:rebuild_lock'
+    REBUILD_LOCK_TTL = 600
+    BUILDING_INFIX = ':building:'
+    REBUILD_CHUNK_SIZE = 1000
+
+    # 重建期間新增的題目同時寫入正在建立的暫存 set，換上時才不會遺失。
+    # KEYS: 鎖、總題庫、品種 set，重建中另加兩者的暫存 key；ARGV: 題目 id、讀到的 run_id。
+    # 鎖已換手（該次重建已換上或被取代）時不寫暫存 key，新的重建會從資料庫讀到這題
+    ADD_SCRIPT = """
+    redis.call('SADD', KEYS[2], ARGV[1])
+    redis.call('SADD', KEYS[3], ARGV[1])
+    if #KEYS > 3 and redis.call('GET', KEYS[1]) == ARGV[2] then
+        redis.call('SADD', KEYS[4], ARGV[1])
+        redis.call('SADD', KEYS[5], ARGV[1])
+    end
+    """
+
+    # KEYS: 鎖、n 個暫存 key、n 個對應的正式 key、其餘要刪除的過期 key；ARGV: run_id、n
+    SWAP_SCRIPT = """
+    if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+        return 0
+    end
+    local n = tonumber(ARGV[2])
+    for i = 2, n + 1 do
+        redis.call('RENAME', KEYS[i], KEYS[i + n])
+    end
+    for i = 2 * n + 2, #KEYS do
+        redis.call('DEL', KEYS[i])
+    end
+    redis.call('DEL', KEYS[1])
+    return 1
+    """
+
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    _background_rebuild = None
+    _background_lock = threading.Lock()
+
+    @classmethod
+    def breed_key(cls, slug: str) -> str:
+        return f'{cls.BREED_KEY_PREFIX}{slug}'
+
+    @classmethod
+    def add(cls, questions: list[Question]):
+        if not questions:
+            return
+        client = RedisService.get_client()
+        # 暫存 key 的名稱在這裡算好傳入 script，不在 Lua 中組出未宣告的 key
+        run_id = client.get(cls.REBUILD_LOCK_KEY)
+        run_id = run_id.decode() if run_id else ''
+        suffix = f'{cls.BUILDING_INFIX}{run_id}'
+        add_script = client.register_script(cls.ADD_SCRIPT)
+        pipe = client.pipeline(transaction=False)
+        for question in questions:
+            keys = [cls.REBUILD_LOCK_KEY, cls.BANK_KEY, cls.breed_key(question.breed_slug)]
+            if run_id:
+                keys += [f'{cls.BANK_KEY}{suffix}', f'{cls.breed_key(question.breed_slug)}{suffix}']
+            add_script(keys=keys, args=[str(question.id), run_id], client=pipe)
+        pipe.execute()
+
+    @classmethod
+    def size(cls, slug: str = None) -> int:
+        return RedisService.get_client().scard(cls.breed_key(slug) if slug else cls.BANK_KEY)
+
+    @classmethod
+    def random_question(cls, max_attempts: int = 3) -> Question | None:
+        return cls._random_question(cls.BANK_KEY, max_attempts)
+
+    @classmethod
+    def random_question_for_breed(cls, slug: str, max_attempts: int = 3) -> Question | None:
+        return cls._random_question(cls.breed_key(slug), max_attempts, slug=slug)
+
+    @classmethod
+    def random_ids(cls, count: int) -> list[str]:
+        client = RedisService.get_client()
+        if not client.exists(cls.BANK_KEY):
+            cls.rebuild_in_background()
+            return [str(question_id) for question_id in cls._fallback_ids(count)]
+        return [question_id.decode() for question_id in client.srandmember(cls.BANK_KEY, count)]
+
+    @classmethod
+    def random_ids_for_breeds(cls, slugs: list[str]) -> list[str | None]:
+        pipe = RedisService.get_client().pipeline(transaction=False)
+        for slug in slugs:
+            pipe.srandmember(cls.breed_key(slug))
+        return [question_id.decode() if question_id else None for question_id in pipe.execute()]
+
+    @classmethod
+    def _random_question(cls, key: str, max_attempts: int, slug: str = None) -> Question | None:
+        client = RedisService.get_client()
+        for _ in range(max_attempts):
+            question_id = client.srandmember(key)
+            if question_id is None:
+                # 只是該品種沒有題目的話就不必重建
+                if client.exists(cls.BANK_KEY):
+                    return None
+                cls.rebuild_in_background()
+                fallback_ids = cls._fallback_ids(1, slug=slug)
+                return Question.objects.filter(id=fallback_ids[0]).first() if fallback_ids else None
+
+            question = Question.objects.filter(id=question_id.decode()).first()
+            if question is not None:
+                return question
+            # 題目已被刪除，移除失效的 id
+            client.srem(key, question_id)
+            client.srem(cls.BANK_KEY, question_id)
+        return None
+
+    @classmethod
+    def _fallback_ids(cls, count: int, slug: str = None) -> list:
+        """
+        題庫重建完成前，從資料庫隨機位置取一段連續的題目 id（count + offset，不必對整張表隨機排序）
+        """
+        queryset = Question.objects.order_by('id')
+        if slug:
+            queryset = queryset.filter(breed_slug=slug)
+        total = queryset.count()
+        if total == 0:
+            return []
+        offset = random.randrange(max(total - count, 0) + 1)
+        return list(queryset.values_list('id', flat=True)[offset:offset + count])
+
+    @classmethod
+    def rebuild_in_background(cls):
+        # 每個 process 同時最多一個重建執行緒，跨 process 則由 rebuild 的鎖擋下
+        with cls._background_lock:
+            if cls._background_rebuild is not None and cls._background_rebuild.is_alive():
+                return
+            cls._background_rebuild = threading.Thread(target=cls._rebuild_quietly, name='question-bank-rebuild', daemon=True)
+            cls._background_rebuild.start()
+
+    @classmethod
+    def _rebuild_quietly(cls):
+        try:
+            cls.rebuild()
+        except Exception as e:
+            logger.error(f"背景重建本地題庫失敗: {str(e)}")
+        finally:
+            connection.close()
+
+    @classmethod
+    def _building_keys(cls, client, run_id: str = '*') -> list[str]:
+        return [
+            key.decode()
+            for pattern in (f'{cls.BANK_KEY}{cls.BUILDING_INFIX}{run_id}', f'{cls.BREED_KEY_PREFIX}*{cls.BUILDING_INFIX}{run_id}')
+            for key in client.scan_iter(match=pattern)
+        ]
+
+    @classmethod
+    def rebuild(cls, chunk_size: int = None) -> int | None:
+        """
+        從資料庫重建題庫，回傳題目數；已有其他重建在進行時回傳 None
+        """
+        chunk_size = chunk_size or cls.REBUILD_CHUNK_SIZE
+        client = RedisService.get_client()
+        run_id = uuid.uuid4().hex
+        if not client.set(cls.REBUILD_LOCK_KEY, run_id, nx=True, ex=cls.REBUILD_LOCK_TTL):
+            return None
+
+        try:
+            # 持有鎖時才清掉之前中斷留下的暫存 key
+            leftover_keys = cls._building_keys(client)
+            if leftover_keys:
+                client.delete(*leftover_keys)
+
+            suffix = f'{cls.BUILDING_INFIX}{run_id}'
+            total = 0
+            last_id = None
+            while True:
+                queryset = Question.objects.order_by('id')
+                if last_id is not None:
+                    queryset = queryset.filter(id__gt=last_id)
+                rows = list(queryset.values_list('id', 'breed_slug')[:chunk_size])
+                if not rows:
+                    break
+
+                pipe = client.pipeline(transaction=False)
+                pipe.sadd(f'{cls.BANK_KEY}{suffix}', *[str(question_id) for question_id, _ in rows])
+                for question_id, slug in rows:
+                    pipe.sadd(f'{cls.breed_key(slug)}{suffix}', str(question_id))
+                pipe.execute()
+
+                total += len(rows)
+                last_id = rows[-1][0]
+
+            swapped = cls._swap(client, run_id)
+        except Exception:
+            client.eval(cls.RELEASE_SCRIPT, 1, cls.REBUILD_LOCK_KEY, run_id)
+            raise
+
+        if not swapped:
+            # 鎖已過期並被其他重建接手，丟棄這次的結果
+            logger.warning("本地題庫重建逾時，鎖已被其他重建取得，捨棄本次結果")
+            building_keys = cls._building_keys(client, run_id)
+            if building_keys:
+                client.delete(*building_keys)
+            return None
+        return total
+
+    @classmethod
+    def _swap(cls, client, run_id: str) -> bool:
+        """
+        建好後在同一個 script 中換上並釋放鎖，讀取端不會看到半成品
+        """
+        suffix = f'{cls.BUILDING_INFIX}{run_id}'
+        building_keys = cls._building_keys(client, run_id)
+        live_keys = [key.removesuffix(suffix) for key in building_keys]
+        existing_keys = {key.decode() for key in client.scan_iter(match=f'{cls.BREED_KEY_PREFIX}*')
+                         if cls.BUILDING_INFIX not in key.decode()}
+        stale_keys = (existing_keys | {cls.BANK_KEY}) - set(live_keys)
+        return bool(client.eval(cls.SWAP_SCRIPT, 1 + len(building_keys) * 2 + len(stale_keys),
+                                cls.REBUILD_LOCK_KEY, *building_keys, *live_keys, *stale_keys,
+                                run_id, len(building_keys)))
@@ -0,0 +1,70 @@
+from api.models import Question
+from .redis import RedisService
+
+
+class QuestionPoolService:
+    """
+    預先準備好的題目池（Redis list 存放 Question id）
+    由背景任務 refill_question_pool 補充，請求路徑只需 LPOP
+    """
+    POOL_KEY = 'question_pool:ids'
+    REQUESTS_KEY = 'question_pool:requests'
+    MISSES_KEY = 'question_pool:misses'
+
+    @classmethod
+    def pop(cls) -> Question | None:
+        client = RedisService.get_client()
+        pipe = client.pipeline(transaction=False)
+        pipe.lpop(cls.POOL_KEY)
+        pipe.incr(cls.REQUESTS_KEY)
+        question_id, _ = pipe.execute()
+
+        question = None
+        if question_id is not None:
+            question = Question.objects.filter(id=question_id.decode()).first()
+
+        if question is None:
+            client.incr(cls.MISSES_KEY)
+        return question
+
+    @classmethod
+    def pop_many(cls, count: int) -> list[str]:
+        client = RedisService.get_client()
+        pipe = client.pipeline(transaction=False)
+        pipe.lpop(cls.POOL_KEY, count)
+        pipe.incrby(cls.REQUESTS_KEY, count)
+        question_ids, _ = pipe.execute()
+
+        question_ids = [question_id.decode() for question_id in question_ids or []]
+        if len(question_ids) < count:
+            client.incrby(cls.MISSES_KEY, count - len(question_ids))
+        return question_ids
+
+    @classmethod
+    def push(cls, question_ids: list) -> int:
+        if not question_ids:
+            return cls.depth()
+        return RedisService.get_client().rpush(cls.POOL_KEY, *[str(question_id) for question_id in question_ids])
+
+    @classmethod
+    def depth(cls) -> int:
+        return RedisService.get_client().llen(cls.POOL_KEY)
+
+    @classmethod
+    def stats(cls) -> dict:
+        client = RedisService.get_client()
+        pipe = client.pipeline(transaction=False)
+        pipe.llen(cls.POOL_KEY)
+        pipe.get(cls.REQUESTS_KEY)
+        pipe.get(cls.MISSES_KEY)
+        depth, requests, misses = pipe.execute()
+
+        requests = int(requests or 0)
+        misses = int(misses or 0)
+        hits = requests - misses
+        return {
+            'depth': depth,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / requests * 100, 2) if requests > 0 else 0.0,
+        }
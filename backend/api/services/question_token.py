@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from api.models import Question
+
+
+class QuestionTokenService:
+    """
+    把作答所需的資料（選項、回合）以 HMAC 簽章後交給前端，
+    AnswerView 只需在本地驗證，不必讀寫 Redis。
+    簽章只防竄改、不加密，所以 token 裡不放正解，只放 session|題目|回合|正解 的 HMAC，
+    驗證時逐一比對選項找出正解
+    """
+    SALT = 'api.question_token'
+    ANSWER_SALT = 'api.question_token.answer'
+
+    @classmethod
+    def answer_mac(cls, game_session_id, question_id, current_round: int, correct_slug: str) -> str:
+        return salted_hmac(cls.ANSWER_SALT, f'{game_session_id}|{question_id}|{current_round}|{correct_slug}').hexdigest()
+
+    @classmethod
+    def create_token(cls, game_session_id, question: Question, choices: list[dict], current_round: int) -> str:
+        payload = [
+            str(game_session_id),
+            str(question.id),
+            current_round,
+            [choice['slug'] for choice in choices],
+            question.image_url,
+            cls.answer_mac(game_session_id, question.id, current_round, question.breed_slug),
+        ]
+        return signing.dumps(payload, salt=cls.SALT, compress=True)
+
+    @classmethod
+    def read_token(cls, token: str, game_session_id, question_id) -> dict:
+        try:
+            payload = signing.loads(token, salt=cls.SALT, max_age=settings.QUESTION_TOKEN_MAX_AGE)
+        except signing.SignatureExpired:
+            raise ValueError('Question token has expired.')
+        except signing.BadSignature:
+            raise ValueError('Invalid question token.')
+
+        try:
+            token_session_id, token_question_id, current_round, choice_slugs, image_url, mac = payload
+        except (TypeError, ValueError):
+            raise ValueError('Invalid question token.')
+        if token_session_id != str(game_session_id) or token_question_id != str(question_id):
+            raise ValueError('Question token does not match this question.')
+
+        correct_slug = next((
+            slug for slug in choice_slugs
+            if constant_time_compare(mac, cls.answer_mac(token_session_id, token_question_id, current_round, slug))
+        ), None)
+        if correct_slug is None:
+            raise ValueError('Invalid question token.')
+
+        return {
+            'round': current_round,
+            'correct_slug': correct_slug,
+            'choices': [{'slug': slug} for slug in choice_slugs],
+            'image_url': image_url,
+        }
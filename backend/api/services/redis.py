@@ -1,10 +1,19 @@
 from django.core.cache import cache
+from django_redis import get_redis_connection
 
 class RedisService:
+    @classmethod
+    def get_client(cls):
+        return get_redis_connection('default')
+
     @classmethod
     def set(cls, key, value, ttl=600):
         cache.set(key, value, timeout=ttl)
 
+    @classmethod
+    def set_many(cls, data: dict, ttl=600):
+        cache.set_many(data, timeout=ttl)
+
     @classmethod
     def get(cls, key):
         return cache.get(key)
@@ -21,4 +30,4 @@ class RedisService:
 
     @classmethod
     def exists(cls, key):
-        return cache.get(key) is not None
\ No newline at end of file
+        return cache.get(key) is not None
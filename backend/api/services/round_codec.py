@@ -0,0 +1,83 @@
+import struct
+import uuid
+
+from api.models import Question
+from .breed import BreedService
+from .breed_catalog import BreedCatalogService
+
+
+class RoundCodec:
+    """
+    訪客回合紀錄的精簡二進位格式：
+    question uuid (16 bytes) + 選擇/正解品種 id + 是否答對 + 選項數 + 各選項品種 id，
+    品種以資料庫 id 存成 uint32，0 代表品種不存在，此時選擇的 slug 以 UTF-8 接在最後。
+    圖片網址與品種名稱到結算時才還原。
+    品種 id 在 load_breeds --clear 重建後會改變，解碼時找不到的 id 不會報錯：
+    選擇或正解的 slug 為 None，選項則略過
+    """
+    HEADER = struct.Struct('>16sIIBB')
+    BREED_ID = struct.Struct('>I')
+    UNKNOWN_BREED_ID = 0
+
+    @classmethod
+    def encode(cls, question_id, selected_slug: str, correct_slug: str, is_correct: bool, choices: list[dict]) -> bytes:
+        catalog = BreedCatalogService.get_catalog()
+        selected = catalog.get_by_slug(selected_slug)
+        choice_ids = [BreedService.get_breed_by_slug(choice['slug']).id for choice in choices]
+
+        parts = [
+            cls.HEADER.pack(
+                uuid.UUID(str(question_id)).bytes,
+                selected.id if selected else cls.UNKNOWN_BREED_ID,
+                BreedService.get_breed_by_slug(correct_slug).id,
+                1 if is_correct else 0,
+                len(choice_ids),
+            ),
+            struct.pack(f'>{len(choice_ids)}I', *choice_ids),
+        ]
+        if selected is None:
+            parts.append(selected_slug.encode())
+        return b''.join(parts)
+
+    @classmethod
+    def decode(cls, data: bytes) -> dict:
+        question_bytes, selected_id, correct_id, is_correct, num_choices = cls.HEADER.unpack_from(data)
+        offset = cls.HEADER.size
+        choice_ids = struct.unpack_from(f'>{num_choices}I', data, offset)
+        offset += num_choices * cls.BREED_ID.size
+
+        catalog = BreedCatalogService.get_catalog()
+        if selected_id == cls.UNKNOWN_BREED_ID:
+            selected_slug = data[offset:].decode()
+        else:
+            selected_slug = cls._slug(catalog, selected_id)
+
+        return {
+            'question_id': str(uuid.UUID(bytes=question_bytes)),
+            'selected_slug': selected_slug,
+            'correct_slug': cls._slug(catalog, correct_id),
+            'is_correct': bool(is_correct),
+            'score': is_correct,
+            'choices': [{'slug': slug} for slug in (cls._slug(catalog, breed_id) for breed_id in choice_ids) if slug],
+        }
+
+    @classmethod
+    def _slug(cls, catalog, breed_id: int) -> str | None:
+        breed = catalog.get_by_id(breed_id)
+        return breed.slug if breed else None
+
+    @classmethod
+    def decode_many(cls, entries: list[bytes]) -> list[dict]:
+        """
+        解碼整局紀錄，並以一次查詢補回各題的圖片網址
+        """
+        round_records = [cls.decode(entry) for entry in entries]
+        question_ids = {record['question_id'] for record in round_records}
+        image_urls = {
+            str(question_id): image_url
+            for question_id, image_url in Question.objects.filter(id__in=question_ids).values_list('id', 'image_url')
+        } if question_ids else {}
+
+        for record in round_records:
+            record['image_url'] = image_urls.get(record['question_id'], '')
+        return round_records
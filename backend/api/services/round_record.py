@@ -1,43 +1,32 @@
-from api.models import RoundRecord, Question, RoundRecordBreedChoice
+from api.models import RoundRecord
 from api.services.breed import BreedService
 
 
 class RoundRecordService:
     @classmethod
-    def log_record(cls, game_session_id: int, question_id: int, selected_slug: str, is_correct: bool, score: int, choices: list = []) -> RoundRecord:
-        correct_slug = Question.objects.get(id=question_id).answer.slug
-        
-        round_record = RoundRecord.objects.create(
+    def log_record(cls, game_session_id: int, question_id, selected_slug: str, correct_slug: str, is_correct: bool, score: int, choices: list = []) -> RoundRecord:
+        # 正解與選項都已在作答資料中，品種 id 由品種快照取得，不必再查資料庫
+        return RoundRecord.objects.create(
             game_session_id=game_session_id,
             question_id=question_id,
             selected_slug=selected_slug,
             correct_slug=correct_slug,
             is_correct=is_correct,
             score=score,
+            choice_breed_ids=cls.choice_breed_ids(choice['slug'] for choice in choices),
         )
-        
-        for choice in choices:
-            RoundRecordBreedChoice.objects.create(
-                round_record=round_record,
-                breed=BreedService.get_breed_by_slug(choice['slug']),
-                slug=choice['slug']
-            )
-        
-        return round_record
+    
+    @classmethod
+    def choice_breed_ids(cls, slugs) -> list[int]:
+        return [BreedService.get_breed_by_slug(slug).id for slug in slugs]
     
     @classmethod
     def process_record_choices(cls, choices: list[dict], lang='en') -> list[dict]:
         processed_choices = []
         for choice in choices:
             breed = BreedService.get_breed_by_slug(choice['slug'])
-            if lang == 'zh':
-                processed_choices.append({
-                    'slug': choice['slug'],
-                    'name': breed.name_zh
-                })
-            else:
-                processed_choices.append({
-                    'slug': choice['slug'],
-                    'name': breed.name_en
-                })
+            processed_choices.append({
+                'slug': choice['slug'],
+                'name': breed.name(lang)
+            })
         return processed_choices
\ No newline at end of file
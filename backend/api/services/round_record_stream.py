@@ -0,0 +1,230 @@
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from redis.exceptions import ResponseError
+
+from api.models import GameSession, Question, RoundRecord
+from .redis import RedisService
+from .round_record import RoundRecordService
+
+logger = logging.getLogger(__name__)
+
+
+class RoundRecordStreamService:
+    """
+    回合紀錄延後寫入：AnswerView 只把作答事件 XADD 到 Redis Stream，
+    由 process_round_records（可多個 process 同時跑）以 consumer group 批次寫入資料庫。
+    每局另有待寫入計數，結算前等它歸零，確保結果完整。
+    無法寫入的事件（例如題目已被刪除）移到 dead-letter stream，不會卡住同一批的其他事件。
+    """
+    STREAM_KEY = 'round_records:stream'
+    DEAD_LETTER_KEY = 'round_records:dead'
+    DEAD_LETTER_MAXLEN = 10000
+    GROUP = 'round_record_writers'
+    PENDING_KEY_PREFIX = 'round_records:pending:'
+    ENTRIES_KEY_PREFIX = 'round_records:entries:'
+    PENDING_TTL = 3600
+
+    # XADD 並記下該局的事件 id，結算時只需處理自己這局的事件
+    ENQUEUE_SCRIPT = """
+    local entry_id = redis.call('XADD', KEYS[1], '*', unpack(ARGV, 2))
+    redis.call('INCR', KEYS[2])
+    redis.call('EXPIRE', KEYS[2], ARGV[1])
+    redis.call('RPUSH', KEYS[3], entry_id)
+    redis.call('EXPIRE', KEYS[3], ARGV[1])
+    return entry_id
+    """
+
+    # key 已過期時不遞減（避免留下沒有 TTL 的負數），歸零就刪除
+    DECR_PENDING_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return 0
+    end
+    local remaining = redis.call('DECR', KEYS[1])
+    if remaining <= 0 then
+        redis.call('DEL', KEYS[1])
+    end
+    return remaining
+    """
+
+    @classmethod
+    def pending_key(cls, game_session_id) -> str:
+        return f'{cls.PENDING_KEY_PREFIX}{game_session_id}'
+
+    @classmethod
+    def entries_key(cls, game_session_id) -> str:
+        return f'{cls.ENTRIES_KEY_PREFIX}{game_session_id}'
+
+    @classmethod
+    def enqueue(cls, game_session_id, question_id, selected_slug: str, correct_slug: str,
+                is_correct: bool, score: int, choices: list[dict]):
+        fields = {
+            'game_session_id': str(game_session_id),
+            'question_id': str(question_id),
+            'selected_slug': selected_slug,
+            'correct_slug': correct_slug,
+            'is_correct': 1 if is_correct else 0,
+            'score': score,
+            'choices': ','.join(choice['slug'] for choice in choices),
+        }
+        RedisService.get_client().eval(
+            cls.ENQUEUE_SCRIPT, 3, cls.STREAM_KEY, cls.pending_key(game_session_id), cls.entries_key(game_session_id),
+            cls.PENDING_TTL, *[item for field in fields.items() for item in field])
+
+    @classmethod
+    def pending_count(cls, game_session_id) -> int:
+        return int(RedisService.get_client().get(cls.pending_key(game_session_id)) or 0)
+
+    @classmethod
+    def ensure_group(cls):
+        try:
+            RedisService.get_client().xgroup_create(cls.STREAM_KEY, cls.GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    @classmethod
+    def process_batch(cls, consumer: str, count: int = None, block_ms: int = None) -> int:
+        """
+        先接手閒置過久的 pending 事件（其他 consumer 當掉留下的），再讀新事件；
+        寫入資料庫後才 XACK。回傳處理的事件數。
+        """
+        count = count or settings.ROUND_RECORD_STREAM_BATCH_SIZE
+        client = RedisService.get_client()
+
+        claimed = client.xautoclaim(cls.STREAM_KEY, cls.GROUP, consumer,
+                                    min_idle_time=settings.ROUND_RECORD_STREAM_CLAIM_IDLE_MS,
+                                    start_id='0-0', count=count)
+        reclaimed_entries = [(entry_id, fields) for entry_id, fields in claimed[1] if fields]
+
+        new_entries = []
+        if len(reclaimed_entries) < count:
+            response = client.xreadgroup(cls.GROUP, consumer, {cls.STREAM_KEY: '>'},
+                                         count=count - len(reclaimed_entries),
+                                         block=block_ms if not reclaimed_entries else None)
+            new_entries = response[0][1] if response else []
+
+        entries = reclaimed_entries + new_entries
+        if not entries:
+            return 0
+
+        return cls._handle(client, entries)
+
+    @classmethod
+    def _handle(cls, client, entries: list) -> int:
+        """
+        寫入並結束一批事件：無法寫入的移到 dead-letter，其餘 ACK 後從 stream 刪除並遞減各局的待寫入計數
+        """
+        events = [(entry_id.decode(), {key.decode(): value.decode() for key, value in fields.items()})
+                  for entry_id, fields in entries]
+        failed = cls._write(events)
+
+        pipe = client.pipeline(transaction=False)
+        for entry_id, event in events:
+            if entry_id in failed:
+                logger.warning(f"回合紀錄事件 {entry_id} 無法寫入，移到 dead-letter: {failed[entry_id]}")
+                pipe.xadd(cls.DEAD_LETTER_KEY, {**event, 'entry_id': entry_id, 'error': failed[entry_id][:500]},
+                          maxlen=cls.DEAD_LETTER_MAXLEN, approximate=True)
+        pipe.xack(cls.STREAM_KEY, cls.GROUP, *[entry_id for entry_id, _ in events])
+        pipe.xdel(cls.STREAM_KEY, *[entry_id for entry_id, _ in events])
+        for entry_id, event in events:
+            pipe.eval(cls.DECR_PENDING_SCRIPT, 1, cls.pending_key(event.get('game_session_id')))
+            pipe.lrem(cls.entries_key(event.get('game_session_id')), 1, entry_id)
+        pipe.execute()
+        return len(events)
+
+    @classmethod
+    def _write(cls, events: list[tuple[str, dict]]) -> dict[str, str]:
+        """
+        寫入資料庫，回傳無法寫入的事件 {entry_id: 原因}。
+        以 stream_entry_id 去重，接手的事件即使已由當掉的 consumer 寫入也不會重複
+        """
+        failed = {}
+        parsed = []
+        for entry_id, event in events:
+            try:
+                parsed.append((entry_id, int(event['game_session_id']), uuid.UUID(event['question_id']), event))
+            except (KeyError, ValueError) as e:
+                failed[entry_id] = f'Malformed event: {e!r}'
+
+        session_ids = {game_session_id for _, game_session_id, _, _ in parsed}
+        # 遊戲已被中止刪除的事件直接丟棄
+        existing_sessions = set(GameSession.objects.filter(id__in=session_ids).values_list('id', flat=True))
+        existing_questions = set(Question.objects.filter(
+            id__in={question_id for _, _, question_id, _ in parsed}).values_list('id', flat=True))
+
+        records = []
+        for entry_id, game_session_id, question_id, event in parsed:
+            if game_session_id not in existing_sessions:
+                continue
+            try:
+                if question_id not in existing_questions:
+                    raise ValueError(f'Question "{question_id}" not found.')
+                records.append(RoundRecord(
+                    game_session_id=game_session_id,
+                    question_id=question_id,
+                    selected_slug=event['selected_slug'],
+                    correct_slug=event['correct_slug'],
+                    is_correct=event['is_correct'] == '1',
+                    score=int(event['score']),
+                    choice_breed_ids=RoundRecordService.choice_breed_ids(slug for slug in event['choices'].split(',') if slug),
+                    stream_entry_id=entry_id,
+                ))
+            except (KeyError, ValueError) as e:
+                failed[entry_id] = str(e)
+
+        if not records:
+            return failed
+        try:
+            with transaction.atomic():
+                RoundRecord.objects.bulk_create(records, ignore_conflicts=True)
+        except DatabaseError:
+            # 整批失敗時逐筆寫入，找出有問題的事件
+            for record in records:
+                try:
+                    with transaction.atomic():
+                        RoundRecord.objects.bulk_create([record], ignore_conflicts=True)
+                except DatabaseError as e:
+                    failed[record.stream_entry_id] = str(e)
+        return failed
+
+    @classmethod
+    def flush_session(cls, game_session_id) -> int:
+        """
+        只寫入該局還留在 stream 中的事件（依 enqueue 時記下的 id 逐筆 XRANGE），不處理其他局的事件。
+        worker 同時處理到同一筆時，資料庫以 stream_entry_id 去重
+        """
+        client = RedisService.get_client()
+        entry_ids = client.lrange(cls.entries_key(game_session_id), 0, -1)
+        if not entry_ids:
+            return 0
+
+        pipe = client.pipeline(transaction=False)
+        for entry_id in entry_ids:
+            pipe.xrange(cls.STREAM_KEY, min=entry_id, max=entry_id)
+        entries = [result[0] for result in pipe.execute() if result]
+        if not entries:
+            # 事件都已被 worker 處理完，只剩還沒移除的 id
+            client.delete(cls.entries_key(game_session_id))
+            return 0
+        return cls._handle(client, entries)
+
+    @classmethod
+    def wait_for_session(cls, game_session_id, timeout: float = None) -> bool:
+        """
+        等待該局的事件全部寫入；等待期間自己寫入這局的事件，不必依賴背景 worker，
+        也不受其他局的積壓影響
+        """
+        if cls.pending_count(game_session_id) == 0:
+            return True
+
+        deadline = time.monotonic() + (settings.ROUND_RECORD_FLUSH_TIMEOUT if timeout is None else timeout)
+        while cls.pending_count(game_session_id) > 0:
+            if time.monotonic() >= deadline:
+                return False
+            if cls.flush_session(game_session_id) == 0:
+                time.sleep(0.05)
+        return True
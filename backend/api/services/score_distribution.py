@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from .counter import CounterService
+from .redis import RedisService
+
+logger = logging.getLogger(__name__)
+
+
+class ScoreDistributionService:
+    """
+    各回合數的分數分布：分數只可能是 0..回合數，每個分數一格，直接以 Redis hash 精確計數。
+    結算時經 CounterService 在各 worker 累加後以 HINCRBY 合併；
+    查詢時使用各 process 快取的累積分布（CDF），計算百分位只需一次索引
+    """
+    KEY_PREFIX = 'score_histogram:'
+
+    _cdfs = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def key(cls, rounds: int) -> str:
+        return f'{cls.KEY_PREFIX}r{rounds}'
+
+    @classmethod
+    def record(cls, score: int, rounds: int) -> bool:
+        """
+        把一局的分數加入分布；分數不在 0..回合數 之間代表資料有誤，記錄後略過，不寫入分布
+        """
+        if rounds <= 0:
+            return False
+        if not 0 <= score <= rounds:
+            logger.warning(f"分數 {score} 超出 0..{rounds} 的範圍，不計入分數分布")
+            return False
+        CounterService.hincr_many(cls.key(rounds), {str(score): 1}, ttl=None)
+        return True
+
+    @classmethod
+    def get_cdf(cls, rounds: int) -> list[int]:
+        """
+        回傳長度 rounds + 2 的累積次數，cdf[s] 為分數低於 s 的局數，cdf[-1] 為總局數
+        """
+        cached = cls._cdfs.get(rounds)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        histogram = RedisService.get_client().hgetall(cls.key(rounds))
+        counts = [0] * (rounds + 1)
+        for score, count in histogram.items():
+            score = int(score)
+            if 0 <= score <= rounds:
+                counts[score] += int(count)
+        cdf = [0]
+        for count in counts:
+            cdf.append(cdf[-1] + count)
+
+        with cls._lock:
+            cls._cdfs[rounds] = (time.monotonic() + settings.SCORE_PERCENTILE_CACHE_SECONDS, cdf)
+        return cdf
+
+    @classmethod
+    def percentile(cls, score: int, rounds: int) -> float | None:
+        """
+        同回合數的已結算遊戲中，分數低於 score 的比例（%）；還沒有資料時回傳 None
+        """
+        if rounds <= 0:
+            return None
+        cdf = cls.get_cdf(rounds)
+        if cdf[-1] == 0:
+            return None
+        return round(cdf[min(max(score, 0), rounds)] / cdf[-1] * 100, 2)
+
+    @classmethod
+    def clear_cache(cls):
+        with cls._lock:
+            cls._cdfs = {}
@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.models import BreedStatBucket, GlobalStatBucket
+from .breed import BreedService
+from .breed_catalog import BreedCatalogService
+from .counter import CounterService
+
+
+class StatRollupService:
+    """
+    分時段統計：結算時把局數、回合數、答對數與各品種作答數累加到當小時的 Redis hash，
+    定時同步任務取出後 upsert 到每小時與每日的 bucket 表（UTC），趨勢查詢只需加總有限個 bucket
+    """
+    KEY_PREFIX = 'stats_rollup:'
+    MAX_BUCKETS = {
+        GlobalStatBucket.HOUR: 24 * 31,
+        GlobalStatBucket.DAY: 366,
+    }
+    BUCKET_SIZES = {
+        GlobalStatBucket.HOUR: timedelta(hours=1),
+        GlobalStatBucket.DAY: timedelta(days=1),
+    }
+
+    @classmethod
+    def hour_key(cls, hour_start: datetime) -> str:
+        return f'{cls.KEY_PREFIX}{hour_start.astimezone(dt_timezone.utc):%Y%m%d%H}'
+
+    @classmethod
+    def truncate(cls, moment: datetime, granularity: str) -> datetime:
+        moment = moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+        if granularity == GlobalStatBucket.DAY:
+            moment = moment.replace(hour=0)
+        return moment
+
+    @classmethod
+    def record_game(cls, stats: dict, moment: datetime = None):
+        fields = {
+            'games': stats.get('total_games', 0),
+            'rounds': stats.get('total_rounds', 0),
+            'correct': stats.get('total_correct', 0),
+        }
+        for slug, breed_stat in stats.get('breed_stats', {}).items():
+            fields[f'a:{slug}'] = breed_stat.get('attempts', 0)
+            fields[f'c:{slug}'] = breed_stat.get('successes', 0)
+        hour_start = cls.truncate(moment or timezone.now(), GlobalStatBucket.HOUR)
+        CounterService.hincr_many(cls.hour_key(hour_start), fields)
+
+    @classmethod
+    def sync(cls, now: datetime = None) -> int:
+        """
+        取出最近 STATS_ROLLUP_LOOKBACK_HOURS 小時的 hash 並寫入 bucket 表，回傳處理的小時數
+        """
+        current_hour = cls.truncate(now or timezone.now(), GlobalStatBucket.HOUR)
+        hours = {
+            cls.hour_key(current_hour - timedelta(hours=offset)): current_hour - timedelta(hours=offset)
+            for offset in range(settings.STATS_ROLLUP_LOOKBACK_HOURS + 1)
+        }
+        drained = CounterService.drain_hashes(list(hours))
+        if not drained:
+            return 0
+
+        try:
+            cls._apply({hours[key]: fields for key, fields in drained.items()})
+        except Exception:
+            CounterService.restore_hashes(drained)
+            raise
+        return len(drained)
+
+    @classmethod
+    def _apply(cls, drained: dict[datetime, dict[str, int]]):
+        global_rows = {}
+        breed_rows = {}
+        for hour_start, fields in drained.items():
+            for granularity in (GlobalStatBucket.HOUR, GlobalStatBucket.DAY):
+                bucket_start = cls.truncate(hour_start, granularity)
+                totals = global_rows.setdefault((granularity, bucket_start), [0, 0, 0])
+                totals[0] += fields.get('games', 0)
+                totals[1] += fields.get('rounds', 0)
+                totals[2] += fields.get('correct', 0)
+
+                for field, amount in fields.items():
+                    if field[:2] not in ('a:', 'c:'):
+                        continue
+                    breed = BreedCatalogService.get_catalog().get_by_slug(field[2:])
+                    if breed is None:
+                        continue
+                    totals = breed_rows.setdefault((granularity, bucket_start, breed.id), [0, 0])
+                    totals[0 if field[0] == 'a' else 1] += amount
+
+        with transaction.atomic():
+            cls.upsert_add(GlobalStatBucket, ['granularity', 'bucket_start'], ['games', 'rounds', 'correct'],
+                            [(*key, *totals) for key, totals in global_rows.items()])
+            cls.upsert_add(BreedStatBucket, ['granularity', 'bucket_start', 'breed'], ['attempts', 'correct'],
+                            [(*key, *totals) for key, totals in breed_rows.items()])
+
+    @classmethod
+    def upsert_add(cls, model, unique_fields: list[str], sum_fields: list[str], rows: list[tuple]):
+        """
+        INSERT ... ON CONFLICT DO UPDATE，衝突時把數值加到既有的 bucket 上
+        （bulk_create 的 update_conflicts 只能覆寫，不能累加）
+        """
+        if not rows:
+            return
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        unique_columns = [quote(model._meta.get_field(field).column) for field in unique_fields]
+        sum_columns = [quote(model._meta.get_field(field).column) for field in sum_fields]
+        columns = unique_columns + sum_columns
+        placeholders = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(rows))
+        updates = ', '.join(f'{column} = {table}.{column} + EXCLUDED.{column}' for column in sum_columns)
+        sql = (
+            f'INSERT INTO {table} ({", ".join(columns)}) VALUES {placeholders} '
+            f'ON CONFLICT ({", ".join(unique_columns)}) DO UPDATE SET {updates}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for row in rows for value in row])
+
+    @classmethod
+    def trends(cls, granularity: str, start: datetime, end: datetime, breed_slug: str = None) -> dict:
+        """
+        加總 [start, end) 之間的 bucket；區間超過 MAX_BUCKETS 個 bucket 時丟出 ValueError
+        """
+        if granularity not in cls.MAX_BUCKETS:
+            raise ValueError(f'granularity must be one of {", ".join(cls.MAX_BUCKETS)}')
+        start = cls.truncate(start, granularity)
+        step = cls.BUCKET_SIZES[granularity]
+        bucket_starts = []
+        bucket_start = start
+        while bucket_start < end:
+            bucket_starts.append(bucket_start)
+            if len(bucket_starts) > cls.MAX_BUCKETS[granularity]:
+                raise ValueError(f'At most {cls.MAX_BUCKETS[granularity]} {granularity} buckets can be requested.')
+            bucket_start += step
+
+        if breed_slug:
+            breed = BreedService.get_breed_by_slug(breed_slug)
+            fields = ['attempts', 'correct']
+            queryset = BreedStatBucket.objects.filter(breed_id=breed.id)
+        else:
+            fields = ['games', 'rounds', 'correct']
+            queryset = GlobalStatBucket.objects.all()
+        rows = {
+            row['bucket_start']: row
+            for row in queryset.filter(granularity=granularity, bucket_start__gte=start, bucket_start__lt=end)
+            .values('bucket_start', *fields)
+        }
+
+        # 沒有資料的時段補 0，方便前端畫圖
+        buckets = []
+        for bucket_start in bucket_starts:
+            row = rows.get(bucket_start, {})
+            buckets.append({'bucket_start': bucket_start, **{field: row.get(field, 0) for field in fields}})
+        totals = {field: sum(bucket[field] for bucket in buckets) for field in fields}
+        attempts = totals['attempts'] if breed_slug else totals['rounds']
+        totals['accuracy'] = round(totals['correct'] / attempts * 100, 2) if attempts else 0.0
+
+        return {
+            'granularity': granularity,
+            'start': start,
+            'end': end,
+            'breed': breed_slug,
+            'totals': totals,
+            'buckets': buckets,
+        }
@@ -0,0 +1,21 @@
+"""
+維護全站玩家數：新增或刪除使用者時累加計數，由定時同步任務寫入 GlobalStat.total_players
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.services import CounterService
+
+PLAYER_COUNT_KEY = 'global:count:players'
+
+
+@receiver(post_save, sender=User)
+def count_new_player(sender, instance, created, **kwargs):
+    if created:
+        CounterService.incr(PLAYER_COUNT_KEY, 1)
+
+
+@receiver(post_delete, sender=User)
+def count_deleted_player(sender, instance, **kwargs):
+    CounterService.incr(PLAYER_COUNT_KEY, -1)
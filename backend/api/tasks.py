@@ -1,8 +1,10 @@
 """
 定時任務：同步 Redis 數據到資料庫
 """
-from django.core.cache import cache
+from django.conf import settings
 from django.db import transaction
+from django.db.models import BooleanField, Case, F, FloatField, ExpressionWrapper, Q, Value, When, Window
+from django.db.models.functions import Cast, RowNumber
 from django.utils import timezone
 from api.models import Breed, HardestBreedStat, GlobalStat
 import logging
@@ -13,80 +15,80 @@ logger = logging.getLogger(__name__)
 def sync_redis_data_to_db():
     sync_game_count_from_redis()
     sync_breed_stats_from_redis()
+    sync_stat_rollups()
+    sync_breed_confusions()
     calculate_global_avg_accuracy()
     calculate_hardest_breeds()
+    rebuild_difficulty_tables()
+    rebuild_global_stats_snapshot()
     
 def sync_game_count_from_redis():
-    total_games_key = 'global:count:games'
-    total_rounds_key = 'global:count:rounds'
-    total_correct_key = 'global:count:correct'
+    """
+    原子地取出 Redis 中的全局計數並以 F() 累加到 GlobalStat，
+    取出與清空在同一個 Lua script 中完成，同步期間的新計數不會遺失
+    """
+    from api.services import CounterService
     
-    redis_total_games = cache.get(total_games_key) or 0
-    redis_total_rounds = cache.get(total_rounds_key) or 0
-    redis_total_correct = cache.get(total_correct_key) or 0
-    global_stat, created = GlobalStat.objects.get_or_create(id=1)
+    counter_fields = {
+        'global:count:games': 'total_games',
+        'global:count:rounds': 'total_rounds',
+        'global:count:correct': 'total_correct',
+        'global:count:players': 'total_players',
+    }
     
-    if redis_total_games > 0 or redis_total_rounds > 0 or redis_total_correct > 0:
-        with transaction.atomic():
-            global_stat, created = GlobalStat.objects.get_or_create(id=1)
-            if redis_total_games > 0:
-                global_stat.total_games += redis_total_games
-                cache.delete(total_games_key)
-            if redis_total_rounds > 0:
-                global_stat.total_rounds += redis_total_rounds
-                cache.delete(total_rounds_key)
-            if redis_total_correct > 0:
-                global_stat.total_correct += redis_total_correct
-                cache.delete(total_correct_key)
-                
-            global_stat.save(update_fields=['total_games', 'total_rounds', 'total_correct'])
-            
-        logger.info(f"同步全局遊戲數據: total_games +{redis_total_games}, total_rounds +{redis_total_rounds}, total_correct +{redis_total_correct}")
-            
-    cache.set('global:stats:total_games', global_stat.total_games)
-    cache.set('global:stats:total_rounds', global_stat.total_rounds)
-    cache.set('global:stats:total_correct', global_stat.total_correct)        
+    GlobalStat.objects.get_or_create(id=1)
+    drained = CounterService.drain(list(counter_fields))
+    if drained:
+        try:
+            GlobalStat.objects.filter(id=1).update(**{
+                counter_fields[key]: F(counter_fields[key]) + amount for key, amount in drained.items()
+            })
+        except Exception:
+            CounterService.restore(drained)
+            raise
+        
+        logger.info(
+            f"同步全局遊戲數據: total_games +{drained.get('global:count:games', 0)}, "
+            f"total_rounds +{drained.get('global:count:rounds', 0)}, total_correct +{drained.get('global:count:correct', 0)}, "
+            f"total_players +{drained.get('global:count:players', 0)}"
+        )
     
 def sync_breed_stats_from_redis():
     """
     從 Redis 同步品種統計數據到資料庫
-    每半小時執行一次
+    所有品種的計數一次原子取出，再以一次 bulk_update（F() 累加）寫入
     """
+    from api.services import BreedCatalogService, CounterService
+    
     logger.info("開始同步 Redis 品種統計數據...")
     
     try:
-        # 獲取所有品種
-        breeds = Breed.objects.all()
-        updated_count = 0
+        catalog = BreedCatalogService.get_catalog()
+        # Redis key 格式: breed:{slug}:attempts 和 breed:{slug}:correct
+        keys = [key for breed in catalog.entries for key in (f"breed:{breed.slug}:attempts", f"breed:{breed.slug}:correct")]
+        drained = CounterService.drain(keys)
         
-        with transaction.atomic():
-            for breed in breeds:
-                # Redis key 格式: breed:{slug}:attempts 和 breed:{slug}:correct
-                attempts_key = f"breed:{breed.slug}:attempts"
-                correct_key = f"breed:{breed.slug}:correct"
-                
-                # 從 Redis 獲取數據
-                redis_attempts = cache.get(attempts_key) or 0
-                redis_correct = cache.get(correct_key) or 0
-                
-                # 如果 Redis 中有新數據，則更新到資料庫
-                if redis_attempts > 0 or redis_correct > 0:
-                    # 累加到資料庫
-                    breed.total_attempts += redis_attempts
-                    breed.correct_attempts += redis_correct
-                    breed.save(update_fields=['total_attempts', 'correct_attempts'])
-                    
-                    # 清空 Redis 計數器（已同步到資料庫）
-                    cache.delete(attempts_key)
-                    cache.delete(correct_key)
-                    
-                    updated_count += 1
-                    logger.debug(
-                        f"更新品種 {breed.slug}: "
-                        f"attempts +{redis_attempts}, correct +{redis_correct}"
-                    )
+        breeds = []
+        for breed in catalog.entries:
+            attempts = drained.get(f"breed:{breed.slug}:attempts", 0)
+            correct = drained.get(f"breed:{breed.slug}:correct", 0)
+            if attempts or correct:
+                breeds.append(Breed(
+                    id=breed.id,
+                    total_attempts=F('total_attempts') + attempts,
+                    correct_attempts=F('correct_attempts') + correct,
+                ))
+                logger.debug(f"更新品種 {breed.slug}: attempts +{attempts}, correct +{correct}")
+        
+        if breeds:
+            try:
+                Breed.objects.bulk_update(breeds, ['total_attempts', 'correct_attempts'])
+            except Exception:
+                # 寫入失敗時把取出的計數加回 Redis，下次再同步
+                CounterService.restore(drained)
+                raise
         
-        logger.info(f"同步完成！共更新 {updated_count} 個品種")
+        logger.info(f"同步完成！共更新 {len(breeds)} 個品種")
         
     except Exception as e:
         logger.error(f"同步品種統計數據時發生錯誤: {str(e)}", exc_info=True)
@@ -96,93 +98,151 @@ def sync_breed_stats_from_redis():
 def calculate_global_avg_accuracy():
     pass
     
-def calculate_hardest_breeds(top_n=10):
+# 最難品種排行的各種變體：min_attempts 為納入排名的最少作答數，
+# lang 指定時只納入有該語言名稱的品種
+HARDEST_BREED_VARIANTS = {
+    'default': {'top_n': 10, 'min_attempts': 10},
+    'zh': {'top_n': 10, 'min_attempts': 10, 'lang': 'zh'},
+    'min_50': {'top_n': 10, 'min_attempts': 50},
+}
+
+
+def calculate_hardest_breeds(variants=None):
     """
-    計算並更新最難猜測的品種排名
-    基於正確率（correct_attempts / total_attempts）
+    計算並更新最難猜測的品種排名（正確率 correct_attempts / total_attempts 越低越難）
+    所有變體的排名在同一個查詢中以 window function 算出，
+    再依 (variant, rank) upsert，讀取端不會看到清空中的排行
     """
+    variants = variants or HARDEST_BREED_VARIANTS
     logger.info("開始計算最難品種統計...")
-    print("=" * 60)
-    print("開始計算最難品種統計...")
     
     try:
-        # 獲取所有有嘗試記錄的品種，並計算正確率
-        breeds_with_stats = Breed.objects.filter(
-            total_attempts__gt=0
-        ).annotate(
-            # 使用 F 表達式計算正確率
-            # correct_rate = correct_attempts / total_attempts
-        ).values(
-            'id',
-            'slug', 
-            'name_en',
-            'name_zh',
-            'total_attempts',
-            'correct_attempts'
+        correct_rate = ExpressionWrapper(
+            Cast('correct_attempts', FloatField()) * 100.0 / F('total_attempts'), output_field=FloatField()
         )
+        rank_annotations = {}
+        for name, variant in variants.items():
+            eligible = Q(total_attempts__gte=variant['min_attempts'])
+            if variant.get('lang') == 'zh':
+                eligible &= Q(name_zh__isnull=False)
+            # 以是否符合條件分區，符合條件的那一區內的排名即為該變體的排名
+            rank_annotations[f'eligible_{name}'] = Case(When(eligible, then=Value(True)), default=Value(False), output_field=BooleanField())
+            rank_annotations[f'rank_{name}'] = Window(
+                expression=RowNumber(),
+                partition_by=[F(f'eligible_{name}')],
+                order_by=[F('correct_rate').asc(), F('id').asc()],
+            )
         
-        print(f"找到 {len(breeds_with_stats)} 個有嘗試記錄的品種")
-        
-        # 計算正確率並排序（正確率越低越難）
-        breeds_stats = []
-        for breed in breeds_with_stats:
-            if breed['total_attempts'] > 0:
-                correct_rate = (breed['correct_attempts'] / breed['total_attempts']) * 100
-                breeds_stats.append({
-                    'breed_id': breed['id'],
-                    'slug': breed['slug'],
-                    'correct_rate': correct_rate,
-                    'total_attempts': breed['total_attempts']
-                })
-        
-        # 按正確率升序排序（最難的在前面）
-        # 同時考慮最小嘗試次數（避免樣本太少的品種）
-        MIN_ATTEMPTS = 10  # 至少需要 10 次嘗試才納入排名
-        breeds_stats = [b for b in breeds_stats if b['total_attempts'] >= MIN_ATTEMPTS]
-        breeds_stats.sort(key=lambda x: x['correct_rate'])
+        rows = list(
+            Breed.objects.filter(total_attempts__gte=min(variant['min_attempts'] for variant in variants.values()))
+            .annotate(correct_rate=correct_rate)
+            .annotate(**rank_annotations)
+            .order_by()
+            .values('id', 'slug', 'correct_rate', *rank_annotations)
+        )
         
-        print(f"符合最小嘗試次數 (>={MIN_ATTEMPTS}) 的品種: {len(breeds_stats)}")
+        hardest_stats = []
+        for name, variant in variants.items():
+            ranked = sorted(
+                (row for row in rows if row[f'eligible_{name}'] and row[f'rank_{name}'] <= variant['top_n']),
+                key=lambda row: row[f'rank_{name}'],
+            )
+            hardest_stats += [
+                HardestBreedStat(variant=name, rank=row[f'rank_{name}'], breed_id=row['id'], correct_rate=row['correct_rate'])
+                for row in ranked
+            ]
+            logger.info(f"[{name}] 前 {len(ranked)} 個最難品種: " + ", ".join(
+                f"{row['slug']} ({row['correct_rate']:.1f}%)" for row in ranked
+            ))
+            if not ranked:
+                logger.warning(f"[{name}] 沒有足夠的數據來計算最難品種排名")
         
-        # 更新 HardestBreedStat 表
         with transaction.atomic():
-            # 清空舊數據
-            deleted_count = HardestBreedStat.objects.count()
-            HardestBreedStat.objects.all().delete()
-            print(f"已刪除 {deleted_count} 筆舊排名資料")
-            
-            # 插入新的排名
-            hardest_stats = []
-            for rank, breed_stat in enumerate(breeds_stats[:top_n], start=1):
-                hardest_stats.append(
-                    HardestBreedStat(
-                        rank=rank,
-                        breed_id=breed_stat['breed_id'],
-                        correct_rate=breed_stat['correct_rate']
-                    )
-                )
-            
-            # 批量創建
             if hardest_stats:
-                HardestBreedStat.objects.bulk_create(hardest_stats)
-                logger.info(f"已更新前 {len(hardest_stats)} 個最難品種排名")
-                print(f"\n✓ 已更新前 {len(hardest_stats)} 個最難品種排名:")
-                print("-" * 60)
-                for i, stat in enumerate(hardest_stats, 1):
-                    breed = Breed.objects.get(id=stat.breed_id)
-                    print(f"  {i}. {breed.slug:30} | 正確率: {stat.correct_rate:5.1f}%")
-                print("-" * 60)
-            else:
-                logger.warning("沒有足夠的數據來計算最難品種排名")
-                print("⚠ 沒有足夠的數據來計算最難品種排名")
+                HardestBreedStat.objects.bulk_create(
+                    hardest_stats,
+                    update_conflicts=True,
+                    unique_fields=['variant', 'rank'],
+                    update_fields=['breed', 'correct_rate'],
+                )
+            # 移除名次已不存在（符合條件的品種變少）或已停用的變體
+            stale = ~Q(variant__in=list(variants))
+            for name in variants:
+                ranked_count = sum(1 for stat in hardest_stats if stat.variant == name)
+                stale |= Q(variant=name, rank__gt=ranked_count)
+            HardestBreedStat.objects.filter(stale).delete()
         
-        print("=" * 60)
+        logger.info(f"已更新 {len(variants)} 種最難品種排名，共 {len(hardest_stats)} 筆")
         
     except Exception as e:
         logger.error(f"計算最難品種統計時發生錯誤: {str(e)}", exc_info=True)
-        print(f"✗ 錯誤: {str(e)}")
         raise
 
 
+def sync_stat_rollups():
+    """
+    把 Redis 中各小時的統計 hash 累加到每小時、每日的 bucket 表
+    """
+    from api.services import StatRollupService
+    
+    hours = StatRollupService.sync()
+    if hours:
+        logger.info(f"同步分時段統計: {hours} 個小時")
+
+
+def sync_breed_confusions():
+    """
+    把 Redis 中累積的品種混淆次數累加到 BreedConfusion，並更新各品種的前 N 名
+    """
+    from api.services import BreedConfusionService
+    
+    pairs = BreedConfusionService.sync()
+    if pairs:
+        logger.info(f"同步品種混淆次數: {pairs} 組")
+
+
+def rebuild_global_stats_snapshot():
+    """
+    重建 GlobalStatsView 使用的全站統計快照（各語言、各排行變體）
+    """
+    from api.services import GlobalStatsService
+    
+    snapshot = GlobalStatsService.rebuild_snapshot()
+    logger.info(f"已重建全站統計快照，版本 {snapshot['version']}")
+
+
+def rebuild_difficulty_tables():
+    """
+    依最新的品種答對率重建難度模式用的 alias 抽樣表
+    """
+    from api.services import DifficultyService
+    
+    breed_count = DifficultyService.rebuild_tables()
+    logger.info(f"已重建難度抽樣表，共 {breed_count} 個品種")
+
+
+def refill_question_pool():
+    """
+    補充題目池：低於 QUESTION_POOL_LOW_WATER 時，從 dog.ceo 取題補到 QUESTION_POOL_HIGH_WATER
+    """
+    from api.services import DogAPIService, QuestionService, QuestionPoolService
+    
+    depth = QuestionPoolService.depth()
+    if depth >= settings.QUESTION_POOL_LOW_WATER:
+        return 0
+    
+    try:
+        image_urls = DogAPIService.fetch_random_images(settings.QUESTION_POOL_HIGH_WATER - depth)
+    except Exception as e:
+        logger.warning(f"補充題目池時取圖失敗: {str(e)}")
+        return 0
+    
+    question_ids = [question.id for question in QuestionService.bulk_ingest(image_urls)]
+    depth = QuestionPoolService.push(question_ids)
+    logger.info(f"題目池已補充 {len(question_ids)} 題，目前深度 {depth}")
+    return len(question_ids)
+
+
 def test_sync_task():
     """
     測試用函數：手動觸發同步任務
@@ -1,3 +1,1577 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, models
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import signals
+from api.models import Breed, BreedConfusion, BreedStatBucket, GameSession, GlobalStat, GlobalStatBucket, HardestBreedStat, Question, \
+    RoundRecord
+from api.services import DogAPIService, ChoiceService, BreedCatalogService, QuestionTokenService, RoundCodec, \
+    GameSessionService, GuestGameSessionService, RedisService, RoundRecordService, RoundRecordStreamService, \
+    CounterService, GlobalStatsService, StatRollupService, BreedConfusionService, LeaderboardService, PlayerService, \
+    ScoreDistributionService, QuestionBankService, DifficultyService, QuestionService, GameDeckService, \
+    QuestionPoolService, BreedService
+from api.services.breed_catalog import BreedCatalog, BreedEntry
+from api.tasks import calculate_hardest_breeds, sync_breed_stats_from_redis
+from api.services.difficulty import AliasTable
+from api.services.http_client import CircuitBreaker, CircuitOpenError, HttpClient
+
+
+def isolate_player_count(test_case):
+    """
+    建立或刪除 User 時 signal 會累加全站玩家數，測試期間改寫到 test: 前綴的 key
+    """
+    patcher = mock.patch.object(signals, 'PLAYER_COUNT_KEY', f'test:{signals.PLAYER_COUNT_KEY}')
+    patcher.start()
+    test_case.addCleanup(RedisService.get_client().delete, cache.make_key(signals.PLAYER_COUNT_KEY))
+    # 先把這個測試累積在記憶體中的計數寫出，再刪除測試用的 key
+    test_case.addCleanup(CounterService.flush)
+    test_case.addCleanup(patcher.stop)
+
+
+class StubDogAPIHandler(BaseHTTPRequestHandler):
+    # 每個請求依序取用一個 (延遲秒數, 狀態碼) 設定，用完後一律正常回應
+    script = []
+    request_count = 0
+
+    def do_GET(self):
+        cls = type(self)
+        cls.request_count += 1
+        delay, status = cls.script.pop(0) if cls.script else (0, 200)
+        if delay:
+            time.sleep(delay)
+
+        body = json.dumps({'message': 'https://images.dog.ceo/breeds/hound-afghan/n02088094_1003.jpg',
+                           'status': 'success'}).encode()
+        self.send_response(status)
+        if 300 <= status < 400:
+            # 重導回同一個網址
+            self.send_header('Location', self.path)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServerTestCase(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubDogAPIHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}/api/'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubDogAPIHandler.script = []
+        StubDogAPIHandler.request_count = 0
+
+    def make_client(self, **kwargs):
+        options = {'timeout': (0.5, 0.2), 'max_retries': 2, 'retry_backoff': 0.01,
+                   'breaker': CircuitBreaker(failure_threshold=2, reset_timeout=0.3)}
+        options.update(kwargs)
+        return HttpClient(**options)
+
+
+class HttpClientTests(StubServerTestCase):
+    def test_retries_server_errors_then_succeeds(self):
+        StubDogAPIHandler.script = [(0, 503), (0, 500)]
+        data = self.make_client().get_json(f'{self.base_url}breeds/image/random')
+
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(StubDogAPIHandler.request_count, 3)
+
+    def test_read_timeout_is_bounded(self):
+        StubDogAPIHandler.script = [(0.5, 200)] * 3
+        client = self.make_client()
+
+        started = time.monotonic()
+        with self.assertRaises(requests.Timeout):
+            client.get_json(f'{self.base_url}breeds/image/random')
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_client_errors_are_not_retried(self):
+        StubDogAPIHandler.script = [(0, 404)]
+        client = self.make_client()
+
+        with self.assertRaises(requests.HTTPError):
+            client.get_json(f'{self.base_url}breed/unknown/images')
+        self.assertEqual(StubDogAPIHandler.request_count, 1)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_breaker_opens_then_recovers_after_reset_timeout(self):
+        StubDogAPIHandler.script = [(0, 500)] * 6
+        client = self.make_client()
+        url = f'{self.base_url}breeds/image/random'
+
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                client.get_json(url)
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+
+        with self.assertRaises(CircuitOpenError):
+            client.get_json(url)
+        self.assertEqual(StubDogAPIHandler.request_count, 6)
+
+        time.sleep(0.3)
+        self.assertEqual(client.get_json(url)['status'], 'success')
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_breaker_recovers_after_unexpected_error_in_half_open_trial(self):
+        StubDogAPIHandler.script = [(0, 500)]
+        client = self.make_client(max_retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.1))
+        url = f'{self.base_url}breeds/image/random'
+
+        with self.assertRaises(requests.HTTPError):
+            client.get_json(url)
+        time.sleep(0.15)
+
+        # 試探請求遇到重導迴圈（TooManyRedirects 不是連線或逾時錯誤）
+        StubDogAPIHandler.script = [(0, 302)] * 40
+        with self.assertRaises(requests.TooManyRedirects):
+            client.get_json(url)
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+
+        StubDogAPIHandler.script = []
+        time.sleep(0.15)
+        self.assertEqual(client.get_json(url)['status'], 'success')
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+
+@override_settings(DOG_API_MAX_RETRIES=0, DOG_API_BREAKER_THRESHOLD=1, DOG_API_READ_TIMEOUT=0.2)
+class DogAPIServiceTests(StubServerTestCase):
+    def setUp(self):
+        super().setUp()
+        DogAPIService.reset_client()
+        self.settings_override = override_settings(DOG_API_BASE_URL=self.base_url)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        DogAPIService.reset_client()
+        super().tearDown()
+
+    def test_fetch_random_single_image_uses_shared_client(self):
+        image_url = DogAPIService.fetch_random_single_image()
+
+        self.assertEqual(DogAPIService.extract_slug_from_image_url(image_url), 'hound-afghan')
+        self.assertIs(DogAPIService.get_client(), DogAPIService.get_client())
+
+    def test_open_breaker_fails_fast(self):
+        StubDogAPIHandler.script = [(0.5, 200)]
+
+        with self.assertRaises(requests.Timeout):
+            DogAPIService.fetch_random_single_image()
+        with self.assertRaises(CircuitOpenError):
+            DogAPIService.fetch_random_single_image()
+        self.assertEqual(StubDogAPIHandler.request_count, 1)
+
+    def test_fetch_random_images_batches_requests(self):
+        batches = [{'message': [f'https://images.dog.ceo/breeds/hound-afghan/{index}.jpg' for index in range(50)]},
+                   {'message': ['https://images.dog.ceo/breeds/hound-afghan/last.jpg']}]
+        with mock.patch.object(HttpClient, 'get_json', side_effect=batches) as get_json:
+            image_urls = DogAPIService.fetch_random_images(51)
+
+        self.assertEqual(len(image_urls), 51)
+        self.assertTrue(get_json.call_args_list[1].args[0].endswith('breeds/image/random/1'))
+
+    def test_fetch_random_images_stops_on_empty_or_error_batch(self):
+        for response in ({'message': []}, {'message': 'Breed not found', 'status': 'error'}, {}):
+            with mock.patch.object(HttpClient, 'get_json', side_effect=[response]) as get_json:
+                self.assertEqual(DogAPIService.fetch_random_images(10), [])
+            self.assertEqual(get_json.call_count, 1)
+
+
+def make_catalog(size: int = 20, first_id: int = 100) -> BreedCatalog:
+    entries = [
+        BreedEntry(index=index, id=index + first_id, slug=f'breed-{index}', name_en=f'Breed {index}', name_zh=f'品種 {index}',
+                   origin_en=None, origin_zh=None, introduction_en=None, introduction_zh=None,
+                   created_at=None, updated_at=None)
+        for index in range(size)
+    ]
+    return BreedCatalog(entries, version=1)
+
+
+class ChoiceServiceTests(SimpleTestCase):
+    def setUp(self):
+        self.catalog = make_catalog()
+        patcher = mock.patch.object(BreedCatalogService, 'get_catalog', return_value=self.catalog)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_distractors_are_distinct_and_exclude_answer(self):
+        correct = self.catalog.entries[0]
+        for seed in range(200):
+            slugs = [choice['slug'] for choice in ChoiceService.generate_choices(correct, rng=ChoiceService.make_rng(seed))]
+            self.assertEqual(len(slugs), 4)
+            self.assertEqual(len(set(slugs)), 4)
+            self.assertEqual(slugs.count(correct.slug), 1)
+
+    def test_same_seed_gives_same_choices(self):
+        correct = self.catalog.entries[7]
+        first = ChoiceService.generate_choices(correct, lang='zh', rng=ChoiceService.make_rng(42))
+        second = ChoiceService.generate_choices(correct, lang='zh', rng=ChoiceService.make_rng(42))
+
+        self.assertEqual(first, second)
+        self.assertIn({'slug': 'breed-7', 'name': '品種 7'}, first)
+
+    def test_every_other_breed_can_be_drawn(self):
+        correct = self.catalog.entries[19]
+        rng = ChoiceService.make_rng(0)
+        drawn = set()
+        for _ in range(500):
+            drawn.update(self.catalog.sample_indexes(3, exclude_index=correct.index, rng=rng))
+
+        self.assertEqual(drawn, set(range(19)))
+
+
+class BreedCatalogServiceTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(BreedCatalogService, 'VERSION_KEY', f'test:{BreedCatalogService.VERSION_KEY}')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(RedisService.get_client().delete, BreedCatalogService.VERSION_KEY)
+        self.addCleanup(BreedCatalogService.bump_version)
+        for index in range(3):
+            Breed.objects.create(slug=f'breed-{index}', name_en=f'Breed {index}', name_zh=f'品種 {index}')
+        BreedCatalogService.bump_version()
+
+    def test_warm_catalog_reads_without_queries(self):
+        breed_id = BreedCatalogService.get_catalog().get_by_slug('breed-1').id
+
+        with self.assertNumQueries(0):
+            catalog = BreedCatalogService.get_catalog()
+            self.assertEqual(catalog.get_by_id(breed_id).slug, 'breed-1')
+            self.assertEqual(BreedService.get_breed_by_slug('breed-2').name('zh'), '品種 2')
+
+    @override_settings(BREED_CATALOG_CHECK_INTERVAL=0)
+    def test_reloads_after_version_bump(self):
+        self.assertEqual(len(BreedCatalogService.get_catalog().entries), 3)
+        Breed.objects.create(slug='breed-3', name_en='Breed 3')
+
+        # 版本沒變時沿用原本的快照
+        self.assertIsNone(BreedCatalogService.get_catalog().get_by_slug('breed-3'))
+
+        # 其他 process 執行 load_breeds 只會改 Redis 中的版本號
+        RedisService.get_client().incr(BreedCatalogService.VERSION_KEY)
+        catalog = BreedCatalogService.get_catalog()
+        self.assertEqual(catalog.get_by_slug('breed-3').name_en, 'Breed 3')
+        self.assertEqual(catalog.version, int(RedisService.get_client().get(BreedCatalogService.VERSION_KEY)))
+
+    def test_load_breeds_bumps_version(self):
+        version = BreedCatalogService.get_catalog().version
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'breed_info': [{'slug': 'breed-9', 'english_name': 'Breed 9', 'chinese_name': '品種 9'}]}, f)
+        self.addCleanup(os.remove, f.name)
+
+        call_command('load_breeds', '--file', f.name, stdout=io.StringIO())
+
+        catalog = BreedCatalogService.get_catalog()
+        self.assertEqual(catalog.version, version + 1)
+        self.assertEqual(catalog.get_by_slug('breed-9').name('zh'), '品種 9')
+
+
+class RoundCodecTests(SimpleTestCase):
+    def setUp(self):
+        self.catalog = make_catalog()
+        patcher = mock.patch.object(BreedCatalogService, 'get_catalog', return_value=self.catalog)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.question_id = 'c679e528-c775-4d0e-b702-632befe03549'
+        self.choices = [{'slug': f'breed-{index}', 'name': f'Breed {index}'} for index in (3, 1, 4, 5)]
+
+    def test_round_trip(self):
+        data = RoundCodec.encode(self.question_id, 'breed-1', 'breed-3', False, self.choices)
+
+        self.assertEqual(len(data), RoundCodec.HEADER.size + 4 * RoundCodec.BREED_ID.size)
+        self.assertEqual(RoundCodec.decode(data), {
+            'question_id': self.question_id,
+            'selected_slug': 'breed-1',
+            'correct_slug': 'breed-3',
+            'is_correct': False,
+            'score': 0,
+            'choices': [{'slug': 'breed-3'}, {'slug': 'breed-1'}, {'slug': 'breed-4'}, {'slug': 'breed-5'}],
+        })
+
+    def test_unknown_selected_slug_is_kept(self):
+        data = RoundCodec.encode(self.question_id, 'not-a-breed', 'breed-3', False, self.choices)
+
+        self.assertEqual(RoundCodec.decode(data)['selected_slug'], 'not-a-breed')
+
+    def test_round_trip_with_large_breed_ids(self):
+        catalog = make_catalog(first_id=70000)
+        with mock.patch.object(BreedCatalogService, 'get_catalog', return_value=catalog):
+            data = RoundCodec.encode(self.question_id, 'breed-1', 'breed-3', False, self.choices)
+            decoded = RoundCodec.decode(data)
+
+        self.assertEqual(decoded['selected_slug'], 'breed-1')
+        self.assertEqual(decoded['correct_slug'], 'breed-3')
+        self.assertEqual([choice['slug'] for choice in decoded['choices']], ['breed-3', 'breed-1', 'breed-4', 'breed-5'])
+
+    def test_breed_ids_missing_after_reload_do_not_crash(self):
+        data = RoundCodec.encode(self.question_id, 'breed-1', 'breed-3', False, self.choices)
+
+        # load_breeds --clear 之後品種以新的 id 重建
+        with mock.patch.object(BreedCatalogService, 'get_catalog', return_value=make_catalog(first_id=500)):
+            decoded = RoundCodec.decode(data)
+
+        self.assertIsNone(decoded['selected_slug'])
+        self.assertIsNone(decoded['correct_slug'])
+        self.assertEqual(decoded['choices'], [])
+
+
+@override_settings(COUNTER_FLUSH_INTERVAL_MS=60000, COUNTER_FLUSH_MAX_INCREMENTS=5)
+class CounterServiceTests(SimpleTestCase):
+    def setUp(self):
+        self.client = mock.MagicMock()
+        self.pipe = self.client.pipeline.return_value
+        patcher = mock.patch.object(RedisService, 'get_client', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # 不啟動背景 flush 執行緒
+        for name, value in (('_owner_pid', os.getpid()), ('_pending', CounterService._pending.__class__(int)),
+                            ('_pending_increments', 0), ('_last_flush', time.monotonic()), ('_dropped_increments', 0)):
+            patcher = mock.patch.object(CounterService, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_increments_are_aggregated_until_threshold(self):
+        CounterService.incr_many({'global:count:games': 1, 'global:count:rounds': 10})
+        CounterService.incr('global:count:games')
+        self.client.pipeline.assert_not_called()
+        self.assertEqual(CounterService.stats()['pending_delta'], 12)
+
+        CounterService.incr_many({'global:count:games': 1, 'global:count:rounds': 10})
+
+        self.assertEqual(self.pipe.incrby.call_count, 2)
+        self.pipe.incrby.assert_any_call(cache.make_key('global:count:games'), 3)
+        self.pipe.incrby.assert_any_call(cache.make_key('global:count:rounds'), 20)
+        self.pipe.execute.assert_called_once()
+        self.assertEqual(CounterService.stats()['pending_delta'], 0)
+
+    def test_failed_flush_keeps_pending_deltas(self):
+        self.pipe.execute.side_effect = ConnectionError('redis down')
+        CounterService.incr('breed:pug:attempts', 4)
+
+        with self.assertLogs('api.services.counter', level='ERROR'):
+            self.assertEqual(CounterService.flush(), 0)
+        self.assertEqual(CounterService.stats()['pending_delta'], 4)
+
+        self.pipe.execute.side_effect = None
+        self.assertEqual(CounterService.flush(), 1)
+        self.pipe.incrby.assert_called_with(cache.make_key('breed:pug:attempts'), 4)
+
+    @override_settings(COUNTER_MAX_PENDING_KEYS=2)
+    def test_pending_deltas_are_capped_while_redis_is_down(self):
+        self.pipe.execute.side_effect = ConnectionError('redis down')
+        CounterService.incr_many({'breed:pug:attempts': 1, 'breed:pug:correct': 1})
+        with self.assertLogs('api.services.counter', level='ERROR'):
+            CounterService.flush()
+        self.assertEqual(CounterService.stats()['pending_keys'], 2)
+
+        # 再多一個 key 就超過上限，這批（含之前留下的）全部丟棄
+        CounterService.incr('breed:akita:attempts', 3)
+        with self.assertLogs('api.services.counter', level='ERROR') as logs:
+            CounterService.flush()
+        self.assertIn('丟棄', logs.output[0])
+
+        stats = CounterService.stats()
+        self.assertEqual(stats['pending_keys'], 0)
+        self.assertEqual(stats['dropped_increments'], 3)
+
+
+class AliasTableTests(SimpleTestCase):
+    def test_draws_follow_weights(self):
+        weights = [1, 2, 3, 4, 0]
+        table = AliasTable.build(weights)
+        rng = ChoiceService.make_rng(1)
+        draws = 100000
+        counts = [0] * len(weights)
+        for _ in range(draws):
+            counts[table.draw(rng)] += 1
+
+        for weight, count in zip(weights, counts):
+            self.assertAlmostEqual(count / draws, weight / sum(weights), delta=0.01)
+
+    def test_all_zero_weights_fall_back_to_uniform(self):
+        table = AliasTable.build([0, 0, 0])
+        rng = ChoiceService.make_rng(1)
+
+        self.assertEqual({table.draw(rng) for _ in range(200)}, {0, 1, 2})
+
+
+@override_settings(GAME_DECK_ENABLED=False, QUESTION_TOKEN_ENABLED=False)
+class DifficultyModeTests(TestCase):
+    def setUp(self):
+        isolate_player_count(self)
+        breeds = [Breed.objects.create(slug=f'breed-{index}', name_en=f'Breed {index}', total_attempts=10,
+                                       correct_attempts=index) for index in range(4)]
+        BreedCatalogService.bump_version()
+        self.question = Question.objects.create(
+            image_url='https://images.dog.ceo/breeds/breed-0/1.jpg', answer=breeds[0], breed_slug='breed-0')
+        self.client = APIClient()
+
+    def start_and_ask(self, difficulty: str):
+        game_session_id = self.client.post('/api/start-game/', {'total_rounds': 3, 'difficulty': difficulty},
+                                           format='json').data['game_session_id']
+        self.addCleanup(RedisService.delete, f'{game_session_id}_{self.question.id}')
+        with mock.patch.object(QuestionService, 'generate_question', return_value=self.question) as generate_question:
+            response = self.client.post('/api/question/', {'game_session_id': game_session_id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return game_session_id, generate_question
+
+    def test_guest_game_keeps_difficulty(self):
+        game_session_id, generate_question = self.start_and_ask('hard')
+        self.addCleanup(GuestGameSessionService.delete_session, game_session_id)
+
+        generate_question.assert_called_once_with(difficulty='hard')
+
+    def test_authenticated_game_keeps_difficulty_after_state_expires(self):
+        self.client.force_authenticate(User.objects.create_user(username='player', password='password'))
+        game_session_id, generate_question = self.start_and_ask('easy')
+        self.addCleanup(RedisService.get_client().delete, GameSessionService.state_key(game_session_id))
+
+        generate_question.assert_called_once_with(difficulty='easy')
+        RedisService.get_client().delete(GameSessionService.state_key(game_session_id))
+        self.assertEqual(GameSessionService.get_state(game_session_id)['difficulty'], 'easy')
+
+    def test_tables_are_built_on_first_draw(self):
+        for name in ('TABLES_KEY', 'VERSION_KEY'):
+            patcher = mock.patch.object(DifficultyService, name, f'test:{getattr(DifficultyService, name)}')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.multiple(DifficultyService, _tables=None, _version=None, _checked_at=0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(RedisService.get_client().delete, DifficultyService.VERSION_KEY)
+        self.addCleanup(RedisService.delete, DifficultyService.TABLES_KEY)
+
+        with self.assertLogs('api.services.difficulty', level='WARNING'):
+            slug = DifficultyService.draw_breed_slug(DifficultyService.HARD)
+
+        self.assertIn(slug, {f'breed-{index}' for index in range(4)})
+
+
+@override_settings(GAME_DECK_ENABLED=True, QUESTION_TOKEN_ENABLED=False)
+class GameDeckTests(TestCase):
+    def setUp(self):
+        breeds = [Breed.objects.create(slug=f'breed-{index}', name_en=f'Breed {index}') for index in range(4)]
+        BreedCatalogService.bump_version()
+        self.questions = [
+            Question.objects.create(image_url=f'https://images.dog.ceo/breeds/{breed.slug}/1.jpg', answer=breed,
+                                    breed_slug=breed.slug)
+            for breed in breeds[:3]
+        ]
+        self.client = APIClient()
+
+    def forget(self, game_session_id):
+        self.addCleanup(GameDeckService.delete_deck, game_session_id)
+        for question in self.questions:
+            self.addCleanup(RedisService.delete, f'{game_session_id}_{question.id}')
+
+    def test_deck_is_served_in_order_with_answer_data(self):
+        game_session_id = 'test-deck'
+        self.forget(game_session_id)
+
+        self.assertEqual(GameDeckService.build_deck(game_session_id, self.questions), 3)
+
+        for question in self.questions:
+            answer_data = RedisService.get(f'{game_session_id}_{question.id}')
+            self.assertEqual(answer_data['correct_slug'], question.breed_slug)
+            self.assertEqual(answer_data['image_url'], question.image_url)
+            self.assertIn(question.breed_slug, [choice['slug'] for choice in answer_data['choices']])
+
+            served, choices = GameDeckService.pop(game_session_id)
+            self.assertEqual(str(served.id), str(question.id))
+            self.assertEqual(served.image_url, question.image_url)
+            self.assertEqual([choice['slug'] for choice in choices],
+                             [choice['slug'] for choice in answer_data['choices']])
+        self.assertIsNone(GameDeckService.pop(game_session_id))
+
+    def test_question_view_falls_back_when_deck_is_empty(self):
+        with mock.patch.object(QuestionService, 'generate_questions', return_value=self.questions[:2]):
+            game_session_id = self.client.post('/api/start-game/', {'total_rounds': 3},
+                                               format='json').data['game_session_id']
+        self.forget(game_session_id)
+        self.addCleanup(GuestGameSessionService.delete_session, game_session_id)
+
+        fallback = self.questions[2]
+        with mock.patch.object(QuestionService, 'generate_question', return_value=fallback) as generate_question:
+            served_ids = [
+                self.client.post('/api/question/', {'game_session_id': game_session_id}, format='json').data['id']
+                for _ in range(3)
+            ]
+
+        self.assertEqual(served_ids, [str(question.id) for question in self.questions])
+        generate_question.assert_called_once()
+        self.assertEqual(RedisService.get(f'{game_session_id}_{fallback.id}')['correct_slug'], fallback.breed_slug)
+
+    def test_start_game_survives_deck_failure(self):
+        with mock.patch.object(QuestionService, 'generate_questions', side_effect=ValueError('no questions')), \
+                self.assertLogs('api.views', level='WARNING'):
+            response = self.client.post('/api/start-game/', {'total_rounds': 3}, format='json')
+        self.addCleanup(GuestGameSessionService.delete_session, response.data['game_session_id'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(GameDeckService.pop(response.data['game_session_id']))
+
+
+@override_settings(GAME_DECK_ENABLED=False)
+class GuestGameFlowTests(TestCase):
+    def setUp(self):
+        breeds = [Breed.objects.create(slug=f'breed-{index}', name_en=f'Breed {index}') for index in range(4)]
+        BreedCatalogService.bump_version()
+        self.questions = [
+            Question.objects.create(image_url=f'https://images.dog.ceo/breeds/{breed.slug}/1.jpg', answer=breed,
+                                    breed_slug=breed.slug)
+            for breed in breeds[:3]
+        ]
+        patcher = mock.patch.object(ScoreDistributionService, 'KEY_PREFIX', f'test:{ScoreDistributionService.KEY_PREFIX}')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ScoreDistributionService.clear_cache()
+        self.addCleanup(ScoreDistributionService.clear_cache)
+        # 答錯時的混淆紀錄不寫入正式的 key
+        patcher = mock.patch.object(BreedConfusionService, 'record')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def play(self):
+        game_session_id = self.client.post('/api/start-game/', {'total_rounds': 3}, format='json').data['game_session_id']
+        self.addCleanup(GuestGameSessionService.delete_session, game_session_id)
+        for question in self.questions:
+            self.addCleanup(RedisService.delete, f'{game_session_id}_{question.id}')
+
+        selections = []
+        with mock.patch.object(QuestionService, 'generate_question', side_effect=self.questions):
+            for index, question in enumerate(self.questions):
+                served = self.client.post('/api/question/', {'game_session_id': game_session_id}, format='json').data
+                self.assertEqual(served['current_round'], index + 1)
+                # 第二題故意答錯
+                selected_slug = next(
+                    choice['slug'] for choice in served['choices']
+                    if (choice['slug'] == question.breed_slug) == (index != 1)
+                )
+                selections.append((selected_slug, [choice['slug'] for choice in served['choices']]))
+                payload = {'game_session_id': game_session_id, 'question_id': served['id'], 'selected_slug': selected_slug}
+                if served['token']:
+                    payload['token'] = served['token']
+                response = self.client.post('/api/answer/', payload, format='json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['is_correct'], index != 1)
+
+        response = self.client.post('/api/end-game/?lang=en', {'game_session_id': game_session_id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['score'], 2)
+        self.assertEqual(response.data['rounds'], 3)
+        self.assertIsNone(response.data['percentile'])
+        for question, (selected_slug, choice_slugs), record in zip(self.questions, selections, response.data['round_records']):
+            self.assertEqual(record['question_id'], str(question.id))
+            self.assertEqual(record['image_url'], question.image_url)
+            self.assertEqual(record['correct_slug'], question.breed_slug)
+            self.assertEqual(record['selected_slug'], selected_slug)
+            self.assertEqual(record['choices'], [
+                {'slug': slug, 'name': f"Breed {slug.removeprefix('breed-')}"} for slug in choice_slugs
+            ])
+
+        # 結算後 session 即刪除
+        response = self.client.post('/api/end-game/', {'game_session_id': game_session_id}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(QUESTION_TOKEN_ENABLED=False)
+    def test_full_game_with_cached_answers(self):
+        self.play()
+
+    @override_settings(QUESTION_TOKEN_ENABLED=True)
+    def test_full_game_with_question_tokens(self):
+        self.play()
+
+    @override_settings(QUESTION_TOKEN_ENABLED=False)
+    def test_answer_after_session_expired_does_not_recreate_it(self):
+        game_session_id = self.client.post('/api/start-game/', {'total_rounds': 3}, format='json').data['game_session_id']
+        self.addCleanup(GuestGameSessionService.delete_session, game_session_id)
+        question = self.questions[0]
+        self.addCleanup(RedisService.delete, f'{game_session_id}_{question.id}')
+        with mock.patch.object(QuestionService, 'generate_question', return_value=question):
+            self.client.post('/api/question/', {'game_session_id': game_session_id}, format='json')
+
+        # 作答前的檢查與寫入之間 session 過期
+        client = RedisService.get_client()
+        with mock.patch.object(GuestGameSessionService, 'get_round_count', return_value=0):
+            client.delete(GuestGameSessionService.session_key(game_session_id))
+            response = self.client.post('/api/answer/', {'game_session_id': game_session_id, 'question_id': str(question.id),
+                                                         'selected_slug': question.breed_slug}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(client.exists(GuestGameSessionService.session_key(game_session_id)))
+        self.assertFalse(client.exists(GuestGameSessionService.rounds_key(game_session_id)))
+        self.assertIsNone(GuestGameSessionService.get_session_data(game_session_id))
+
+    def test_missing_session_is_rejected(self):
+        for path, payload in (
+            ('/api/question/', {'game_session_id': 'missing'}),
+            ('/api/answer/', {'game_session_id': 'missing', 'question_id': str(self.questions[0].id),
+                              'selected_slug': 'breed-0'}),
+            ('/api/end-game/', {'game_session_id': 'missing'}),
+        ):
+            response = self.client.post(path, payload, format='json')
+            self.assertEqual(response.status_code, 400, path)
+
+
+@override_settings(GAME_DECK_ENABLED=False, QUESTION_TOKEN_ENABLED=False)
+class GameSessionServiceTests(TestCase):
+    def setUp(self):
+        isolate_player_count(self)
+        breeds = [Breed.objects.create(slug=f'breed-{index}', name_en=f'Breed {index}') for index in range(4)]
+        BreedCatalogService.bump_version()
+        self.question = Question.objects.create(
+            image_url='https://images.dog.ceo/breeds/breed-0/1.jpg', answer=breeds[0], breed_slug='breed-0')
+        self.owner = User.objects.create_user(username='owner', password='password')
+        self.session = GameSessionService.create_session(user_id=self.owner.id)
+        self.addCleanup(self.forget_state)
+
+    def forget_state(self):
+        RedisService.get_client().delete(GameSessionService.state_key(self.session.id))
+
+    def log_record(self, is_correct: bool):
+        RoundRecordService.log_record(self.session.id, self.question.id, 'breed-0' if is_correct else 'breed-1',
+                                      'breed-0', is_correct, 1 if is_correct else 0,
+                                      [{'slug': f'breed-{index}'} for index in range(4)])
+
+    def test_other_users_are_rejected(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='intruder', password='password'))
+        payload = {'game_session_id': self.session.id}
+
+        self.assertEqual(client.post('/api/question/', payload, format='json').status_code, 400)
+        self.assertEqual(client.post('/api/answer/', {**payload, 'question_id': str(self.question.id),
+                                                      'selected_slug': 'breed-0'}, format='json').status_code, 400)
+        self.assertEqual(client.post('/api/end-game/', payload, format='json').status_code, 403)
+        self.assertFalse(GameSessionService.is_session_owned_by_user(self.session.id, self.owner.id + 1))
+        self.assertTrue(GameSessionService.is_session_owned_by_user(self.session.id, self.owner.id))
+
+    def test_state_is_rebuilt_from_database(self):
+        self.log_record(is_correct=True)
+        self.log_record(is_correct=False)
+        self.forget_state()
+
+        self.assertEqual(GameSessionService.get_state(self.session.id),
+                         {'user_id': self.owner.id, 'rounds': 2, 'score': 1, 'correct': 1, 'difficulty': None})
+        self.assertTrue(RedisService.get_client().exists(GameSessionService.state_key(self.session.id)))
+        self.assertIsNone(GameSessionService.get_state(self.session.id + 1))
+
+    @override_settings(ROUND_RECORD_WRITE_BEHIND=True)
+    def test_rebuilt_state_counts_pending_rounds(self):
+        patcher = mock.patch.object(RoundRecordStreamService, 'PENDING_KEY_PREFIX',
+                                    f'test:{RoundRecordStreamService.PENDING_KEY_PREFIX}')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(RedisService.get_client().delete, RoundRecordStreamService.pending_key(self.session.id))
+        self.log_record(is_correct=True)
+        RedisService.get_client().incr(RoundRecordStreamService.pending_key(self.session.id), 2)
+        self.forget_state()
+
+        self.assertEqual(GameSessionService.get_state(self.session.id)['rounds'], 3)
+        self.assertEqual(GameSessionService.get_current_round(self.session.id), 4)
+
+    def test_end_session_clears_state(self):
+        self.log_record(is_correct=True)
+        GameSessionService.record_answer(self.session.id, is_correct=True, score=1)
+
+        session = GameSessionService.end_session(self.session.id)
+
+        self.assertEqual(session.score, 1)
+        self.assertIsNotNone(session.ended_at)
+        self.assertFalse(RedisService.get_client().exists(GameSessionService.state_key(self.session.id)))
+
+
+class QuestionTokenServiceTests(SimpleTestCase):
+    def setUp(self):
+        self.question = Question(id='c679e528-c775-4d0e-b702-632befe03549', breed_slug='hound-afghan',
+                                 image_url='https://images.dog.ceo/breeds/hound-afghan/n02088094_1003.jpg')
+        self.choices = [{'slug': 'hound-afghan', 'name': 'Afghan Hound'}, {'slug': 'pug', 'name': 'Pug'}]
+
+    def test_round_trip(self):
+        token = QuestionTokenService.create_token('session-1', self.question, self.choices, 3)
+        data = QuestionTokenService.read_token(token, 'session-1', self.question.id)
+
+        self.assertEqual(data['round'], 3)
+        self.assertEqual(data['correct_slug'], 'hound-afghan')
+        self.assertEqual(data['choices'], [{'slug': 'hound-afghan'}, {'slug': 'pug'}])
+        self.assertEqual(data['image_url'], self.question.image_url)
+
+    def test_rejects_tampered_or_foreign_token(self):
+        token = QuestionTokenService.create_token('session-1', self.question, self.choices, 1)
+
+        with self.assertRaises(ValueError):
+            QuestionTokenService.read_token(token[:-2] + 'xx', 'session-1', self.question.id)
+        with self.assertRaises(ValueError):
+            QuestionTokenService.read_token(token, 'session-2', self.question.id)
+
+    def test_correct_slug_is_not_readable_without_secret(self):
+        token = QuestionTokenService.create_token('session-1', self.question, self.choices, 1)
+
+        # 不需金鑰即可解開的 payload 中，除了圖片網址與選項外不該出現正解
+        payload = json.loads(zlib.decompress(signing.b64_decode(token.split(':')[0].lstrip('.').encode())))
+        self.assertEqual(payload[3], ['hound-afghan', 'pug'])
+        self.assertNotIn('hound-afghan', json.dumps(payload[:3] + payload[5:]))
+
+    def test_rejects_token_without_matching_answer(self):
+        token = QuestionTokenService.create_token('session-1', self.question, self.choices, 1)
+        payload = signing.loads(token, salt=QuestionTokenService.SALT)
+        payload[3] = ['pug', 'beagle']
+        forged = signing.dumps(payload, salt=QuestionTokenService.SALT, compress=True)
+
+        with self.assertRaises(ValueError):
+            QuestionTokenService.read_token(forged, 'session-1', self.question.id)
+
+    @override_settings(QUESTION_TOKEN_MAX_AGE=-1)
+    def test_rejects_expired_token(self):
+        token = QuestionTokenService.create_token('session-1', self.question, self.choices, 1)
+
+        with self.assertRaises(ValueError):
+            QuestionTokenService.read_token(token, 'session-1', self.question.id)
+
+
+class AnswerQueryCountTests(TestCase):
+    def setUp(self):
+        isolate_player_count(self)
+        breeds = [Breed.objects.create(slug=f'breed-{index}', name_en=f'Breed {index}') for index in range(5)]
+        BreedCatalogService.bump_version()
+        BreedCatalogService.get_catalog()
+        self.question = Question.objects.create(
+            image_url='https://images.dog.ceo/breeds/breed-0/1.jpg', answer=breeds[0], breed_slug='breed-0')
+        self.user = User.objects.create_user(username='player', password='password')
+        self.session = GameSessionService.create_session(user_id=self.user.id)
+
+        self.answer_key = f'{self.session.id}_{self.question.id}'
+        RedisService.set(self.answer_key, {
+            'correct_slug': 'breed-0',
+            'choices': [{'slug': breed.slug, 'name': breed.name_en} for breed in breeds[:4]],
+            'image_url': self.question.image_url,
+        })
+        self.addCleanup(RedisService.delete, self.answer_key)
+        self.addCleanup(RedisService.get_client().delete, GameSessionService.state_key(self.session.id))
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_answer_uses_constant_queries(self):
+        # 回合紀錄與選項只需一次 INSERT
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/answer/', {
+                'game_session_id': str(self.session.id),
+                'question_id': str(self.question.id),
+                'selected_slug': 'breed-0',
+            }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_correct'])
+        record = RoundRecord.objects.get(game_session=self.session)
+        self.assertEqual(record.correct_slug, 'breed-0')
+        self.assertEqual(len(record.choice_breed_ids), 4)
+        self.assertEqual(GameSessionService.get_current_round(self.session.id), 2)
+
+
+class QuestionPoolServiceTests(TestCase):
+    def setUp(self):
+        for name in ('POOL_KEY', 'REQUESTS_KEY', 'MISSES_KEY'):
+            patcher = mock.patch.object(QuestionPoolService, name, f'test:{getattr(QuestionPoolService, name)}')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+            self.addCleanup(RedisService.get_client().delete, getattr(QuestionPoolService, name))
+        breed = Breed.objects.create(slug='breed-0', name_en='Breed 0')
+        self.questions = [
+            Question.objects.create(image_url=f'https://images.dog.ceo/breeds/breed-0/{index}.jpg', answer=breed,
+                                    breed_slug='breed-0')
+            for index in range(3)
+        ]
+
+    def test_pop_counts_hits_and_misses(self):
+        QuestionPoolService.push([self.questions[0].id, self.questions[1].id])
+        self.questions[1].delete()
+
+        self.assertEqual(QuestionPoolService.pop(), self.questions[0])
+        # 已刪除的題目與空池都算未命中
+        self.assertIsNone(QuestionPoolService.pop())
+        self.assertIsNone(QuestionPoolService.pop())
+
+        self.assertEqual(QuestionPoolService.stats(), {'depth': 0, 'hits': 1, 'misses': 2, 'hit_rate': 33.33})
+
+    def test_pop_many_counts_the_shortfall_as_misses(self):
+        QuestionPoolService.push([question.id for question in self.questions])
+
+        self.assertEqual(QuestionPoolService.pop_many(2), [str(question.id) for question in self.questions[:2]])
+        self.assertEqual(QuestionPoolService.pop_many(4), [str(self.questions[2].id)])
+        self.assertEqual(QuestionPoolService.pop_many(1), [])
+
+        self.assertEqual(QuestionPoolService.stats(), {'depth': 0, 'hits': 3, 'misses': 4, 'hit_rate': 42.86})
+
+    @override_settings(QUESTION_POOL_ENABLED=True, QUESTION_SOURCE='dog_api', QUESTION_POOL_LOW_WATER=2,
+                       QUESTION_POOL_HIGH_WATER=3)
+    def test_refill_command_fills_pool_once(self):
+        image_urls = [question.image_url for question in self.questions]
+        with mock.patch.object(DogAPIService, 'fetch_random_images', return_value=image_urls) as fetch_random_images, \
+                mock.patch.object(QuestionBankService, 'add'):
+            call_command('refill_question_pool', '--once', stdout=io.StringIO())
+            # 深度已達低水位，不再補充
+            call_command('refill_question_pool', '--once', stdout=io.StringIO())
+
+        fetch_random_images.assert_called_once_with(3)
+        self.assertEqual(QuestionPoolService.depth(), 3)
+
+
+class BulkIngestTests(TestCase):
+    def setUp(self):
+        for index in range(2):
+            Breed.objects.create(slug=f'breed-{index}', name_en=f'Breed {index}')
+        BreedCatalogService.bump_version()
+        # 本地題庫的寫入另有測試，這裡不動正式的 key
+        patcher = mock.patch.object(QuestionBankService, 'add')
+        self.bank_add = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_existing_urls_are_returned_without_duplicates(self):
+        existing = QuestionService.bulk_ingest(['https://images.dog.ceo/breeds/breed-0/1.jpg'])[0]
+
+        questions = QuestionService.bulk_ingest([
+            'https://images.dog.ceo/breeds/breed-0/1.jpg',
+            'https://images.dog.ceo/breeds/breed-1/2.jpg',
+        ])
+
+        self.assertEqual(Question.objects.count(), 2)
+        self.assertEqual({question.image_url for question in questions},
+                         {'https://images.dog.ceo/breeds/breed-0/1.jpg', 'https://images.dog.ceo/breeds/breed-1/2.jpg'})
+        # ignore_conflicts 不會回填 id，回傳的是重新查詢的資料庫紀錄
+        self.assertIn(existing.id, [question.id for question in questions])
+        self.assertTrue(all(question.answer_id for question in questions))
+        self.bank_add.assert_called_with(questions)
+
+    def test_unknown_slugs_are_skipped(self):
+        questions = QuestionService.bulk_ingest([
+            'https://images.dog.ceo/breeds/breed-1/1.jpg',
+            'https://images.dog.ceo/breeds/unknown/1.jpg',
+        ])
+
+        self.assertEqual([question.breed_slug for question in questions], ['breed-1'])
+        self.assertFalse(Question.objects.filter(breed_slug='unknown').exists())
+        self.assertEqual(QuestionService.bulk_ingest(['https://images.dog.ceo/breeds/unknown/2.jpg']), [])
+
+
+class QuestionBankServiceTests(TestCase):
+    def setUp(self):
+        breed = Breed.objects.create(slug='bank-breed', name_en='Bank Breed')
+        self.questions = [
+            Question.objects.create(image_url=f'https://images.dog.ceo/breeds/bank/{index}.jpg', answer=breed, breed_slug='bank-breed')
+            for index in range(3)
+        ]
+        for name in ('BANK_KEY', 'BREED_KEY_PREFIX', 'REBUILD_LOCK_KEY'):
+            patcher = mock.patch.object(QuestionBankService, name, f'test:{getattr(QuestionBankService, name)}')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        client = RedisService.get_client()
+        self.addCleanup(lambda: [client.delete(key) for key in client.scan_iter(match='test:question_bank:*')])
+
+    def test_concurrent_rebuild_is_skipped(self):
+        RedisService.get_client().set(QuestionBankService.REBUILD_LOCK_KEY, 'other-run')
+        self.assertIsNone(QuestionBankService.rebuild())
+        self.assertEqual(QuestionBankService.size(), 0)
+
+        RedisService.get_client().delete(QuestionBankService.REBUILD_LOCK_KEY)
+        self.assertEqual(QuestionBankService.rebuild(chunk_size=2), 3)
+        self.assertEqual(QuestionBankService.size('bank-breed'), 3)
+        self.assertFalse(RedisService.get_client().exists(QuestionBankService.REBUILD_LOCK_KEY))
+
+    def test_questions_added_during_rebuild_are_kept(self):
+        swap = QuestionBankService._swap
+
+        def add_then_swap(client, run_id):
+            # 模擬資料都讀完、還沒換上前，其他請求新增了題目
+            QuestionBankService.add([Question.objects.create(image_url='https://images.dog.ceo/breeds/bank/new.jpg',
+                                                             answer=self.questions[0].answer, breed_slug='other-breed')])
+            return swap(client, run_id)
+
+        with mock.patch.object(QuestionBankService, '_swap', side_effect=add_then_swap):
+            self.assertEqual(QuestionBankService.rebuild(), 3)
+
+        self.assertEqual(QuestionBankService.size(), 4)
+        self.assertEqual(QuestionBankService.size('other-breed'), 1)
+        self.assertEqual(QuestionBankService._building_keys(RedisService.get_client()), [])
+
+    def test_add_writes_staging_keys_only_while_rebuilding(self):
+        client = RedisService.get_client()
+        suffix = f'{QuestionBankService.BUILDING_INFIX}run-1'
+        QuestionBankService.add([self.questions[0]])
+        self.assertEqual(QuestionBankService._building_keys(client), [])
+
+        client.set(QuestionBankService.REBUILD_LOCK_KEY, 'run-1')
+        QuestionBankService.add([self.questions[1]])
+
+        question_id = str(self.questions[1].id).encode()
+        self.assertEqual(client.smembers(f'{QuestionBankService.BANK_KEY}{suffix}'), {question_id})
+        self.assertEqual(client.smembers(f'{QuestionBankService.breed_key("bank-breed")}{suffix}'), {question_id})
+        self.assertEqual(QuestionBankService.size('bank-breed'), 2)
+
+    def test_request_path_falls_back_without_rebuilding_inline(self):
+        with mock.patch.object(QuestionBankService, 'rebuild_in_background') as rebuild_in_background, \
+                mock.patch.object(QuestionBankService, 'rebuild') as rebuild:
+            question = QuestionBankService.random_question()
+            question_ids = QuestionBankService.random_ids(2)
+
+        self.assertIn(question, self.questions)
+        self.assertEqual(len(question_ids), 2)
+        self.assertEqual(rebuild_in_background.call_count, 2)
+        rebuild.assert_not_called()
+
+    def test_random_question_for_breed_uses_breed_index(self):
+        other = Question.objects.create(image_url='https://images.dog.ceo/breeds/other/1.jpg',
+                                        answer=self.questions[0].answer, breed_slug='other-breed')
+        QuestionBankService.rebuild()
+
+        for _ in range(10):
+            self.assertIn(QuestionBankService.random_question_for_breed('bank-breed'), self.questions)
+        self.assertEqual(QuestionBankService.random_question_for_breed('other-breed'), other)
+        question_ids = QuestionBankService.random_ids_for_breeds(['other-breed', 'empty-breed', 'bank-breed'])
+        self.assertEqual(question_ids[:2], [str(other.id), None])
+        self.assertIn(question_ids[2], [str(question.id) for question in self.questions])
+
+    @override_settings(QUESTION_SOURCE='local_bank')
+    def test_empty_breed_falls_back_to_whole_bank(self):
+        QuestionBankService.rebuild()
+
+        with mock.patch.object(QuestionBankService, 'rebuild_in_background') as rebuild_in_background:
+            # 題庫還在，只是該品種沒有題目：不重建
+            self.assertIsNone(QuestionBankService.random_question_for_breed('empty-breed'))
+            self.assertIn(QuestionService.generate_question_for_breed('empty-breed'), self.questions)
+        rebuild_in_background.assert_not_called()
+
+    def test_rebuild_discards_result_when_lock_was_taken_over(self):
+        QuestionBankService.rebuild()
+        live_ids = set(RedisService.get_client().smembers(QuestionBankService.BANK_KEY))
+        Question.objects.create(image_url='https://images.dog.ceo/breeds/bank/late.jpg',
+                                answer=self.questions[0].answer, breed_slug='bank-breed')
+        swap = QuestionBankService._swap
+
+        def expire_lock_then_swap(client, run_id):
+            # 鎖過期後被另一個重建取得
+            client.set(QuestionBankService.REBUILD_LOCK_KEY, 'other-run')
+            return swap(client, run_id)
+
+        with mock.patch.object(QuestionBankService, '_swap', side_effect=expire_lock_then_swap):
+            self.assertIsNone(QuestionBankService.rebuild())
+
+        client = RedisService.get_client()
+        self.assertEqual(set(client.smembers(QuestionBankService.BANK_KEY)), live_ids)
+        self.assertEqual(client.get(QuestionBankService.REBUILD_LOCK_KEY), b'other-run')
+        self.assertEqual(QuestionBankService._building_keys(client), [])
+
+
+@override_settings(QUESTION_TOKEN_ENABLED=True)
+class AnswerTokenReplayTests(TestCase):
+    def setUp(self):
+        isolate_player_count(self)
+        breeds = [Breed.objects.create(slug=f'breed-{index}', name_en=f'Breed {index}') for index in range(4)]
+        BreedCatalogService.bump_version()
+        self.question = Question.objects.create(
+            image_url='https://images.dog.ceo/breeds/breed-0/1.jpg', answer=breeds[0], breed_slug='breed-0')
+        self.choices = [{'slug': breed.slug} for breed in breeds]
+        self.client = APIClient()
+
+    def answer(self, game_session_id, token: str):
+        return self.client.post('/api/answer/', {
+            'game_session_id': str(game_session_id),
+            'question_id': str(self.question.id),
+            'selected_slug': 'breed-0',
+            'token': token,
+        }, format='json')
+
+    def test_authenticated_token_cannot_be_replayed(self):
+        user = User.objects.create_user(username='player', password='password')
+        session = GameSessionService.create_session(user_id=user.id)
+        self.addCleanup(RedisService.get_client().delete, GameSessionService.state_key(session.id))
+        self.client.force_authenticate(user)
+        token = QuestionTokenService.create_token(session.id, self.question, self.choices, 1)
+
+        first = self.answer(session.id, token)
+        replay = self.answer(session.id, token)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.data['is_correct'])
+        self.assertEqual(replay.status_code, 400)
+        self.assertEqual(replay.data['error'], 'This round has already been answered.')
+        self.assertEqual(RoundRecord.objects.filter(game_session=session).count(), 1)
+        self.assertEqual(GameSessionService.get_state(session.id)['score'], 1)
+
+    def test_guest_token_cannot_be_replayed(self):
+        game_session_id = 'guest-replay-test'
+        GuestGameSessionService.create_session(game_session_id)
+        self.addCleanup(GuestGameSessionService.delete_session, game_session_id)
+        token = QuestionTokenService.create_token(game_session_id, self.question, self.choices, 1)
+
+        self.assertEqual(self.answer(game_session_id, token).status_code, 200)
+        self.assertEqual(self.answer(game_session_id, token).status_code, 400)
+        self.assertEqual(GuestGameSessionService.get_round_count(game_session_id), 1)
+
+
+@override_settings(ROUND_RECORD_STREAM_CLAIM_IDLE_MS=0)
+class RoundRecordStreamServiceTests(TestCase):
+    def setUp(self):
+        isolate_player_count(self)
+        breeds = [Breed.objects.create(slug=f'breed-{index}', name_en=f'Breed {index}') for index in range(4)]
+        BreedCatalogService.bump_version()
+        self.questions = [
+            Question.objects.create(image_url=f'https://images.dog.ceo/breeds/breed-0/{index}.jpg',
+                                    answer=breeds[0], breed_slug='breed-0')
+            for index in range(3)
+        ]
+        self.choices = [{'slug': breed.slug} for breed in breeds]
+        user = User.objects.create_user(username='player', password='password')
+        self.session = GameSessionService.create_session(user_id=user.id)
+
+        for name in ('STREAM_KEY', 'DEAD_LETTER_KEY'):
+            patcher = mock.patch.object(RoundRecordStreamService, name, f'test:{getattr(RoundRecordStreamService, name)}')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        client = RedisService.get_client()
+        self.addCleanup(client.delete, RoundRecordStreamService.STREAM_KEY, RoundRecordStreamService.DEAD_LETTER_KEY,
+                        RoundRecordStreamService.pending_key(self.session.id),
+                        RoundRecordStreamService.entries_key(self.session.id),
+                        GameSessionService.state_key(self.session.id))
+        RoundRecordStreamService.ensure_group()
+
+    def enqueue(self, question):
+        RoundRecordStreamService.enqueue(self.session.id, question.id, 'breed-0', 'breed-0', True, 1, self.choices)
+
+    def test_batch_is_written_and_acknowledged(self):
+        for question in self.questions:
+            self.enqueue(question)
+        self.assertEqual(RoundRecordStreamService.pending_count(self.session.id), 3)
+
+        self.assertEqual(RoundRecordStreamService.process_batch('worker-1'), 3)
+        self.assertEqual(RoundRecordStreamService.process_batch('worker-1'), 0)
+
+        self.assertEqual(RoundRecord.objects.filter(game_session=self.session).count(), 3)
+        self.assertEqual(RoundRecordStreamService.pending_count(self.session.id), 0)
+        self.assertTrue(RoundRecordStreamService.wait_for_session(self.session.id, timeout=0))
+
+    def test_crashed_consumer_entries_are_reclaimed_once(self):
+        self.enqueue(self.questions[0])
+        self.enqueue(self.questions[1])
+        # 同一題出現兩次是合法的，不能被當成重複
+        self.enqueue(self.questions[0])
+        client = RedisService.get_client()
+        # worker-1 讀取後當掉：第一筆已寫入資料庫但都沒有 ACK
+        entries = client.xreadgroup(RoundRecordStreamService.GROUP, 'worker-1',
+                                    {RoundRecordStreamService.STREAM_KEY: '>'}, count=10)[0][1]
+        RoundRecordStreamService._write(
+            [(entries[0][0].decode(), {key.decode(): value.decode() for key, value in entries[0][1].items()})])
+
+        self.assertEqual(RoundRecordStreamService.process_batch('worker-2'), 3)
+
+        records = RoundRecord.objects.filter(game_session=self.session)
+        self.assertEqual(sorted(records.values_list('question_id', flat=True)),
+                         sorted([self.questions[0].id, self.questions[1].id, self.questions[0].id]))
+        self.assertEqual(RoundRecordStreamService.pending_count(self.session.id), 0)
+
+    def test_bad_events_are_dead_lettered_without_blocking_the_batch(self):
+        self.enqueue(self.questions[0])
+        RoundRecordStreamService.enqueue(self.session.id, self.questions[1].id, 'breed-0', 'breed-0', True, 1,
+                                         [{'slug': 'no-such-breed'}])
+        self.enqueue(self.questions[2])
+        self.questions[2].delete()
+
+        with self.assertLogs('api.services.round_record_stream', level='WARNING'):
+            self.assertEqual(RoundRecordStreamService.process_batch('worker-1'), 3)
+
+        self.assertEqual(list(RoundRecord.objects.filter(game_session=self.session).values_list('question_id', flat=True)),
+                         [self.questions[0].id])
+        dead = RedisService.get_client().xrange(RoundRecordStreamService.DEAD_LETTER_KEY)
+        self.assertEqual(len(dead), 2)
+        self.assertEqual(RedisService.get_client().xpending(RoundRecordStreamService.STREAM_KEY, RoundRecordStreamService.GROUP)['pending'], 0)
+        self.assertTrue(RoundRecordStreamService.wait_for_session(self.session.id, timeout=0))
+
+    def test_end_game_flush_only_writes_its_own_session(self):
+        other = GameSessionService.create_session(user_id=self.session.user_id)
+        client = RedisService.get_client()
+        self.addCleanup(client.delete, RoundRecordStreamService.pending_key(other.id),
+                        RoundRecordStreamService.entries_key(other.id), GameSessionService.state_key(other.id))
+        RoundRecordStreamService.enqueue(other.id, self.questions[2].id, 'breed-0', 'breed-0', True, 1, self.choices)
+        self.enqueue(self.questions[0])
+        self.enqueue(self.questions[1])
+
+        self.assertTrue(RoundRecordStreamService.wait_for_session(self.session.id, timeout=1))
+
+        self.assertEqual(RoundRecord.objects.filter(game_session=self.session).count(), 2)
+        self.assertFalse(RoundRecord.objects.filter(game_session=other).exists())
+        self.assertEqual(RoundRecordStreamService.pending_count(other.id), 1)
+        self.assertEqual(client.xlen(RoundRecordStreamService.STREAM_KEY), 1)
+        self.assertFalse(client.exists(RoundRecordStreamService.entries_key(self.session.id)))
+        # 結算不會在 consumer group 中留下新的 consumer
+        self.assertEqual(client.xinfo_consumers(RoundRecordStreamService.STREAM_KEY, RoundRecordStreamService.GROUP), [])
+
+        # worker 之後仍會處理其他局的事件
+        self.assertEqual(RoundRecordStreamService.process_batch('worker-1'), 1)
+        self.assertEqual(RoundRecordStreamService.pending_count(other.id), 0)
+
+    def test_expired_pending_counter_is_not_left_negative(self):
+        self.enqueue(self.questions[0])
+        client = RedisService.get_client()
+        client.delete(RoundRecordStreamService.pending_key(self.session.id))
+
+        RoundRecordStreamService.process_batch('worker-1')
+
+        self.assertFalse(client.exists(RoundRecordStreamService.pending_key(self.session.id)))
+        self.assertEqual(RoundRecordStreamService.pending_count(self.session.id), 0)
+
+
+class EndGameQueryCountTests(TestCase):
+    def setUp(self):
+        isolate_player_count(self)
+        self.breeds = [Breed.objects.create(slug=f'breed-{index}', name_en=f'Breed {index}') for index in range(4)]
+        BreedCatalogService.bump_version()
+        BreedCatalogService.get_catalog()
+        self.user = User.objects.create_user(username='player', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def play(self, rounds: int) -> GameSession:
+        session = GameSessionService.create_session(user_id=self.user.id)
+        self.addCleanup(RedisService.get_client().delete, GameSessionService.state_key(session.id))
+        for index in range(rounds):
+            question = Question.objects.create(image_url=f'https://images.dog.ceo/breeds/breed-0/{session.id}-{index}.jpg',
+                                               answer=self.breeds[0], breed_slug='breed-0')
+            RoundRecordService.log_record(session.id, question.id, f'breed-{index % 2}', 'breed-0', index % 2 == 0,
+                                          1 if index % 2 == 0 else 0, [{'slug': breed.slug} for breed in self.breeds])
+        return session
+
+    def end_game(self, session: GameSession):
+        # 統計計數、分時段統計與分數分布都不寫入正式的 Redis key
+        with mock.patch.object(CounterService, 'incr_many'), mock.patch.object(CounterService, 'hincr_many'), \
+                mock.patch.object(LeaderboardService, 'record_game'):
+            return self.client.post('/api/end-game/', {'game_session_id': str(session.id)}, format='json')
+
+    def test_query_budget_does_not_grow_with_rounds(self):
+        # session + 回合紀錄（含題目）+ 更新 session
+        for rounds in (2, 10):
+            session = self.play(rounds)
+            with self.assertNumQueries(3):
+                response = self.end_game(session)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['rounds'], rounds)
+            self.assertEqual(len(response.data['round_records']), rounds)
+
+    def test_summary_and_stats(self):
+        session = self.play(3)
+        response = self.end_game(session)
+
+        self.assertEqual(response.data['score'], 2)
+        self.assertIn('percentile', response.data)
+        self.assertEqual(response.data['round_records'][1]['choices'][2], {'slug': 'breed-2', 'name': 'Breed 2'})
+        session.refresh_from_db()
+        self.assertEqual(session.avg_accuracy, 66.67)
+        self.assertEqual(GameSessionService.calculate_stats(GameSession.objects.get(id=session.id)), {
+            'total_games': 1,
+            'total_rounds': 3,
+            'total_correct': 2,
+            'breed_stats': {'breed-0': {'attempts': 3, 'successes': 2}},
+        })
+
+
+class BackfillChoiceBreedIdsMigrationTests(TransactionTestCase):
+    before = [('api', '0018_roundrecord_choice_breed_ids')]
+    after = [('api', '0019_backfill_roundrecord_choice_breed_ids')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.latest = executor.loader.graph.leaf_nodes('api')
+        executor.migrate(self.before)
+        self.addCleanup(lambda: MigrationExecutor(connection).migrate(self.latest))
+        apps = executor.loader.project_state(self.before).apps
+
+        breeds = [apps.get_model('api', 'Breed').objects.create(slug=f'breed-{index}', name_en=f'Breed {index}')
+                  for index in range(4)]
+        user = apps.get_model('auth', 'User').objects.create(username='player')
+        game_session = apps.get_model('api', 'GameSession').objects.create(user=user)
+        question = apps.get_model('api', 'Question').objects.create(
+            image_url='https://images.dog.ceo/breeds/breed-0/1.jpg', answer=breeds[0], breed_slug='breed-0')
+        RoundRecord = apps.get_model('api', 'RoundRecord')
+        RoundRecordBreedChoice = apps.get_model('api', 'RoundRecordBreedChoice')
+        self.record_ids = []
+        for order in ((2, 0, 3, 1), (1, 3, 0, 2)):
+            record = RoundRecord.objects.create(game_session=game_session, question=question, selected_slug='breed-0',
+                                                correct_slug='breed-0', is_correct=True, score=1)
+            for index in order:
+                RoundRecordBreedChoice.objects.create(round_record=record, breed=breeds[index], slug=breeds[index].slug)
+            self.record_ids.append(record.id)
+        # 品種已刪除（breed_id 為 NULL）時以 slug 對回
+        RoundRecordBreedChoice.objects.filter(round_record_id=self.record_ids[1], slug='breed-3').update(breed=None)
+        self.expected = [[breeds[index].id for index in order] for order in ((2, 0, 3, 1), (1, 3, 0, 2))]
+
+    def choice_breed_ids(self, apps) -> list[list[int]]:
+        RoundRecord = apps.get_model('api', 'RoundRecord')
+        return [RoundRecord.objects.get(id=record_id).choice_breed_ids for record_id in self.record_ids]
+
+    def test_backfill_fills_choice_breed_ids_and_is_idempotent(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        apps = executor.loader.project_state(self.after).apps
+        self.assertEqual(self.choice_breed_ids(apps), self.expected)
+
+        migration = importlib.import_module('api.migrations.0019_backfill_roundrecord_choice_breed_ids')
+        with mock.patch.object(migration, 'CHUNK_SIZE', 1):
+            migration.backfill_choice_breed_ids(apps, None)
+        self.assertEqual(self.choice_breed_ids(apps), self.expected)
+
+
+class SyncBreedStatsTests(TestCase):
+    def setUp(self):
+        self.breeds = [Breed.objects.create(slug=f'sync-test-{index}', name_en=f'Sync Test {index}') for index in range(3)]
+        BreedCatalogService.bump_version()
+        self.keys = [f'breed:{breed.slug}:{field}' for breed in self.breeds for field in ('attempts', 'correct')]
+        self.addCleanup(RedisService.get_client().delete, *[cache.make_key(key) for key in self.keys])
+
+    def test_no_increments_lost_during_sync(self):
+        increments = 300
+        client = RedisService.get_client()
+
+        def fire():
+            for index in range(increments):
+                breed = self.breeds[index % len(self.breeds)]
+                pipe = client.pipeline(transaction=False)
+                pipe.incrby(cache.make_key(f'breed:{breed.slug}:attempts'), 2)
+                pipe.incrby(cache.make_key(f'breed:{breed.slug}:correct'), 1)
+                pipe.execute()
+
+        thread = threading.Thread(target=fire)
+        thread.start()
+        syncs = 0
+        while thread.is_alive():
+            sync_breed_stats_from_redis()
+            syncs += 1
+        thread.join()
+        sync_breed_stats_from_redis()
+
+        self.assertGreater(syncs, 1)
+        totals = Breed.objects.filter(id__in=[breed.id for breed in self.breeds]) \
+            .aggregate(attempts=models.Sum('total_attempts'), correct=models.Sum('correct_attempts'))
+        self.assertEqual(totals, {'attempts': increments * 2, 'correct': increments})
+        self.assertEqual(CounterService.drain(self.keys), {})
+
+    def test_failed_update_restores_counters(self):
+        CounterService.restore({self.keys[0]: 5, self.keys[1]: 3})
+
+        with mock.patch.object(Breed.objects, 'bulk_update', side_effect=RuntimeError('db down')), \
+                self.assertLogs('api.tasks', level='ERROR'):
+            with self.assertRaises(RuntimeError):
+                sync_breed_stats_from_redis()
+
+        self.assertEqual(CounterService.drain(self.keys), {self.keys[0]: 5, self.keys[1]: 3})
+
+
+class CalculateHardestBreedsTests(TestCase):
+    VARIANTS = {
+        'default': {'top_n': 3, 'min_attempts': 10},
+        'zh': {'top_n': 3, 'min_attempts': 10, 'lang': 'zh'},
+        'min_50': {'top_n': 3, 'min_attempts': 50},
+    }
+
+    def setUp(self):
+        # (作答數, 答對數, 是否有中文名稱)
+        stats = [(20, 1, True), (100, 20, True), (20, 2, False), (5, 0, True), (60, 30, True), (40, 30, True)]
+        self.breeds = [
+            Breed.objects.create(slug=f'breed-{index}', name_en=f'Breed {index}', name_zh=f'品種 {index}' if has_zh else None,
+                                 total_attempts=attempts, correct_attempts=correct)
+            for index, (attempts, correct, has_zh) in enumerate(stats)
+        ]
+
+    def ranking(self, variant: str) -> list[str]:
+        return list(HardestBreedStat.objects.filter(variant=variant).order_by('rank').values_list('breed__slug', flat=True))
+
+    def test_variants_are_ranked_in_one_query(self):
+        with CaptureQueriesContext(connection) as context:
+            calculate_hardest_breeds(self.VARIANTS)
+
+        breed_reads = [query for query in context.captured_queries if query['sql'].startswith('SELECT') and '"api_breed"' in query['sql']]
+        self.assertEqual(len(breed_reads), 1)
+        self.assertEqual(self.ranking('default'), ['breed-0', 'breed-2', 'breed-1'])
+        self.assertEqual(self.ranking('zh'), ['breed-0', 'breed-1', 'breed-4'])
+        self.assertEqual(self.ranking('min_50'), ['breed-1', 'breed-4'])
+
+    def test_refresh_upserts_and_drops_stale_ranks(self):
+        calculate_hardest_breeds(self.VARIANTS)
+        Breed.objects.filter(slug__in=['breed-0', 'breed-2', 'breed-5']).update(total_attempts=0, correct_attempts=0)
+
+        calculate_hardest_breeds({'default': self.VARIANTS['default']})
+
+        self.assertEqual(self.ranking('default'), ['breed-1', 'breed-4'])
+        self.assertFalse(HardestBreedStat.objects.exclude(variant='default').exists())
+
+
+class PlayerCountSignalTests(TestCase):
+    def setUp(self):
+        isolate_player_count(self)
+
+    def player_count(self) -> int:
+        CounterService.flush()
+        return int(RedisService.get_client().get(cache.make_key(signals.PLAYER_COUNT_KEY)) or 0)
+
+    def test_create_and_delete_user_move_player_count(self):
+        user = User.objects.create_user(username='player', password='password')
+        self.assertEqual(self.player_count(), 1)
+
+        # 更新既有使用者不計數
+        user.save()
+        self.assertEqual(self.player_count(), 1)
+
+        user.delete()
+        self.assertEqual(self.player_count(), 0)
+
+
+class GlobalStatsViewTests(TestCase):
+    def setUp(self):
+        GlobalStat.objects.update_or_create(id=1, defaults={'total_games': 4, 'total_rounds': 40, 'total_correct': 30, 'total_players': 7})
+        breed = Breed.objects.create(slug='breed-0', name_en='Breed 0', name_zh='品種 0')
+        HardestBreedStat.objects.create(variant='zh', rank=1, breed=breed, correct_rate=12.345)
+        client = RedisService.get_client()
+        snapshot, version = client.get(GlobalStatsService.SNAPSHOT_KEY), client.get(GlobalStatsService.VERSION_KEY)
+        self.addCleanup(lambda: client.set(GlobalStatsService.SNAPSHOT_KEY, snapshot) if snapshot else client.delete(GlobalStatsService.SNAPSHOT_KEY))
+        self.addCleanup(lambda: client.set(GlobalStatsService.VERSION_KEY, version) if version else client.delete(GlobalStatsService.VERSION_KEY))
+        GlobalStatsService.rebuild_snapshot()
+        self.client = APIClient()
+
+    def test_served_from_snapshot_without_queries(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/global-stats/?lang=zh')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            'total_games': 4, 'total_rounds': 40, 'total_players': 7, 'avg_accuracy': 75.0,
+            'hardest_breeds': [{'rank': 1, 'name': '品種 0', 'correct_rate': 12.35}],
+        })
+        self.assertIn('max-age=', response['Cache-Control'])
+
+    def test_not_modified_until_snapshot_changes(self):
+        etag = self.client.get('/api/global-stats/?lang=zh')['ETag']
+
+        self.assertEqual(self.client.get('/api/global-stats/?lang=zh', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/api/global-stats/?lang=en', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        GlobalStatsService.rebuild_snapshot()
+        self.assertEqual(self.client.get('/api/global-stats/?lang=zh', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class StatRollupTests(TestCase):
+    NOW = datetime(2025, 3, 2, 1, 30, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.breed = Breed.objects.create(slug='rollup-test', name_en='Rollup Test')
+        BreedCatalogService.bump_version()
+        self.client = APIClient()
+
+    def record(self, moment: datetime, rounds: int, correct: int):
+        StatRollupService.record_game({
+            'total_games': 1, 'total_rounds': rounds, 'total_correct': correct,
+            'breed_stats': {'rollup-test': {'attempts': rounds, 'successes': correct}, 'unknown-breed': {'attempts': 1, 'successes': 0}},
+        }, moment=moment)
+        CounterService.flush()
+
+    def test_sync_adds_to_existing_buckets(self):
+        self.record(self.NOW - timedelta(hours=2), rounds=10, correct=4)
+        self.record(self.NOW, rounds=5, correct=5)
+        self.assertEqual(StatRollupService.sync(now=self.NOW), 2)
+        self.record(self.NOW, rounds=5, correct=1)
+        self.assertEqual(StatRollupService.sync(now=self.NOW), 1)
+        self.assertEqual(StatRollupService.sync(now=self.NOW), 0)
+
+        hours = GlobalStatBucket.objects.filter(granularity=GlobalStatBucket.HOUR).order_by('bucket_start')
+        self.assertEqual([(bucket.bucket_start.hour, bucket.games, bucket.rounds, bucket.correct) for bucket in hours],
+                         [(23, 1, 10, 4), (1, 2, 10, 6)])
+        days = GlobalStatBucket.objects.filter(granularity=GlobalStatBucket.DAY).order_by('bucket_start')
+        self.assertEqual([(bucket.bucket_start.day, bucket.games) for bucket in days], [(1, 1), (2, 2)])
+        breed_day = BreedStatBucket.objects.get(granularity=GlobalStatBucket.DAY, breed=self.breed, bucket_start__day=2)
+        self.assertEqual((breed_day.attempts, breed_day.correct), (10, 6))
+
+    def test_trends_sum_buckets_without_round_records(self):
+        self.record(self.NOW - timedelta(days=1), rounds=10, correct=4)
+        self.record(self.NOW, rounds=10, correct=6)
+        StatRollupService.sync(now=self.NOW)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/stats/trends/', {
+                'granularity': 'day', 'start': '2025-02-28T00:00:00Z', 'end': '2025-03-03T00:00:00Z', 'breed': 'rollup-test',
+            })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([bucket['attempts'] for bucket in response.data['buckets']], [0, 10, 10])
+        self.assertEqual(response.data['totals'], {'attempts': 20, 'correct': 10, 'accuracy': 50.0})
+        self.assertFalse(any('"api_roundrecord"' in query['sql'] for query in context.captured_queries))
+
+    def test_rejects_unbounded_windows(self):
+        response = self.client.get('/api/stats/trends/', {
+            'granularity': 'hour', 'start': '2024-01-01T00:00:00Z', 'end': '2025-01-01T00:00:00Z',
+        })
+
+        self.assertEqual(response.status_code, 400)
+
+
+class BreedConfusionTests(TestCase):
+    def setUp(self):
+        self.breeds = [Breed.objects.create(slug=f'confusion-{index}', name_en=f'Confusion {index}', name_zh=f'混淆 {index}')
+                       for index in range(4)]
+        BreedCatalogService.bump_version()
+        # 不能動到正式的 key，否則尚未同步的混淆次數會遺失
+        for name in ('PENDING_KEY', 'TOP_KEY'):
+            patcher = mock.patch.object(BreedConfusionService, name, f'test:{getattr(BreedConfusionService, name)}')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(RedisService.get_client().delete, BreedConfusionService.TOP_KEY, BreedConfusionService.PENDING_KEY)
+        self.client = APIClient()
+
+    def confuse(self, pairs: list[tuple[int, int]]):
+        for correct, selected in pairs:
+            BreedConfusionService.record(self.breeds[correct].slug, self.breeds[selected].slug)
+        CounterService.flush()
+
+    def test_top_confusions_served_without_queries(self):
+        self.confuse([(0, 1), (0, 2), (0, 2), (0, 0), (1, 0)])
+        self.assertEqual(BreedConfusionService.sync(), 3)
+        self.confuse([(0, 1), (0, 1), (0, 3)])
+        BreedConfusionService.sync()
+
+        BreedCatalogService.get_catalog()
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/breeds/confusion-0/confusions/?lang=zh')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], '混淆 0')
+        self.assertEqual([(confusion['slug'], confusion['count'], confusion['share']) for confusion in response.data['confusions']],
+                         [('confusion-1', 3, 50.0), ('confusion-2', 2, 33.33), ('confusion-3', 1, 16.67)])
+        self.assertEqual(BreedConfusion.objects.get(breed=self.breeds[1]).count, 1)
+
+    @override_settings(BREED_CONFUSION_TOP_N=1)
+    def test_top_rebuilt_when_redis_is_empty(self):
+        self.confuse([(2, 3), (2, 3), (2, 1)])
+        BreedConfusionService.sync()
+        RedisService.get_client().delete(BreedConfusionService.TOP_KEY)
+
+        self.assertEqual(BreedConfusionService.get_top('confusion-2'), [{'slug': 'confusion-3', 'count': 2, 'share': 66.67}])
+        self.assertEqual(BreedConfusionService.get_top('confusion-3'), [])
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        isolate_player_count(self)
+        self.users = [PlayerService.create_user(username=f'leader-{index}', password='password') for index in range(3)]
+        # 測試與應用程式共用同一個 Redis，只清測試用的 key
+        patcher = mock.patch.object(LeaderboardService, 'KEY_PREFIX', f'test:{LeaderboardService.KEY_PREFIX}')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        LeaderboardService.clear()
+        self.addCleanup(LeaderboardService.clear)
+        self.client = APIClient()
+
+    def test_keeps_best_score_per_window(self):
+        for user, score in zip(self.users, (7, 9, 4)):
+            LeaderboardService.record_game(user.id, score, rounds=10)
+        LeaderboardService.record_game(self.users[0].id, 3, rounds=10)
+        LeaderboardService.record_game(self.users[2].id, 12, rounds=20)
+        # 已過期的時間窗只會寫入總榜
+        LeaderboardService.record_game(self.users[0].id, 15, rounds=10, ended_at=timezone.now() - timedelta(days=30))
+
+        self.client.force_authenticate(self.users[0])
+        response = self.client.get('/api/leaderboard/', {'period': 'day', 'rounds': 10})
+
+        self.assertEqual([(entry['user_id'], entry['score']) for entry in response.data['entries']],
+                         [(self.users[1].id, 9), (self.users[0].id, 7), (self.users[2].id, 4)])
+        self.assertEqual(response.data['me'], {'rank': 2, 'score': 7})
+        self.assertEqual(LeaderboardService.get_rank(self.users[0].id, 'all'), {'rank': 1, 'score': 15})
+        self.assertEqual(LeaderboardService.get_rank(self.users[2].id, 'week'), {'rank': 1, 'score': 12})
+        self.assertGreater(RedisService.get_client().ttl(LeaderboardService.key('week', 10)), 0)
+
+    def test_rebuild_from_game_sessions(self):
+        breed = Breed.objects.create(slug='leader-breed', name_en='Leader Breed')
+        for user, score in zip(self.users, (2, 5, 1)):
+            session = GameSession.objects.create(user=user, score=score, ended_at=timezone.now())
+            for index in range(3):
+                question = Question.objects.create(image_url=f'https://images.dog.ceo/breeds/leader/{session.id}-{index}.jpg',
+                                                   answer=breed, breed_slug=breed.slug)
+                RoundRecord.objects.create(game_session=session, question=question, selected_slug=breed.slug,
+                                           correct_slug=breed.slug, is_correct=True, score=1)
+        GameSession.objects.create(user=self.users[0], score=9)
+
+        call_command('rebuild_leaderboards', chunk_size=2, reset=True, stdout=io.StringIO())
+
+        self.assertEqual([entry['user_id'] for entry in LeaderboardService.get_top('all', rounds=3)],
+                         [self.users[1].id, self.users[0].id, self.users[2].id])
+        self.assertEqual(LeaderboardService.get_top('all', rounds=10), [])
+
+
+class ScoreDistributionTests(SimpleTestCase):
+    def setUp(self):
+        # score_histogram:r10 是預設 10 回合遊戲的正式分布，測試改用自己的 key
+        patcher = mock.patch.object(ScoreDistributionService, 'KEY_PREFIX', f'test:{ScoreDistributionService.KEY_PREFIX}')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        RedisService.get_client().delete(ScoreDistributionService.key(10))
+        self.addCleanup(RedisService.get_client().delete, ScoreDistributionService.key(10))
+        ScoreDistributionService.clear_cache()
+        self.addCleanup(ScoreDistributionService.clear_cache)
+
+    def test_percentile_from_merged_histogram(self):
+        for score in (2, 5, 5, 8, 10):
+            ScoreDistributionService.record(score, rounds=10)
+        CounterService.flush()
+
+        self.assertEqual(ScoreDistributionService.percentile(5, 10), 20.0)
+        self.assertEqual(ScoreDistributionService.percentile(9, 10), 80.0)
+        self.assertEqual(ScoreDistributionService.percentile(0, 10), 0.0)
+        self.assertIsNone(ScoreDistributionService.percentile(5, 11))
+        self.assertEqual(RedisService.get_client().ttl(ScoreDistributionService.key(10)), -1)
+
+    def test_out_of_range_scores_are_not_recorded(self):
+        with self.assertLogs('api.services.score_distribution', level='WARNING'):
+            self.assertFalse(ScoreDistributionService.record(12, rounds=10))
+            self.assertFalse(ScoreDistributionService.record(-1, rounds=10))
+        self.assertFalse(ScoreDistributionService.record(0, rounds=0))
+        self.assertTrue(ScoreDistributionService.record(10, rounds=10))
+        CounterService.flush()
+
+        self.assertEqual(RedisService.get_client().hgetall(ScoreDistributionService.key(10)), {b'10': b'1'})
+
+    def test_cdf_is_cached_per_process(self):
+        ScoreDistributionService.record(3, rounds=10)
+        CounterService.flush()
+        self.assertEqual(ScoreDistributionService.percentile(4, 10), 100.0)
+
+        with mock.patch.object(RedisService, 'get_client') as get_client:
+            self.assertEqual(ScoreDistributionService.percentile(3, 10), 0.0)
+        get_client.assert_not_called()
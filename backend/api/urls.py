@@ -6,7 +6,9 @@ from rest_framework_simplejwt.views import (
 
 from .views import QuestionView, AnswerView, StartGameView, EndGameView, LogoutView, UserInfoView, \
     RegisterView, TerminateGameView, GlobalStatsView, CheckEmailView, GoogleLoginView, GoogleCallbackView, \
-    RequestPasswordResetView, ResetPasswordView, VersionView
+    RequestPasswordResetView, ResetPasswordView, VersionView, QuestionPoolStatsView, \
+    CounterStatsView, StatsTrendsView, BreedConfusionView, \
+    LeaderboardView
 
 
 urlpatterns = [
@@ -27,4 +29,9 @@ urlpatterns = [
     path('terminate-game/', TerminateGameView.as_view()),
     path('user/me/', UserInfoView.as_view()),
     path('global-stats/', GlobalStatsView.as_view()),
+    path('question-pool/stats/', QuestionPoolStatsView.as_view()),
+    path('counters/stats/', CounterStatsView.as_view()),
+    path('stats/trends/', StatsTrendsView.as_view()),
+    path('breeds/<slug:slug>/confusions/', BreedConfusionView.as_view()),
+    path('leaderboard/', LeaderboardView.as_view()),
 ]
\ No newline at end of file
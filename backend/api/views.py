@@ -3,7 +3,7 @@ from django.shortcuts import redirect
 from django.conf import settings
 from django.middleware.csrf import get_token
 from rest_framework.views import APIView, Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import status
 from django.db import transaction
@@ -11,16 +11,20 @@ from django.db import transaction
 from uuid import uuid4
 from datetime import datetime
 from urllib.parse import urlencode
+import logging
 import requests
 import secrets
 
 from .serializers import QuestionInputSerializer, QuestionSerializer, AnswerInputSerializer, AnswerSerializer, \
     StartGameSerializer, EndGameInputSerializer, EndGameSerializer, UserInfoSerializer, UserInputSerializer, \
-        UserSerializer, GlobalStatsSerializer, HardestBreedsSerializer
+        UserSerializer, StatsTrendsInputSerializer, LeaderboardInputSerializer
 from .services import QuestionService, RedisService, GameSessionService, GuestGameSessionService, \
-    RoundRecordService, BreedService, PlayerService
-from .models import HardestBreedStat
+    RoundRecordService, BreedService, PlayerService, QuestionPoolService, DifficultyService, GameDeckService, \
+    QuestionTokenService, RoundRecordStreamService, CounterService, GlobalStatsService, \
+    StatRollupService, BreedConfusionService, LeaderboardService, ScoreDistributionService
 from .version import VERSION_INFO
+
+logger = logging.getLogger(__name__)
     
 
 class QuestionView(APIView):
@@ -35,30 +39,45 @@ class QuestionView(APIView):
         game_session_id = data.get('game_session_id')
 
         if request.user.is_authenticated:
-            if not GameSessionService.is_session_owned_by_user(data.get('game_session_id'), request.user.id):
+            state = GameSessionService.get_state(data.get('game_session_id'))
+            if state is None or state['user_id'] != request.user.id:
                 return Response({"error": "Invalid game session"}, status=400)
-            current_round = GameSessionService.get_current_round(data.get('game_session_id'))
         else:
-            session_data = GuestGameSessionService.get_session_data(game_session_id=data.get('game_session_id'))
-            current_round = len(session_data.get('round_records', [])) + 1
-
-        question = QuestionService.generate_question()
-        choices = QuestionService.generate_random_choices(question.answer, lang=lang)
+            state = GuestGameSessionService.get_progress(game_session_id=data.get('game_session_id'))
+            if state is None:
+                return Response({"error": "Invalid or expired game session"}, status=400)
+        current_round = state['rounds'] + 1
+        # 難度以開局時的設定為準，請求中指定的優先
+        difficulty = data.get('difficulty') or state.get('difficulty')
+
+        deck_entry = GameDeckService.pop(game_session_id, lang=lang) if settings.GAME_DECK_ENABLED else None
+        if deck_entry:
+            # 牌組模式：題目、選項與作答資料都已在開局時寫好
+            question, choices = deck_entry
+        else:
+            question = QuestionService.generate_question(difficulty=difficulty)
+            choices = QuestionService.generate_random_choices(BreedService.get_breed_by_slug(question.breed_slug), lang=lang)
+        
+        if not deck_entry and not settings.QUESTION_TOKEN_ENABLED:
+            if not RedisService.exists(f"{game_session_id}_{question.id}"):
+                RedisService.set(f"{game_session_id}_{question.id}", {
+                    "correct_slug": question.breed_slug,
+                    "choices": choices,
+                    'image_url': question.image_url
+                })
+            else:
+                RedisService.set(f"{game_session_id}_{question.id}", {
+                    "choices": choices,
+                })
+        
+        token = None
+        if settings.QUESTION_TOKEN_ENABLED:
+            token = QuestionTokenService.create_token(game_session_id, question, choices, current_round)
         
         serializer = QuestionSerializer(question, context={
             'choices': choices,
-            'current_round': current_round
-            })
-        
-        if not RedisService.exists(f"{game_session_id}_{question.id}"):
-            RedisService.set(f"{game_session_id}_{question.id}", {
-                "correct_slug": question.answer.slug,
-                "choices": choices,
-                'image_url': question.image_url
-            })
-        else:
-            RedisService.set(f"{game_session_id}_{question.id}", {
-                "choices": choices,
+            'current_round': current_round,
+            'token': token
             })
         
         return Response(serializer.data)
@@ -74,10 +93,30 @@ class AnswerView(APIView):
         is_authenticated = request.user.is_authenticated
 
         if is_authenticated:
-            if not GameSessionService.is_session_owned_by_user(data.get('game_session_id'), request.user.id):
+            state = GameSessionService.get_state(data.get('game_session_id'))
+            if state is None or state['user_id'] != request.user.id:
                 return Response({"error": "Invalid game session"}, status=400)
+        else:
+            played_rounds = GuestGameSessionService.get_round_count(game_session_id=data.get('game_session_id'))
+            if played_rounds is None:
+                return Response({"error": "Invalid or expired game session"}, status=400)
         
-        cached_data = RedisService.get(f"{data.get('game_session_id')}_{data.get('question_id')}")
+        if settings.QUESTION_TOKEN_ENABLED and data.get('token'):
+            try:
+                cached_data = QuestionTokenService.read_token(
+                    data.get('token'), data.get('game_session_id'), data.get('question_id'))
+            except ValueError as e:
+                return Response({"error": str(e)}, status=400)
+            
+            # token 綁定回合數，該回合作答後同一張 token 便不能再用
+            if is_authenticated:
+                current_round = state['rounds'] + 1
+            else:
+                current_round = played_rounds + 1
+            if cached_data['round'] != current_round:
+                return Response({"error": "This round has already been answered."}, status=400)
+        else:
+            cached_data = RedisService.get(f"{data.get('game_session_id')}_{data.get('question_id')}")
         
         if cached_data:
             correct_slug = cached_data.get('correct_slug')
@@ -92,43 +131,36 @@ class AnswerView(APIView):
         else:
             return Response({"error": "Round expired, please start a new round."}, status=400)
         
-        if cached_data and 'image_url' in cached_data:
-            image_url = cached_data.get('image_url')
-        else:
-            try:
-                question = QuestionService.get_question_by_id(data.get('question_id'))
-                image_url = question.image_url if question else ''
-            except Exception:
-                image_url = ''
-
         if not is_authenticated:
-            session_data = GuestGameSessionService.get_session_data(game_session_id=data.get('game_session_id'))
-            session_data['score'] += score
-            
-            round_record = {
-                'question_id': str(data.get('question_id')),
-                'selected_slug': data.get('selected_slug'),
-                'correct_slug': correct_slug,
-                'is_correct': is_correct,
-                'score': score,
-                'choices': choices,
-                'image_url': image_url
-            }
-            
-            session_data['round_records'].append(round_record)
-
-            GuestGameSessionService.update_session_data(game_session_id=data.get('game_session_id'), data=session_data)
+            # 圖片網址與品種名稱不存進 Redis，結算時再還原
+            played_rounds = GuestGameSessionService.append_round(
+                game_session_id=data.get('game_session_id'),
+                question_id=data.get('question_id'),
+                selected_slug=data.get('selected_slug'),
+                correct_slug=correct_slug,
+                is_correct=is_correct,
+                choices=choices
+            )
+            if played_rounds is None:
+                return Response({"error": "Invalid or expired game session"}, status=400)
 
         else:
-            RoundRecordService.log_record(
+            # 延後寫入模式：只寫入 Redis Stream，由 process_round_records 批次寫入資料庫
+            record_writer = RoundRecordStreamService.enqueue if settings.ROUND_RECORD_WRITE_BEHIND else RoundRecordService.log_record
+            record_writer(
                 game_session_id=data.get('game_session_id'),
                 question_id=data.get('question_id'),
                 selected_slug=data.get('selected_slug'),
+                correct_slug=correct_slug,
                 is_correct=is_correct,
                 score=score,
                 choices=choices
             )
+            GameSessionService.record_answer(data.get('game_session_id'), is_correct=is_correct, score=score)
             
+        if not is_correct:
+            BreedConfusionService.record(correct_slug, data.get('selected_slug'))
+
         breed = BreedService.get_breed_by_slug(correct_slug)
         serializer = AnswerSerializer(
             {'breed': breed, 'correct_slug': correct_slug, 'is_correct': is_correct, 'score': score}, 
@@ -146,18 +178,32 @@ class StartGameView(APIView):
         if not isinstance(total_rounds, int) or total_rounds < 1 or total_rounds > 50:
             return Response({"error": "total_rounds must be between 1 and 50"}, status=400)
         
+        # 驗證難度模式（不指定則完全隨機出題）
+        difficulty = request.data.get('difficulty')
+        if difficulty is not None and difficulty not in DifficultyService.MODES:
+            return Response({"error": f"difficulty must be one of {', '.join(DifficultyService.MODES)}"}, status=400)
+        
         if request.user.is_authenticated:    
-            game_session = GameSessionService.create_session(user_id=request.user.id)
+            game_session = GameSessionService.create_session(user_id=request.user.id, difficulty=difficulty)
             game_session_id = game_session.id
         else:
             game_session_id = str(uuid4())
-            GuestGameSessionService.create_session(game_session_id=game_session_id)
+            GuestGameSessionService.create_session(game_session_id=game_session_id, difficulty=difficulty)
             is_guest = True
+        
+        if settings.GAME_DECK_ENABLED:
+            try:
+                questions = QuestionService.generate_questions(total_rounds, difficulty=difficulty)
+                GameDeckService.build_deck(game_session_id, questions)
+            except (requests.RequestException, ValueError):
+                # 牌組產生失敗時退回逐題出題
+                logger.warning("Failed to build game deck", exc_info=True)
 
         serializer = StartGameSerializer(
             {'game_session_id': game_session_id,
              'is_guest': is_guest,
-             'total_rounds': total_rounds}
+             'total_rounds': total_rounds,
+             'difficulty': difficulty}
             )
         
         return Response(serializer.data)
@@ -188,31 +234,55 @@ class EndGameView(APIView):
                 'ended_at': str(datetime.now()),
                 'rounds': len(round_records),
                 'round_records': round_records,
+                # 訪客的分數不計入分布，只查詢百分位
+                'percentile': ScoreDistributionService.percentile(session_data.get('score', 0), len(round_records)),
             }
             
             GuestGameSessionService.delete_session(game_session_id=data.get('game_session_id'))
+            if settings.GAME_DECK_ENABLED:
+                GameDeckService.delete_deck(data.get('game_session_id'))
 
             return Response(response_data)
         
         if not GameSessionService.is_session_owned_by_user(data.get('game_session_id'), request.user.id):
             return Response({"error": "Invalid game session or access denied"}, status=403)
         
+        # 結算前確保該局延後寫入的回合紀錄都已寫入資料庫
+        try:
+            flushed = RoundRecordStreamService.wait_for_session(data.get('game_session_id'))
+        except Exception:
+            logger.exception("結算前寫入回合紀錄失敗")
+            flushed = False
+        if not flushed:
+            return Response({"error": "Round records are still being saved, please try again."}, status=503)
+        
         try:
             game_session = GameSessionService.end_session(session_id=data.get('game_session_id'))
-            stats = GameSessionService.calculate_stats(session_id=data.get('game_session_id'))
+            stats = GameSessionService.calculate_stats(game_session)
 
-            RedisService.incr('global:count:games', stats.get('total_games', 0))
-            RedisService.incr('global:count:rounds', stats.get('total_rounds', 0))
-            RedisService.incr('global:count:correct', stats.get('total_correct', 0))
+            counters = {
+                'global:count:games': stats.get('total_games', 0),
+                'global:count:rounds': stats.get('total_rounds', 0),
+                'global:count:correct': stats.get('total_correct', 0),
+            }
             for breed, breed_stat in stats.get('breed_stats', {}).items():
-                RedisService.incr(f"breed:{breed}:attempts", breed_stat.get('attempts', 0))
-                RedisService.incr(f"breed:{breed}:correct", breed_stat.get('successes', 0))
+                counters[f"breed:{breed}:attempts"] = breed_stat.get('attempts', 0)
+                counters[f"breed:{breed}:correct"] = breed_stat.get('successes', 0)
+            CounterService.incr_many(counters)
+            StatRollupService.record_game(stats)
+            LeaderboardService.record_game(request.user.id, game_session.score, stats.get('total_rounds', 0), game_session.ended_at)
+            # 先以目前的分布算百分位，再把這局加入分布
+            percentile = ScoreDistributionService.percentile(game_session.score, stats.get('total_rounds', 0))
+            ScoreDistributionService.record(game_session.score, stats.get('total_rounds', 0))
             
         except Exception as e:
             print(e)
             return Response({"error": "Failed to end game session"}, status=500)
         
-        serializer = EndGameSerializer(game_session, context={'request': request})
+        if settings.GAME_DECK_ENABLED:
+            GameDeckService.delete_deck(data.get('game_session_id'))
+        
+        serializer = EndGameSerializer(game_session, context={'request': request, 'percentile': percentile})
         return Response(serializer.data)
     
 
@@ -225,6 +295,8 @@ class TerminateGameView(APIView):
 
         if not request.user.is_authenticated:
             GuestGameSessionService.delete_session(game_session_id=data.get('game_session_id'))
+            if settings.GAME_DECK_ENABLED:
+                GameDeckService.delete_deck(data.get('game_session_id'))
             return Response({"message": "Guest game session terminated"}, status=200)
         
         if not GameSessionService.is_session_owned_by_user(data.get('game_session_id'), request.user.id):
@@ -235,6 +307,9 @@ class TerminateGameView(APIView):
         except Exception as e:
             return Response({"error": "Failed to terminate game session"}, status=500)
         
+        if settings.GAME_DECK_ENABLED:
+            GameDeckService.delete_deck(data.get('game_session_id'))
+        
         return Response({"message": "Game session terminated"}, status=200)
 
 
@@ -304,25 +379,73 @@ class RegisterView(APIView):
     
 class GlobalStatsView(APIView):
     def get(self, request):
-        total_games = RedisService.get('global:stats:total_games') or 0
-        total_rounds = RedisService.get('global:stats:total_rounds') or 0
-        total_correct = RedisService.get('global:stats:total_correct') or 0
-        total_players = User.objects.count()
-        avg_accuracy = total_correct / total_rounds * 100 if total_rounds > 0 else 0.0
-        hardest_breeds = HardestBreedStat.objects.select_related('breed').order_by('rank')
-        hardest_stats_serializer = HardestBreedsSerializer(hardest_breeds, many=True, context={'request': request})
-        
-        data = {
-            'total_games': int(total_games),
-            'total_rounds': int(total_rounds),
-            'total_players': int(total_players),
-            'avg_accuracy': round(avg_accuracy, 2),
-            'hardest_breeds': hardest_stats_serializer.data,
+        lang = request.GET.get('lang', 'en')
+        variant = request.GET.get('variant')
+        snapshot = GlobalStatsService.get_snapshot()
+        
+        headers = {
+            'ETag': GlobalStatsService.etag(snapshot, lang, variant),
+            'Cache-Control': GlobalStatsService.cache_control(),
         }
+        if_none_match = request.headers.get('If-None-Match', '')
+        if headers['ETag'] in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        
+        return Response(GlobalStatsService.get_payload(snapshot, lang, variant), headers=headers)
+
+
+class StatsTrendsView(APIView):
+    def get(self, request):
+        serializer = StatsTrendsInputSerializer(data=request.GET)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        try:
+            trends = StatRollupService.trends(data['granularity'], data['start'], data['end'], data.get('breed'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(trends)
+
+
+class BreedConfusionView(APIView):
+    def get(self, request, slug):
+        lang = request.GET.get('lang', 'en')
+        try:
+            breed = BreedService.get_breed_by_slug(slug)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
         
-        serializer = GlobalStatsSerializer(data=data)
+        confusions = []
+        for confusion in BreedConfusionService.get_top(slug):
+            confused_with = BreedService.get_breed_by_slug(confusion['slug'])
+            confusions.append({**confusion, 'name': confused_with.name(lang)})
+        return Response({'slug': breed.slug, 'name': breed.name(lang), 'confusions': confusions})
+
+
+class LeaderboardView(APIView):
+    def get(self, request):
+        serializer = LeaderboardInputSerializer(data=request.GET)
         serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
         
+        return Response({
+            'period': data['period'],
+            'window': LeaderboardService.window(data['period'])[0],
+            'rounds': data.get('rounds'),
+            'entries': LeaderboardService.get_top(data['period'], data.get('rounds'), data['limit']),
+            'me': LeaderboardService.get_rank(request.user.id, data['period'], data.get('rounds'))
+            if request.user.is_authenticated else None,
+        })
+
+
+class QuestionPoolStatsView(APIView):
+    """題目池深度與命中統計"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        data = QuestionPoolService.stats()
+        data['low_water'] = settings.QUESTION_POOL_LOW_WATER
+        data['high_water'] = settings.QUESTION_POOL_HIGH_WATER
         return Response(data)
 
 
@@ -554,3 +677,14 @@ class VersionView(APIView):
     
     def get(self, request):
         return Response(VERSION_INFO, status=status.HTTP_200_OK)
+
+
+class CounterStatsView(APIView):
+    """本 worker 尚未寫入 Redis 的計數器累積量"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        data = CounterService.stats()
+        data['flush_interval_ms'] = settings.COUNTER_FLUSH_INTERVAL_MS
+        data['flush_max_increments'] = settings.COUNTER_FLUSH_MAX_INCREMENTS
+        return Response(data)
@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 
-from decouple import config
+from decouple import config, Choices
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -193,3 +193,68 @@ EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@pawpals.com')
+
+# Breed Catalog Settings
+# 每個 worker 最多隔幾秒檢查一次 Redis 中的品種快照版本
+BREED_CATALOG_CHECK_INTERVAL = config('BREED_CATALOG_CHECK_INTERVAL', default=5.0, cast=float)
+
+# Question Source Settings
+# dog_api: 從 dog.ceo 取題（失敗時自動改用本地題庫）；local_bank: 只從資料庫中的題目出題
+QUESTION_SOURCE = config('QUESTION_SOURCE', default='dog_api', cast=Choices(['dog_api', 'local_bank']))
+
+# Question Pool Settings
+QUESTION_POOL_ENABLED = config('QUESTION_POOL_ENABLED', default=True, cast=bool)
+QUESTION_POOL_LOW_WATER = config('QUESTION_POOL_LOW_WATER', default=50, cast=int)
+QUESTION_POOL_HIGH_WATER = config('QUESTION_POOL_HIGH_WATER', default=200, cast=int)
+QUESTION_POOL_REFILL_INTERVAL = config('QUESTION_POOL_REFILL_INTERVAL', default=10, cast=int)
+
+# Question Token Settings
+# 以簽章 token 取代每題的 Redis 作答資料，AnswerView 本地驗證即可
+QUESTION_TOKEN_ENABLED = config('QUESTION_TOKEN_ENABLED', default=False, cast=bool)
+QUESTION_TOKEN_MAX_AGE = config('QUESTION_TOKEN_MAX_AGE', default=600, cast=int)
+
+# Round Record Write-Behind Settings
+# 啟用後作答只寫入 Redis Stream，由 process_round_records 批次寫入資料庫
+ROUND_RECORD_WRITE_BEHIND = config('ROUND_RECORD_WRITE_BEHIND', default=False, cast=bool)
+ROUND_RECORD_STREAM_BATCH_SIZE = config('ROUND_RECORD_STREAM_BATCH_SIZE', default=200, cast=int)
+ROUND_RECORD_STREAM_BLOCK_MS = config('ROUND_RECORD_STREAM_BLOCK_MS', default=2000, cast=int)
+ROUND_RECORD_STREAM_CLAIM_IDLE_MS = config('ROUND_RECORD_STREAM_CLAIM_IDLE_MS', default=30000, cast=int)
+ROUND_RECORD_FLUSH_TIMEOUT = config('ROUND_RECORD_FLUSH_TIMEOUT', default=5.0, cast=float)
+
+# Counter Settings
+# 各 worker 先在記憶體累加統計計數，定時或累積一定次數後才批次寫入 Redis
+COUNTER_FLUSH_INTERVAL_MS = config('COUNTER_FLUSH_INTERVAL_MS', default=1000, cast=int)
+COUNTER_FLUSH_MAX_INCREMENTS = config('COUNTER_FLUSH_MAX_INCREMENTS', default=1000, cast=int)
+# Redis 無法寫入時最多保留的待送計數 key 數，超過就丟棄
+COUNTER_MAX_PENDING_KEYS = config('COUNTER_MAX_PENDING_KEYS', default=10000, cast=int)
+
+# Global Stats Settings
+# 全站統計回應的 Cache-Control max-age（秒），快照由定時同步任務更新
+GLOBAL_STATS_MAX_AGE = config('GLOBAL_STATS_MAX_AGE', default=60, cast=int)
+
+# Stat Rollup Settings
+# 同步任務每次往回取出幾個小時的分時段統計（超過的 hash 到期後會被 Redis 刪除）
+STATS_ROLLUP_LOOKBACK_HOURS = config('STATS_ROLLUP_LOOKBACK_HOURS', default=48, cast=int)
+
+# Breed Confusion Settings
+# 每個品種保留最常被誤認成的前幾名
+BREED_CONFUSION_TOP_N = config('BREED_CONFUSION_TOP_N', default=5, cast=int)
+
+# Score Percentile Settings
+# 各 process 快取分數累積分布的秒數，結算時的百分位最多落後這麼久
+SCORE_PERCENTILE_CACHE_SECONDS = config('SCORE_PERCENTILE_CACHE_SECONDS', default=60, cast=int)
+
+# Game Deck Settings
+# 開局時一次產生整局題目，每回合只需從 Redis 取出
+GAME_DECK_ENABLED = config('GAME_DECK_ENABLED', default=False, cast=bool)
+GAME_DECK_TTL = config('GAME_DECK_TTL', default=3600, cast=int)
+
+# Dog API Client Settings
+DOG_API_BASE_URL = config('DOG_API_BASE_URL', default='https://dog.ceo/api/')
+DOG_API_CONNECT_TIMEOUT = config('DOG_API_CONNECT_TIMEOUT', default=2.0, cast=float)
+DOG_API_READ_TIMEOUT = config('DOG_API_READ_TIMEOUT', default=3.0, cast=float)
+DOG_API_MAX_RETRIES = config('DOG_API_MAX_RETRIES', default=2, cast=int)
+DOG_API_RETRY_BACKOFF = config('DOG_API_RETRY_BACKOFF', default=0.2, cast=float)
+DOG_API_POOL_SIZE = config('DOG_API_POOL_SIZE', default=10, cast=int)
+DOG_API_BREAKER_THRESHOLD = config('DOG_API_BREAKER_THRESHOLD', default=5, cast=int)
+DOG_API_BREAKER_RESET_TIMEOUT = config('DOG_API_BREAKER_RESET_TIMEOUT', default=30.0, cast=float)
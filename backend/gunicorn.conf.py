@@ -44,3 +44,14 @@ graceful_timeout = 30
 
 # Preload 應用（可提升性能，但可能影響代碼重載）
 preload_app = False
+
+
+def worker_exit(server, worker):
+    """
+    worker 結束前把記憶體中累積的計數器寫入 Redis
+    """
+    try:
+        from api.services import CounterService
+        CounterService.flush()
+    except Exception as e:
+        server.log.error(f"worker {worker.pid} 結束時寫入計數器失敗: {e}")
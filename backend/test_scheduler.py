@@ -11,7 +11,7 @@ django.setup()
 
 from django.core.cache import cache
 from api.models import Breed
-from api.tasks import sync_breed_stats_from_redis, calculate_hardest_breeds
+from api.tasks import sync_breed_stats_from_redis, calculate_hardest_breeds, HARDEST_BREED_VARIANTS
 
 
 def test_sync_system():
@@ -54,10 +54,11 @@ def test_sync_system():
     
     # 4. 測試最難品種計算
     print("\n4️⃣  測試最難品種統計...")
-    calculate_hardest_breeds(top_n=5)
+    # 只傳入部分變體會把其他變體的排行當成已停用刪除，因此傳入完整設定
+    calculate_hardest_breeds(variants=HARDEST_BREED_VARIANTS)
     
     from api.models import HardestBreedStat
-    hardest = HardestBreedStat.objects.select_related('breed').order_by('rank')[:5]
+    hardest = HardestBreedStat.objects.filter(variant='default').select_related('breed').order_by('rank')[:5]
     
     print(f"\n   最難品種排名（前 5 名）:")
     print(f"   {'排名':<6} {'品種':<20} {'正確率':<10} {'嘗試次數':<10}")
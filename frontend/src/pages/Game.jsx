@@ -27,6 +27,7 @@ function Game() {
   const { t, i18n } = useTranslation();
 
   const [questionId, setQuestionId] = useState(null);
+  const [questionToken, setQuestionToken] = useState(null);
   const [isLoading, setIsLoading] = useState(true);
   const [currentImage, setCurrentImage] = useState(null);
   const [currentChoices, setCurrentChoices] = useState([]);
@@ -71,6 +72,7 @@ function Game() {
       setCurrentImage(question.image_url);
       setCurrentChoices(question.choices);
       setQuestionId(question.id);
+      setQuestionToken(question.token);
       setCurrentRound(question.current_round);
     } catch (error) {
       console.error(t("game.fetchQuestionFailed"), error);
@@ -87,6 +89,7 @@ function Game() {
         question_id: questionId,
         selected_slug: choice.slug,
         choices: currentChoices,
+        ...(questionToken && { token: questionToken }),
       };
       const response = await submitAnswer(answerData);
       setIsAnswerCorrect(response.is_correct);